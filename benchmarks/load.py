@@ -0,0 +1,344 @@
+"""Load test the core routes and compare against a stored baseline.
+
+Each scenario is driven by ``--concurrency`` clients, one keep-alive
+connection each, for ``--requests`` requests. By default the app is served
+in-process on a threaded Werkzeug server; pass ``--url`` to load an already
+running server (gunicorn, say) that uses the same database. Queries per
+request are read from the ``/metrics`` endpoint before and after each
+scenario.
+
+    python benchmarks/seed.py --guides 10000 --travels 1000000
+    python benchmarks/load.py --save benchmarks/baseline.json
+    python benchmarks/load.py --baseline benchmarks/baseline.json
+
+With ``--baseline`` the exit status is 1 if any scenario's p95 latency grew
+by more than ``--tolerance`` or it issues more queries per request.
+
+``--idle N`` holds N extra keep-alive connections open during the run,
+each pinging ``/health`` every few seconds, and reports how many were
+dropped; this is what the gevent worker is for:
+
+    WEB_WORKER_CLASS=gevent WEB_CONCURRENCY=2 gunicorn -c gunicorn.conf.py run:app
+    python benchmarks/load.py --url http://127.0.0.1:8000 --idle 2000
+
+(Raise ``ulimit -n`` on both sides first.)
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from travelbook import create_app, db  # noqa: E402
+from travelbook.models import Guide, Travel  # noqa: E402
+from seed import BENCH_EMAIL, BENCH_PASSWORD, sentence  # noqa: E402
+
+CSRF = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+SQL_METRIC = re.compile(
+    r'^travelbook_request_sql_queries_(sum|count)\{endpoint="([^"]+)"\} (\S+)$', re.M)
+
+
+# ----------------------------------------------------------------#
+# HTTP client
+# ----------------------------------------------------------------#
+class Client:
+    """One keep-alive connection with a cookie jar; never follows redirects."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+        self.cookies = {}
+        self.token = None
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join('{}={}'.format(k, v) for k, v in self.cookies.items())
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        self.conn.request(method, path, body, headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        for header in response.headers.get_all('Set-Cookie') or ():
+            name, _, value = header.split(';', 1)[0].partition('=')
+            self.cookies[name] = value
+        return response.status, data
+
+    def csrf_token(self, path):
+        status, data = self.request('GET', path)
+        match = CSRF.search(data.decode('utf-8', 'replace'))
+        return match.group(1) if match else ''
+
+    def login(self):
+        status, _ = self.request('POST', '/login', {'csrf_token': self.csrf_token('/login'),
+                                                    'email': BENCH_EMAIL,
+                                                    'password': BENCH_PASSWORD})
+        return status
+
+
+# ----------------------------------------------------------------#
+# Scenarios
+# ----------------------------------------------------------------#
+def scenarios(travel_ids, guide_ids, rng):
+    """``name: (endpoint, setup(client), request(client), reset(client))``.
+
+    Only ``request`` is timed; ``reset`` runs after it, untimed.
+    """
+    def get(path):
+        return lambda client: client.request('GET', path() if callable(path) else path)
+
+    def login_setup(client):
+        client.token = client.csrf_token('/login')
+
+    def login(client):
+        return client.request('POST', '/login', {'csrf_token': client.token,
+                                                 'email': BENCH_EMAIL,
+                                                 'password': BENCH_PASSWORD})
+
+    def logout(client):
+        client.request('GET', '/logout')
+
+    def create_setup(client):
+        client.login()
+        client.token = client.csrf_token('/travels/create')
+
+    def create(client):
+        return client.request('POST', '/travels/create', {
+            'csrf_token': client.token, 'title': sentence(rng, 3).title()[:40],
+            'content': sentence(rng, 100)})
+
+    return {
+        'home': ('main.home', None, get('/'), None),
+        'show_travel': ('travels.show_travel', None,
+                        get(lambda: '/travels/{}'.format(rng.choice(travel_ids))), None),
+        'popular': ('travels.popular_travels', None, get('/travels/popular'), None),
+        'all_guides': ('guides.all_guides', None, get('/guides'), None),
+        'show_guide': ('guides.show_guide', None,
+                       get(lambda: '/guides/{}'.format(rng.choice(guide_ids))), None),
+        'login': ('guides.login', login_setup, login, logout),
+        'create_travel': ('travels.create_travel', create_setup, create, None),
+    }
+
+
+def sql_queries(base_url):
+    """``{endpoint: (query_sum, request_count)}`` from /metrics."""
+    status, data = Client(base_url).request('GET', '/metrics')
+    totals = {}
+    for kind, endpoint, value in SQL_METRIC.findall(data.decode()):
+        totals.setdefault(endpoint, {})[kind] = float(value)
+    return {e: (t.get('sum', 0), t.get('count', 0)) for e, t in totals.items()}
+
+
+class IdleConnections:
+    """``n`` mostly idle keep-alive connections, pinged in turn by one thread.
+
+    Each connection sends a request every ``interval`` seconds, inside
+    gunicorn's keep-alive window; a connection the server closed in between
+    counts as dropped.
+    """
+
+    def __init__(self, base_url, n, interval=2.0):
+        self.clients = [Client(base_url) for _ in range(n)]
+        self.interval = interval
+        self.latencies, self.dropped, self.errors = [], 0, 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def ping(self, client):
+        reused = client.conn.sock is not None
+        start = time.perf_counter()
+        try:
+            status, _ = client.request('GET', '/health')
+        except (OSError, http.client.HTTPException):
+            client.conn.close()
+            status, reused = None, False
+        self.latencies.append(time.perf_counter() - start)
+        if status != 200:
+            self.errors += 1
+        return reused
+
+    def start(self):
+        for client in self.clients:
+            self.ping(client)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            for client in self.clients:
+                if self._stop.is_set():
+                    return
+                if not self.ping(client):
+                    self.dropped += 1
+            self._stop.wait(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        open_ = sum(client.conn.sock is not None for client in self.clients)
+        for client in self.clients:
+            client.conn.close()
+        self.latencies.sort()
+        return {
+            'connections': len(self.clients),
+            'open': open_,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'p95_ms': percentile(self.latencies, 95) * 1000,
+        }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(base_url, endpoint, setup, action, reset, requests, concurrency):
+    clients = [Client(base_url) for _ in range(concurrency)]
+    for client in clients:
+        if setup is not None:
+            setup(client)
+    before = sql_queries(base_url).get(endpoint, (0, 0))
+    latencies, errors, lock = [], 0, threading.Lock()
+    per_client = [requests // concurrency + (i < requests % concurrency)
+                  for i in range(concurrency)]
+
+    def drive(client, n):
+        nonlocal errors
+        for _ in range(n):
+            start = time.perf_counter()
+            try:
+                status, _ = action(client)
+            except (OSError, http.client.HTTPException):
+                status = None
+                client.conn.close()
+            elapsed = time.perf_counter() - start
+            if reset is not None and status is not None:
+                reset(client)
+            with lock:
+                latencies.append(elapsed)
+                if status is None or status >= 400:
+                    errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(drive, clients, per_client))
+    wall = time.perf_counter() - start
+    after = sql_queries(base_url).get(endpoint, (0, 0))
+    served = after[1] - before[1]
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'queries': (after[0] - before[0]) / served if served else None,
+    }
+
+
+# ----------------------------------------------------------------#
+# Baseline comparison
+# ----------------------------------------------------------------#
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            found.append('{}: p95 {:.1f}ms vs {:.1f}ms'.format(name, result['p95_ms'], base['p95_ms']))
+        if (result['queries'] is not None and base.get('queries') is not None
+                and result['queries'] > base['queries'] + 0.01):
+            found.append('{}: {:.2f} queries/request vs {:.2f}'.format(
+                name, result['queries'], base['queries']))
+    return found
+
+
+def report(results):
+    print('{:<14} {:>7} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+        'scenario', 'reqs', 'errs', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+    for name, r in results.items():
+        queries = '-' if r['queries'] is None else '{:.2f}'.format(r['queries'])
+        print('{:<14} {:>7} {:>6} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8}'.format(
+            name, r['requests'], r['errors'], r['rps'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+            queries))
+
+
+def serve(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:{}'.format(server.server_port)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='load this server instead of an in-process one')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--scenario', action='append', help='run only these (repeatable)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write results as JSON, e.g. a new baseline')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative p95 growth (default 0.2)')
+    parser.add_argument('--idle', type=int, default=0,
+                        help='idle keep-alive connections to hold during the run')
+    args = parser.parse_args()
+
+    app = create_app()
+    # Every client logs in as the same guide from one address; a remote
+    # server given with --url needs RATELIMIT_ENABLED = False as well
+    app.config['RATELIMIT_ENABLED'] = False
+    with app.app_context():
+        travel_ids = [i for i, in db.session.query(Travel.id).limit(100000)]
+        guide_ids = [i for i, in db.session.query(Guide.id).limit(100000)]
+    if not travel_ids:
+        sys.exit('No data: run benchmarks/seed.py first')
+    base_url = args.url or serve(app)
+
+    idle = IdleConnections(base_url, args.idle) if args.idle else None
+    if idle is not None:
+        idle.start()
+    results = {}
+    rng = random.Random(args.seed)
+    for name, (endpoint, setup, action, reset) in scenarios(travel_ids, guide_ids, rng).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        results[name] = run_scenario(base_url, endpoint, setup, action, reset,
+                                     args.requests, args.concurrency)
+    report(results)
+    if idle is not None:
+        held = idle.stop()
+        print('idle: {open}/{connections} open, {dropped} dropped, {errors} errors, '
+              'p95 {p95_ms:.1f}ms'.format(**held))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print('REGRESSION', line)
+        sys.exit(1 if found else 0)
@@ -0,0 +1,79 @@
+"""Seed a synthetic dataset for benchmarking.
+
+Rows go through the Guide and Travel mappers in batches of ``--batch`` with
+``bulk_insert_mappings``, so a million travels load in minutes rather than
+hours. The generator is seeded, so the same arguments always produce the
+same data. Every guide shares one password; ``bench@bench.test`` is the
+account the load test logs in with.
+
+    python benchmarks/seed.py --guides 10000 --travels 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from travelbook import create_app, db, hasher, page_cache  # noqa: E402
+from travelbook.models import Guide, Travel  # noqa: E402
+from travelbook.travels.utils import summarize  # noqa: E402
+
+BENCH_EMAIL = 'bench@bench.test'
+BENCH_PASSWORD = 'benchmark'
+WORDS = ('mountain', 'river', 'old', 'town', 'castle', 'lake', 'forest', 'coast', 'market',
+         'cathedral', 'island', 'valley', 'bridge', 'harbour', 'museum', 'trail', 'sunset',
+         'village', 'vineyard', 'desert', 'glacier', 'canyon', 'festival', 'street', 'food')
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def seed(guides=10000, travels=1000000, batch=10000, seed=1):
+    rng = random.Random(seed)
+    password = hasher.hash(BENCH_PASSWORD)
+    start = time.perf_counter()
+
+    first = (db.session.query(db.func.max(Guide.id)).scalar() or 0) + 1
+    bench_id = None if Guide.query.filter_by(email=BENCH_EMAIL).count() else first
+    for offset in range(0, guides, batch):
+        rows = []
+        for i in range(first + offset, first + min(offset + batch, guides)):
+            rows.append({'name': 'Guide{}'.format(i)[:20], 'surname': 'Bench',
+                         'phone': '+370{:08d}'.format(i), 'password': password,
+                         'email': BENCH_EMAIL if i == bench_id else 'guide{}@bench.test'.format(i),
+                         'image_file': 'default.jpg'})
+        db.session.bulk_insert_mappings(Guide, rows)
+        db.session.commit()
+    guide_ids = [i for i, in db.session.query(Guide.id).filter(Guide.id >= first)]
+    print('{} guides in {:.1f}s'.format(len(guide_ids), time.perf_counter() - start))
+
+    for offset in range(0, travels, batch):
+        rows = []
+        for _ in range(min(batch, travels - offset)):
+            content = sentence(rng, rng.randint(40, 400))
+            rows.append(dict(summarize(content), title=sentence(rng, 3).title()[:40],
+                             content=content, guide_id=rng.choice(guide_ids)))
+        db.session.bulk_insert_mappings(Travel, rows)
+        db.session.commit()
+        print('\r{} travels'.format(offset + len(rows)), end='', flush=True)
+    print(' in {:.1f}s'.format(time.perf_counter() - start))
+    page_cache.invalidate('travels', 'guides')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guides', type=int, default=10000)
+    parser.add_argument('--travels', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--create-tables', action='store_true',
+                        help='create the schema first (for a scratch SQLite database)')
+    args = parser.parse_args()
+    with create_app().app_context():
+        if args.create_tables:
+            db.create_all()
+        seed(args.guides, args.travels, args.batch, args.seed)
@@ -0,0 +1,65 @@
+"""Startup time of the app.
+
+Measures a cold ``import travelbook; create_app()`` in fresh interpreters
+(what every gunicorn worker or CLI command pays) and a warm ``create_app()``
+in an already-imported process (what each test or forked worker pays).
+
+    python benchmarks/startup.py [--runs 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COLD = '''
+import time
+start = time.perf_counter()
+from travelbook import create_app
+imported = time.perf_counter()
+create_app()
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def cold(runs):
+    imports, factories = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', COLD], cwd=ROOT, check=True,
+                             stdout=subprocess.PIPE, universal_newlines=True).stdout
+        imported, created = map(float, out.split())
+        imports.append(imported)
+        factories.append(created)
+    return imports, factories
+
+
+def warm(runs):
+    from travelbook import create_app
+    create_app()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        create_app()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    ms = sorted(t * 1000 for t in timings)
+    print('{:<24} min {:8.1f} ms   median {:8.1f} ms   max {:8.1f} ms'.format(
+        label, ms[0], statistics.median(ms), ms[-1]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    imports, factories = cold(args.runs)
+    report('import travelbook', imports)
+    report('create_app() cold', factories)
+    report('total cold', [i + f for i, f in zip(imports, factories)])
+    report('create_app() warm', warm(args.runs * 10))
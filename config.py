@@ -2,7 +2,24 @@ import os
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
-    SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI')
+    SQLALCHEMY_DATABASE_URI = (os.environ.get('SQLALCHEMY_DATABASE_URI')
+                               or 'postgresql://postgres@localhost:5432/travelbook_login')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Comma separated read replica URLs used by @read_replica routes
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('SQLALCHEMY_REPLICA_URIS', '').split(',') if uri]
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 5000))  # ms, PostgreSQL only
+    # Proxies in front of the app whose X-Forwarded-* headers are trusted. Off unless set
+    # (the Procfile sets 1 for the Heroku router): without a proxy, clients could forge them
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+    PROXY_FIX_X_PROTO = int(os.environ.get('PROXY_FIX_X_PROTO', 0))
+    # /metrics is served only to these networks (comma separated) or with this bearer token
+    METRICS_ALLOWED_NETWORKS = [n for n in os.environ.get('METRICS_ALLOWED_NETWORKS', '').split(',') if n]
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
     MAIL_SERVER = 'smtp.googlemail.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
@@ -0,0 +1,49 @@
+# Gunicorn settings: gunicorn -c gunicorn.conf.py run:app
+#
+# WEB_WORKER_CLASS picks the serving mode:
+#   gthread (default)  a few threads per worker, no extra dependencies
+#   gevent             one greenlet per connection, so thousands of mostly
+#                      idle connections (slow SMTP, uploads, DB waits) fit
+#                      in a handful of workers; needs gevent and psycogreen
+#   sync               one request per worker at a time
+import importlib.util
+import multiprocessing
+import os
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before the app is imported (preload_app below) so every lock,
+    # socket and thread the app creates is cooperative, and let psycopg2
+    # wait on the gevent hub instead of blocking the whole worker
+    from gevent import monkey
+    monkey.patch_all()
+    if importlib.util.find_spec('psycopg2') is not None:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+bind = os.environ.get('BIND', '0.0.0.0:' + os.environ.get('PORT', '8000'))
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+# An idle keep-alive connection costs a greenlet, not a thread, so gevent
+# workers can afford to keep them for much longer
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 75 if worker_class == 'gevent' else 5))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = 30
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# Import the app once in the master; workers fork with it in place. The
+# secret key comes from the environment or instance/secret_key, so every
+# worker signs sessions with the same key.
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with children
+    from travelbook import db
+    app = worker.app.wsgi()
+    with app.app_context():
+        for _, engine in db.engines(app):
+            engine.dispose()
@@ -1,13 +1,125 @@
+import os
+import sys
+from contextlib import closing
+from flask import current_app
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
-from travelbook import app
-from travelbook import db
+from travelbook import create_app
+from travelbook import db, media
+from travelbook.models import Guide
+from travelbook.travels.utils import backfill_excerpts as fill_excerpts
+from travelbook.transfer import TABLES, export_table, import_table
+from travelbook.explain import check_plans
+from travelbook.guides.purge import purge_deleted_guides
+from travelbook.assets import compress_assets
+from travelbook.guides.images import (DEFAULT_PICTURE, collect_orphans, content_key,
+                                      render_variants, set_picture, variants_exist)
+from travelbook.storage import UploadTooLarge, spool_upload
 
-migrate = Migrate(app, db)
-manager = Manager(app)
+# Alembic is only loaded here, not by the web workers
+migrate = Migrate(db=db)
+
+
+def make_app():
+	app = create_app()
+	migrate.init_app(app, db)
+	return app
+
+
+manager = Manager(make_app)
 
 manager.add_command('db', MigrateCommand)
 
+
+@manager.command
+def process_pictures():
+	"""Render size/format variants for pictures uploaded before the image pipeline"""
+	storage = media.backend
+	guides = Guide.query.filter(Guide.image_key.is_(None),
+								Guide.image_file != DEFAULT_PICTURE).all()
+	for guide in guides:
+		try:
+			with closing(storage.open(guide.image_file)) as f:
+				source, digest, _ = spool_upload(f, current_app.config['UPLOAD_MAX_SIZE'])
+		except (FileNotFoundError, UploadTooLarge):
+			continue
+		key = content_key(digest)
+		try:
+			if not variants_exist(storage, key):
+				render_variants(source, storage, key)
+		finally:
+			os.remove(source)
+		set_picture(guide, key)
+	db.session.commit()
+	print('Processed {} pictures'.format(len(guides)))
+
+
+@manager.command
+def collect_pictures(grace=3600):
+	"""Delete stored pictures no guide shows any more, keeping files newer than grace seconds"""
+	removed = collect_orphans(media.backend, int(grace))
+	print('Removed {} files'.format(len(removed)))
+
+
+@manager.command
+def compress_static():
+	"""Precompress static files so /assets can serve gzip/brotli without work per request"""
+	for path in compress_assets(current_app.static_folder):
+		print(path)
+
+
+@manager.command
+def backfill_excerpts(batch=1000, force=False):
+	"""Fill travel excerpt/word_count/reading_time, walking the table by id in batches"""
+	def progress(done):
+		print('\r{} travels'.format(done), end='', flush=True)
+	done = fill_excerpts(int(batch), force, progress)
+	print('\rBackfilled {} travels'.format(done))
+
+
+# Flask-Script collects options bottom-up, so positionals are listed last
+@manager.option('-r', '--resume', action='store_true', help='continue from the last checkpoint')
+@manager.option('-b', '--batch', type=int, default=1000)
+@manager.option('-f', '--format', dest='fmt', choices=('csv', 'ndjson'), default=None)
+@manager.option('path', help='output file; .csv for CSV, anything else for NDJSON')
+@manager.option('table', choices=list(TABLES), help=', '.join(TABLES))
+def export_data(table, path, fmt, batch, resume):
+	"""Stream a table to CSV/NDJSON in key order with resumable checkpoints"""
+	print('Exported {} {}'.format(export_table(table, path, fmt, batch, resume), table))
+
+
+@manager.option('-r', '--resume', action='store_true', help='continue from the last checkpoint')
+@manager.option('-b', '--batch', type=int, default=1000)
+@manager.option('-f', '--format', dest='fmt', choices=('csv', 'ndjson'), default=None)
+@manager.option('path', help='file written by export_data')
+@manager.option('table', choices=list(TABLES), help='one of {} (import in that order)'.format(', '.join(TABLES)))
+def import_data(table, path, fmt, batch, resume):
+	"""Insert a CSV/NDJSON export in batched executemany calls with resumable checkpoints"""
+	print('Imported {} {}'.format(import_table(table, path, fmt, batch, resume), table))
+
+
+@manager.command
+def explain_queries(threshold=1000):
+	"""EXPLAIN every query the routes issue; fail on sequential scans of large tables"""
+	failed = 0
+	for label, statement, plan, scans in check_plans(current_app, int(threshold)):
+		print('{} {}\n    {}\n    {}'.format('FAIL' if scans else 'ok  ', label, statement[:160], plan))
+		if scans:
+			print('    sequential scan of ' + ', '.join(scans))
+			failed += 1
+	if failed:
+		print('{} queries scan tables above {} rows'.format(failed, threshold))
+		sys.exit(1)
+
+
+
+@manager.command
+def purge_guides(batch=500):
+	"""Finish purging soft-deleted guides, e.g. after a worker restarted mid-purge"""
+	ids = purge_deleted_guides(int(batch))
+	print('Purged {} guides'.format(len(ids)))
+
+
 if __name__ == '__main__':
 	manager.run()
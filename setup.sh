@@ -2,3 +2,7 @@ export EMAIL_USER=''
 export EMAIL_PASS=''
 export SECRET_KEY=''
 export SQLALCHEMY_DATABASE_URI=''
+export SQLALCHEMY_REPLICA_URIS=''
+export DB_POOL_SIZE='5'
+export DB_STATEMENT_TIMEOUT='5000'
+export WEB_WORKER_CLASS='gthread'
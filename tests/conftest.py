@@ -0,0 +1,61 @@
+import pytest
+from config import Config
+from travelbook import create_app, db, hasher
+from travelbook.models import Guide
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test'
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+    PROXY_FIX_X_FOR = 0
+    PROXY_FIX_X_PROTO = 0
+    SQLALCHEMY_REPLICA_URIS = []
+    PAGE_CACHE_BACKEND = 'fake'
+    MEDIA_STORAGE = 'memory'
+    UPLOAD_MAX_SIZE = 200 * 1024
+    HASHER_POOL = 'inline'
+    # The test client connects from 127.0.0.1
+    METRICS_ALLOWED_NETWORKS = ['127.0.0.0/8']
+    BCRYPT_LOG_ROUNDS = 4
+    # Views are flushed and ranked by the tests themselves
+    VIEW_FLUSH_INTERVAL = 0
+
+
+@pytest.fixture
+def app(tmp_path):
+    class AppConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(tmp_path / 'travelbook.db')
+        MAIL_SPOOL_DIR = str(tmp_path / 'mail_spool')
+
+    app = create_app(AppConfig)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.get_engine().dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def guide(app):
+    """A guide who can log in with ``a@x.com`` / ``pw``; returns their id."""
+    with app.app_context():
+        guide = Guide(name='Ann', surname='Smith', phone='123456789', email='a@x.com',
+                      password=hasher.hash('pw'))
+        guide.insert()
+        return guide.id
+
+
+@pytest.fixture
+def logged_in(client, guide):
+    """``client`` with ``guide`` logged in."""
+    response = client.post('/login', data={'email': 'a@x.com', 'password': 'pw'})
+    assert response.status_code == 302
+    return client
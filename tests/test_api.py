@@ -0,0 +1,133 @@
+import pytest
+from travelbook import hasher
+from travelbook.models import Guide, Travel
+
+
+def token_for(client, email='a@x.com', password='pw'):
+    response = client.post('/api/v1/tokens', json={'email': email, 'password': password})
+    assert response.status_code == 201
+    return response.get_json()['token']
+
+
+@pytest.fixture
+def auth(client, guide):
+    """Headers carrying a bearer token for ``guide``."""
+    return {'Authorization': 'Bearer ' + token_for(client)}
+
+
+@pytest.fixture
+def other(app):
+    """A second guide with one travel; returns the travel's id."""
+    with app.app_context():
+        author = Guide(name='Bob', surname='Jones', phone='123456789', email='b@x.com',
+                       password=hasher.hash('pw'))
+        author.insert()
+        travel = Travel(title='Not yours', content='Content', guide=author)
+        travel.insert()
+        return travel.id
+
+
+def titles(app):
+    with app.app_context():
+        return sorted(t.title for t in Travel.query)
+
+
+# ----------------------------------------------------------------#
+# Auth
+# ----------------------------------------------------------------#
+def test_writes_need_a_login(client):
+    response = client.post('/api/v1/travels', json={'title': 'Trakai', 'content': 'Castle'})
+    assert response.status_code == 401 and response.get_json()['error'] == 'Login required'
+
+
+def test_bearer_token_authenticates_without_a_session(app, client, auth):
+    response = client.post('/api/v1/travels', json={'title': 'Trakai', 'content': 'Castle'},
+                           headers=auth)
+    assert response.status_code == 201 and 'Set-Cookie' not in response.headers
+    assert titles(app) == ['Trakai']
+
+
+def test_bad_credentials_and_tokens_are_refused(app, client, guide):
+    response = client.post('/api/v1/tokens', json={'email': 'a@x.com', 'password': 'nope'})
+    assert response.status_code == 401
+    with app.app_context():
+        reset_token = Guide.query.get(guide).get_reset_token()
+    for token in ('garbage', reset_token):
+        response = client.post('/api/v1/travels', json={'title': 'Trakai', 'content': 'Castle'},
+                               headers={'Authorization': 'Bearer ' + token})
+        assert response.status_code == 401
+        assert response.get_json()['error'] == 'Invalid or expired token'
+
+
+def test_session_login_still_works(logged_in):
+    response = logged_in.post('/api/v1/travels', json={'title': 'Trakai', 'content': 'Castle'})
+    assert response.status_code == 201
+
+
+# ----------------------------------------------------------------#
+# Reading
+# ----------------------------------------------------------------#
+def test_cursor_pagination_visits_every_travel(app, client, guide):
+    with app.app_context():
+        ann = Guide.query.get(guide)
+        for i in range(5):
+            Travel(title='Trip {}'.format(i), content='Content', guide=ann).insert()
+    seen, after = [], ''
+    while after is not None:
+        page = client.get('/api/v1/travels?limit=2&fields=title&after=' + after).get_json()
+        assert len(page['items']) <= 2 and all(set(item) == {'title'} for item in page['items'])
+        seen += [item['title'] for item in page['items']]
+        after = page['next_cursor']
+    assert sorted(seen) == ['Trip {}'.format(i) for i in range(5)]
+    assert client.get('/api/v1/travels?after=nonsense').status_code == 400
+    assert client.get('/api/v1/travels?fields=password').status_code == 400
+
+
+def test_etags_are_weak_and_conditional(client, guide):
+    response = client.get('/api/v1/guides/{}'.format(guide))
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    again = client.get('/api/v1/guides/{}'.format(guide), headers={'If-None-Match': etag})
+    assert again.status_code == 304
+
+
+# ----------------------------------------------------------------#
+# Bulk
+# ----------------------------------------------------------------#
+def test_bulk_create_returns_the_new_ids(app, client, auth):
+    items = [{'title': 'Trip {}'.format(i), 'content': 'word ' * 10} for i in range(3)]
+    response = client.post('/api/v1/travels/bulk', json=items, headers=auth)
+    body = response.get_json()
+    assert response.status_code == 201 and body['created'] == 3
+    with app.app_context():
+        assert [Travel.query.get(i).title for i in body['ids']] == ['Trip 0', 'Trip 1', 'Trip 2']
+        assert Travel.query.get(body['ids'][0]).word_count == 10
+
+
+def test_bulk_update_changes_only_own_travels(app, client, auth, other):
+    ids = client.post('/api/v1/travels/bulk', json=[{'title': 'Mine', 'content': 'Content'}],
+                      headers=auth).get_json()['ids']
+    changes = [{'id': ids[0], 'title': 'Still mine'}, {'id': other, 'title': 'Stolen'}]
+    response = client.patch('/api/v1/travels/bulk', json=changes, headers=auth)
+    assert response.get_json() == {'updated': 1}
+    assert titles(app) == ['Not yours', 'Still mine']
+
+
+def test_bulk_delete_removes_only_own_travels(app, client, auth, other):
+    ids = client.post('/api/v1/travels/bulk', json=[{'title': 'Mine', 'content': 'Content'}],
+                      headers=auth).get_json()['ids']
+    response = client.delete('/api/v1/travels/bulk', json={'ids': ids + [other]}, headers=auth)
+    assert response.get_json() == {'deleted': 1}
+    assert titles(app) == ['Not yours']
+
+
+def test_bulk_requests_are_validated(client, auth):
+    assert client.post('/api/v1/travels/bulk', json=[], headers=auth).status_code == 400
+    assert client.post('/api/v1/travels/bulk', json=[{'title': 'x'}], headers=auth).status_code == 400
+    # JSON true is not travel 1
+    assert client.delete('/api/v1/travels/bulk', json={'ids': [True]},
+                         headers=auth).status_code == 400
+    assert client.patch('/api/v1/travels/bulk', json=[{'id': True, 'title': 'x'}],
+                        headers=auth).status_code == 400
+    too_many = [{'title': 'x', 'content': 'y'}] * 1001
+    assert client.post('/api/v1/travels/bulk', json=too_many, headers=auth).status_code == 413
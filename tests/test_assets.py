@@ -0,0 +1,59 @@
+import gzip
+import os
+import re
+import pytest
+from travelbook import assets
+from travelbook.assets import compress_assets
+
+CSS = b'body { margin: 0; }\n' * 200
+
+
+@pytest.fixture
+def static(app, tmp_path):
+    folder = tmp_path / 'static'
+    folder.mkdir()
+    (folder / 'main.css').write_bytes(CSS)
+    app.static_folder = str(folder)
+    return folder
+
+
+def asset_url(app, filename):
+    with app.test_request_context():
+        return assets.url(filename)
+
+
+def test_urls_carry_the_content_digest(app, static):
+    url = asset_url(app, 'main.css')
+    assert re.fullmatch(r'/assets/main\.[0-9a-f]{12}\.css', url)
+    (static / 'main.css').write_bytes(CSS + b'p {}\n')
+    os.utime(str(static / 'main.css'), ns=(1, 1))
+    assert asset_url(app, 'main.css') != url
+    assert asset_url(app, 'missing.css') == '/static/missing.css'
+
+
+def test_current_urls_are_cached_forever(app, client, static):
+    url = asset_url(app, 'main.css')
+    response = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200 and response.data == CSS
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    stale = client.get('/assets/main.000000000000.css')
+    assert stale.status_code == 200 and stale.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/assets/main.css').status_code == 404
+    assert client.get('/assets/gone.000000000000.css').status_code == 404
+
+
+def test_precompressed_variants_are_served(app, client, static):
+    (static / 'tiny.txt').write_bytes(b'x')
+    written = compress_assets(str(static))
+    assert str(static / 'main.css.gz') in written
+    assert not (static / 'tiny.txt.gz').exists()
+    url = asset_url(app, 'main.css')
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == CSS
+    assert client.get(url, headers={'Accept-Encoding': 'identity'}).data == CSS
+    # A variant older than its source is ignored
+    os.utime(str(static / 'main.css.gz'), ns=(1, 1))
+    assert 'Content-Encoding' not in client.get(url, headers={'Accept-Encoding': 'gzip'}).headers
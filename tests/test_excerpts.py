@@ -0,0 +1,49 @@
+from travelbook import db
+from travelbook.models import Guide, Travel
+from travelbook.travels.utils import EXCERPT_LENGTH, backfill_excerpts, summarize
+
+LONG = ' '.join('word{}'.format(i) for i in range(400))
+
+
+def test_summarize_cuts_at_a_word():
+    summary = summarize(LONG)
+    assert summary['excerpt'].endswith('…') and len(summary['excerpt']) <= EXCERPT_LENGTH + 1
+    assert LONG.startswith(summary['excerpt'][:-1])
+    assert summary['word_count'] == 400 and summary['reading_time'] == 2
+    assert summarize('  Short\n trip ') == {'excerpt': 'Short trip', 'word_count': 2,
+                                            'reading_time': 1}
+
+
+def test_summaries_follow_content(app, guide):
+    with app.app_context():
+        travel = Travel(title='Trakai', content='Castle', guide=Guide.query.get(guide))
+        travel.insert()
+        assert travel.excerpt == 'Castle' and travel.word_count == 1
+        travel.content = 'Castle on a lake'
+        travel.update()
+        assert travel.excerpt == 'Castle on a lake' and travel.word_count == 4
+
+
+def test_feed_shows_excerpts_not_content(app, client, guide):
+    with app.app_context():
+        Travel(title='Trakai', content=LONG, guide=Guide.query.get(guide)).insert()
+    page = client.get('/').data.decode()
+    assert 'word0 word1' in page and 'word399' not in page
+
+
+def test_backfill_fills_missing_excerpts_in_batches(app, guide):
+    with app.app_context():
+        ann = Guide.query.get(guide)
+        for i in range(5):
+            Travel(title='Trip {}'.format(i), content='Content number {}'.format(i), guide=ann).insert()
+        db.session.execute(Travel.__table__.update().values(excerpt=None, word_count=None,
+                                                            reading_time=None))
+        db.session.commit()
+        totals = []
+        assert backfill_excerpts(batch=2, progress=totals.append) == 5
+        assert totals == [2, 4, 5]
+        assert [(t.excerpt, t.word_count) for t in Travel.query.order_by(Travel.id)] == \
+            [('Content number {}'.format(i), 3) for i in range(5)]
+        # Nothing left to fill unless forced
+        assert backfill_excerpts(batch=2) == 0
+        assert backfill_excerpts(batch=2, force=True) == 5
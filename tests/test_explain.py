@@ -0,0 +1,35 @@
+from travelbook import db
+from travelbook.explain import check_plans, route_queries
+from travelbook.models import Guide, Tag, Travel
+
+
+def seed(app, guide):
+    with app.app_context():
+        ann = Guide.query.get(guide)
+        lakes, castles = Tag(name='lakes'), Tag(name='castles')
+        for i in range(4):
+            Travel(title='Trip {}'.format(i), content='Old town', guide=ann,
+                   tags=[lakes, castles] if i % 2 else [lakes]).insert()
+
+
+def test_route_queries_cover_later_pages_and_the_purge(app, guide):
+    seed(app, guide)
+    with app.app_context():
+        queries = route_queries(app)
+        labels = {label for label, _, _ in queries}
+        for page in ('/?after=', '/guides?after=', '/my_travels?after='):
+            assert any(label.startswith(page) for label in labels)
+        assert any('match=any' in label for label in labels)
+        purge = [statement.split()[0] for label, statement, _ in queries
+                 if label == 'delete_guide purge']
+        assert {'SELECT', 'UPDATE', 'DELETE'} <= set(purge)
+        # The purge was only rehearsed
+        assert Travel.query.count() == 4 and Guide.query.get(guide) is not None
+        assert dict(db.session.query(Tag.name, Tag.travel_count)) == {'lakes': 4, 'castles': 2}
+
+
+def test_every_plan_can_be_explained(app, guide):
+    seed(app, guide)
+    with app.app_context():
+        plans = list(check_plans(app, threshold=1000))
+    assert plans and all(scans == [] for _, _, _, scans in plans)
@@ -0,0 +1,53 @@
+import re
+from travelbook.models import Guide, Travel
+from travelbook.queries import guide_summaries
+
+
+def add_guides(app, count):
+    with app.app_context():
+        ids = []
+        for n in range(count):
+            guide = Guide(name='Guide{}'.format(n), surname='Other', phone='123456789',
+                          email='g{}@x.com'.format(n), password='x')
+            guide.insert()
+            ids.append(guide.id)
+        return ids
+
+
+def test_summaries_count_and_name_the_latest_travel(app, guide):
+    idle, = add_guides(app, 1)
+    with app.app_context():
+        ann = Guide.query.get(guide)
+        first = Travel(title='Vilnius', content='Content', guide=ann)
+        first.insert()
+        latest = Travel(title='Trakai', content='Content', guide=ann)
+        latest.insert()
+        assert guide_summaries([guide, idle]) == {guide: (2, latest.id, 'Trakai')}
+        assert guide_summaries([]) == {}
+
+
+def test_directory_shows_each_guides_summary(app, client, guide):
+    with app.app_context():
+        Travel(title='Trakai', content='Content', guide=Guide.query.get(guide)).insert()
+    page = client.get('/guides').data.decode()
+    assert 'Ann Smith' in page and '1 travel<' in page
+    assert 'Latest: <a href="/travels/' in page and '>Trakai</a>' in page
+
+
+def test_directory_pages_through_active_guides(app, client):
+    ids = add_guides(app, 14)
+    with app.app_context():
+        Guide.query.get(ids[0]).delete()
+    seen, path = [], '/guides'
+    while path:
+        page = client.get(path).data.decode()
+        shown = [int(i) for i in re.findall(r'<a href="/guides/(\d+)">', page)]
+        assert 0 < len(shown) <= 12
+        seen += shown
+        older = re.search(r'href="(/guides\?after=[^"]+)">Older', page)
+        path = older and older.group(1).replace('&amp;', '&')
+    assert sorted(seen) == ids[1:]
+
+
+def test_unknown_cursor_is_not_found(client):
+    assert client.get('/guides?after=nonsense').status_code == 404
@@ -0,0 +1,36 @@
+from flask import g
+from travelbook.models import Guide, identity_cache, load_user
+
+
+def test_identity_is_loaded_once(app, guide):
+    with app.test_request_context():
+        assert load_user(str(guide)).name == 'Ann'
+        assert load_user(str(guide)).email == 'a@x.com'
+        assert g.identity_queries == 1
+        assert 'password' not in identity_cache().get(guide)
+
+
+def test_update_drops_the_cached_identity(app, guide):
+    with app.test_request_context():
+        load_user(guide)
+        ann = Guide.query.get(guide)
+        ann.name = 'Anna'
+        ann.update()
+        assert identity_cache().get(guide) is None
+        assert load_user(guide).name == 'Anna'
+        assert g.identity_queries == 2
+
+
+def test_deleted_guides_are_logged_out(app, guide):
+    with app.test_request_context():
+        load_user(guide)
+        Guide.query.get(guide).delete()
+        assert load_user(guide) is None
+
+
+def test_requests_reuse_the_cached_identity(app, logged_in, guide):
+    with app.app_context():
+        identity_cache().clear()
+    assert logged_in.get('/account').status_code == 200
+    with app.app_context():
+        assert identity_cache().get(guide)['email'] == 'a@x.com'
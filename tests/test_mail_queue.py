@@ -0,0 +1,174 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import pytest
+from flask_mail import Message
+from travelbook import mail_dispatcher
+
+pytest.importorskip('aiosmtpd')
+from aiosmtpd.controller import Controller  # noqa: E402
+
+
+class Sink:
+    """SMTP handler that keeps what it is sent, refusing the first ``refuse`` messages."""
+
+    def __init__(self):
+        self.messages = []
+        self.refuse = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.refuse:
+            self.refuse -= 1
+            return '451 Try again later'
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def message(n=0):
+    return Message('Trip {}'.format(n), sender='noreply@travelbook.test',
+                   recipients=['a@x.com'], body='Hello')
+
+
+@pytest.fixture
+def sink(app):
+    handler = Sink()
+    port = free_port()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    # Flask-Mail sends nothing in TESTING mode unless told to
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False,
+                      MAIL_USERNAME=None, MAIL_PASSWORD=None, MAIL_SUPPRESS_SEND=False,
+                      MAIL_QUEUE_BACKOFF=0.05)
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+def spool(app):
+    def files():
+        return sorted(os.listdir(app.config['MAIL_SPOOL_DIR']))
+    return files
+
+
+def test_messages_are_delivered(app, sink, spool):
+    with app.app_context():
+        for n in range(3):
+            mail_dispatcher.send(message(n))
+        assert mail_dispatcher.join(timeout=10)
+        stats = mail_dispatcher.stats()
+    assert sorted(m.content.decode().split('Subject: ')[1].split('\r\n')[0]
+                  for m in sink.messages) == ['Trip 0', 'Trip 1', 'Trip 2']
+    assert stats['sent'] == 3 and stats['queue_depth'] == 0 and stats['spooled'] == 0
+    assert spool() == []
+
+
+def test_failed_delivery_is_retried(app, sink, spool):
+    sink.refuse = 2
+    with app.app_context():
+        mail_dispatcher.send(message())
+        # Waits out both retries
+        assert mail_dispatcher.join(timeout=10)
+        stats = mail_dispatcher.stats()
+    assert len(sink.messages) == 1
+    assert stats['retried'] == 2 and stats['sent'] == 1
+    assert spool() == []
+
+
+def test_delivery_is_given_up(app, sink, spool):
+    sink.refuse = 10
+    app.config['MAIL_QUEUE_RETRIES'] = 1
+    with app.app_context():
+        mail_dispatcher.send(message())
+        assert mail_dispatcher.join(timeout=10)
+        stats = mail_dispatcher.stats()
+    assert sink.messages == []
+    assert stats['failed'] == 1 and stats['retried'] == 1
+    assert [name.rsplit('.', 1)[1] for name in spool()] == ['failed']
+
+
+def test_join_can_cancel_retries(app, sink, spool):
+    sink.refuse = 1
+    app.config['MAIL_QUEUE_BACKOFF'] = 60
+    with app.app_context():
+        mail_dispatcher.send(message())
+        wait_for(lambda: mail_dispatcher.stats()['retried'] == 1)
+        assert not mail_dispatcher.join(timeout=0.1)
+        assert mail_dispatcher.join(timeout=1, cancel_retries=True)
+    # Back in the spool, unclaimed and with the failed attempt recorded
+    name, = spool()
+    assert name.endswith('.json')
+    with open(os.path.join(app.config['MAIL_SPOOL_DIR'], name)) as f:
+        assert json.load(f)['attempts'] == 1
+    assert sink.messages == []
+
+
+def test_messages_claimed_by_dead_workers_are_sent(app, sink, spool):
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    os.makedirs(app.config['MAIL_SPOOL_DIR'])
+    payload = {'subject': 'Left behind', 'sender': 'noreply@travelbook.test',
+               'recipients': ['a@x.com'], 'body': 'Hello', 'html': None,
+               'enqueued_at': time.time(), 'attempts': 0}
+    claimed = os.path.join(app.config['MAIL_SPOOL_DIR'], '1-a.json.{}'.format(dead.pid))
+    with open(claimed, 'w') as f:
+        json.dump(payload, f)
+    with app.app_context():
+        mail_dispatcher.queue.ensure_started()
+    wait_for(lambda: len(sink.messages) == 1)
+    wait_for(lambda: spool() == [])
+
+
+def test_delivery_latency_is_exported(app, client, sink):
+    with app.app_context():
+        mail_dispatcher.send(message())
+        assert mail_dispatcher.join(timeout=10)
+    metrics = client.get('/metrics').data.decode()
+    assert 'travelbook_mail_sent_total 1' in metrics
+    assert 'travelbook_mail_delivery_seconds_count 1' in metrics
+    assert 'travelbook_mail_delivery_seconds_bucket{le="+Inf"} 1' in metrics
+
+
+def test_unreadable_spool_files_are_set_aside(app, sink, spool):
+    os.makedirs(app.config['MAIL_SPOOL_DIR'])
+    for name, content in (('1-a.json', '{"subject": "Cut sh'), ('2-b.json', '[1, 2]')):
+        with open(os.path.join(app.config['MAIL_SPOOL_DIR'], name), 'w') as f:
+            f.write(content)
+    with app.app_context():
+        mail_dispatcher.send(message())
+        assert mail_dispatcher.join(timeout=10)
+    wait_for(lambda: spool() == ['1-a.failed', '2-b.failed'])
+    assert len(sink.messages) == 1
+
+
+def test_dispatcher_survives_errors(app, sink, monkeypatch):
+    mail_queue = app.extensions['mail_dispatcher']
+    recover = mail_queue._recover
+    calls = []
+
+    def flaky_recover():
+        calls.append(1)
+        if len(calls) == 1:
+            raise PermissionError('spool not readable')
+        recover()
+
+    monkeypatch.setattr(mail_queue, '_recover', flaky_recover)
+    with app.app_context():
+        mail_dispatcher.send(message())
+        assert mail_dispatcher.join(timeout=10)
+    assert len(sink.messages) == 1 and len(calls) >= 2
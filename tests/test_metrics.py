@@ -0,0 +1,58 @@
+from travelbook import create_app
+from tests.conftest import TestingConfig
+
+OUTSIDE = {'REMOTE_ADDR': '203.0.113.5'}
+
+
+def scrape(client, **kwargs):
+    response = client.get('/metrics', **kwargs)
+    assert response.status_code == 200
+    return response.data.decode()
+
+
+def test_requests_are_exported(client, guide):
+    assert client.get('/guides/{}'.format(guide)).data
+    client.get('/nowhere')
+    metrics = scrape(client)
+    assert ('travelbook_requests_total{endpoint="guides.show_guide",method="GET",status="200"} 1'
+            in metrics)
+    assert 'travelbook_requests_total{endpoint="unmatched",method="GET",status="404"} 1' in metrics
+    assert 'travelbook_request_sql_queries_count{endpoint="guides.show_guide"} 1' in metrics
+    assert 'travelbook_template_render_seconds_count{template="show_guide.html"} 1' in metrics
+    assert '# TYPE travelbook_request_duration_seconds histogram' in metrics
+
+
+def test_streamed_head_requests_are_recorded(client):
+    assert client.head('/guides').status_code == 200
+    assert ('travelbook_requests_total{endpoint="guides.all_guides",method="HEAD",status="200"} 1'
+            in scrape(client))
+
+
+def test_metrics_are_private(app, client):
+    assert client.get('/metrics', environ_base=OUTSIDE).status_code == 404
+    app.config['METRICS_TOKEN'] = 'scrape-me'
+    assert client.get('/metrics', environ_base=OUTSIDE,
+                      headers={'Authorization': 'Bearer wrong'}).status_code == 404
+    scrape(client, environ_base=OUTSIDE, headers={'Authorization': 'Bearer scrape-me'})
+
+
+def test_rate_limit_rejections_are_exported(app, client):
+    app.config['RATELIMIT_ENABLED'] = True
+    for _ in range(6):
+        response = client.post('/login', data={'email': 'a@x.com', 'password': 'nope'})
+    assert response.status_code == 429
+    assert 'travelbook_rate_limited_total{scope="login_email"} 1' in scrape(client)
+
+
+def test_each_app_has_its_own_metrics(app, client, tmp_path):
+    class OtherConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(tmp_path / 'other.db')
+
+    other = create_app(OtherConfig)
+    app.config['RATELIMIT_ENABLED'] = True
+    for _ in range(6):
+        client.post('/login', data={'email': 'a@x.com', 'password': 'nope'})
+    client.get('/nowhere')
+    metrics = scrape(other.test_client())
+    assert 'endpoint="unmatched"' not in metrics
+    assert 'scope="login_email"' not in metrics
@@ -0,0 +1,53 @@
+import travelbook.cache as cache_module
+from travelbook import create_app
+from travelbook.cache import LRUCache
+from travelbook.models import Guide, Travel
+from tests.conftest import TestingConfig
+
+
+def get(client, path):
+    """Fetch ``path``, reading streamed bodies in full; returns (X-Cache, body)."""
+    response = client.get(path)
+    return response.headers.get('X-Cache'), response.data
+
+
+def test_anonymous_pages_are_served_from_cache(client, guide):
+    path = '/guides/{}'.format(guide)
+    first, second = get(client, path), get(client, path)
+    assert first[0] == 'MISS' and second[0] == 'HIT'
+    assert first[1] == second[1]
+
+
+def test_logged_in_guides_are_not_cached(logged_in):
+    assert get(logged_in, '/')[0] is None
+    assert get(logged_in, '/')[0] is None
+
+
+def test_writes_invalidate_cached_pages(app, client, guide):
+    assert get(client, '/')[0] == 'MISS'
+    assert get(client, '/')[0] == 'HIT'
+    with app.app_context():
+        Travel(title='Trakai', content='Castle', guide=Guide.query.get(guide)).insert()
+    status, body = get(client, '/')
+    assert status == 'MISS' and b'Trakai' in body
+
+
+def test_local_backend_keeps_pages_briefly(tmp_path):
+    class LocalConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(tmp_path / 'travelbook.db')
+        PAGE_CACHE_BACKEND = 'local'
+        PAGE_CACHE_TIMEOUT = 600
+
+    backend = create_app(LocalConfig).extensions['page_cache']
+    assert backend.default_timeout == backend.max_timeout == 5
+
+
+def test_max_timeout_caps_explicit_timeouts(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+    cache = LRUCache(default_timeout=5, max_timeout=5)
+    cache.set('page', b'body', timeout=600)
+    now[0] += 4
+    assert cache.get('page') == b'body'
+    now[0] += 2
+    assert cache.get('page') is None
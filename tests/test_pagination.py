@@ -0,0 +1,88 @@
+import pytest
+from travelbook import db
+from travelbook.models import Guide, Travel
+from travelbook.pagination import (cached_count, decode_cursor, encode_cursor, forget_count,
+                                   paginate_keyset)
+
+
+@pytest.fixture
+def travels(app, guide):
+    with app.app_context():
+        author = Guide.query.get(guide)
+        for i in range(7):
+            Travel(title='Trip {}'.format(i), content='Content {}'.format(i), guide=author).insert()
+        return [travel_id for travel_id, in db.session.query(Travel.id).order_by(Travel.id)]
+
+
+def ids(page):
+    return [travel.id for travel in page.items]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor([42])) == [42]
+    for cursor in ('garbage', encode_cursor([]), 'e30'):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_keyset_pages(app, travels):
+    newest_first = travels[::-1]
+    with app.app_context():
+        first = paginate_keyset(Travel.query, Travel.id, per_page=3)
+        assert ids(first) == newest_first[:3]
+        assert first.has_next and not first.has_prev and first.prev_cursor is None
+
+        second = paginate_keyset(Travel.query, Travel.id, per_page=3, after=first.next_cursor)
+        assert ids(second) == newest_first[3:6]
+        assert second.has_next and second.has_prev
+
+        last = paginate_keyset(Travel.query, Travel.id, per_page=3, after=second.next_cursor)
+        assert ids(last) == newest_first[6:]
+        assert not last.has_next and last.next_cursor is None
+
+        back = paginate_keyset(Travel.query, Travel.id, per_page=3, before=second.prev_cursor)
+        assert ids(back) == newest_first[:3]
+        assert not back.has_prev
+
+
+def test_total_is_lazy(app, travels):
+    calls = []
+
+    def total():
+        calls.append(1)
+        return len(travels)
+
+    with app.app_context():
+        page = paginate_keyset(Travel.query, Travel.id, per_page=3, total=total)
+        assert calls == []
+        assert page.total == 7 and page.total == 7
+        assert calls == [1]
+
+
+def test_feed_follows_cursors(client, travels):
+    first = client.get('/')
+    assert first.status_code == 200
+    assert first.data.count(b'<article') == 3
+    assert b'after=' in first.data
+    assert client.get('/?after=garbage').status_code == 404
+
+
+def test_cached_count(app, guide, travels):
+    key = ('travels', guide)
+    with app.app_context():
+        query = Travel.query.filter_by(guide_id=guide)
+        assert cached_count(query, key) == 7
+        db.session.execute(Travel.__table__.delete().where(Travel.id == travels[0]))
+        db.session.commit()
+        assert cached_count(query, key) == 7
+        forget_count(key)
+        assert cached_count(query, key) == 6
+
+
+def test_my_travels_total_follows_new_travels(logged_in, travels):
+    page = logged_in.get('/my_travels')
+    assert b'My travels (7)' in page.data
+    assert page.data.count(b'<article') == 3
+    response = logged_in.post('/travels/create', data={'title': 'New', 'content': 'Body'})
+    assert response.status_code == 302
+    assert b'My travels (8)' in logged_in.get('/my_travels').data
@@ -0,0 +1,51 @@
+import pytest
+from travelbook import hasher
+from travelbook.models import Guide
+from travelbook.passwords import HasherBusy, _hashpw, hash_rounds
+
+
+def test_old_hashes_are_upgraded_on_login(app, client, guide):
+    app.config['BCRYPT_LOG_ROUNDS'] = 5
+    backend = app.extensions['page_cache']
+    generations = backend.counter('gen:guides'), backend.counter('gen:travels')
+    response = client.post('/login', data={'email': 'a@x.com', 'password': 'pw'})
+    assert response.status_code == 302
+    with app.app_context():
+        hashed = Guide.query.get(guide).password
+        assert hash_rounds(hashed) == 5 and hasher.check(hashed, 'pw')
+    # Only the password changed, so cached pages stay valid
+    assert (backend.counter('gen:guides'), backend.counter('gen:travels')) == generations
+
+
+def test_current_hashes_are_left_alone(app, client, guide):
+    with app.app_context():
+        hashed = Guide.query.get(guide).password
+    client.post('/login', data={'email': 'a@x.com', 'password': 'pw'})
+    with app.app_context():
+        assert Guide.query.get(guide).password == hashed
+
+
+@pytest.fixture
+def busy(app):
+    """Every hasher slot taken, with callers giving up almost at once."""
+    app.config.update(HASHER_MAX_PENDING=1, HASHER_QUEUE_TIMEOUT=0.01)
+    pool = app.extensions['password_hasher']
+    pool.executor()
+    pool._slots.acquire()
+    yield pool
+    pool._slots.release()
+
+
+def test_hashes_beyond_the_queue_are_rejected(app, busy):
+    with app.app_context():
+        with pytest.raises(HasherBusy):
+            hasher.hash('pw')
+    assert busy.rejected == 1
+
+
+def test_logins_are_shed_when_busy(app, client, busy):
+    with app.app_context():
+        Guide(name='Ann', surname='Smith', phone='123456789', email='a@x.com',
+              password=_hashpw('pw', 4)).insert()
+    response = client.post('/login', data={'email': 'a@x.com', 'password': 'pw'})
+    assert response.status_code == 503 and busy.rejected == 1
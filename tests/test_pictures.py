@@ -0,0 +1,56 @@
+import io
+import time
+from PIL import Image
+from travelbook.guides.images import (PICTURE_FORMATS, PICTURE_SIZES, picture_filename,
+                                      render_variants)
+from travelbook.models import Guide
+
+
+def jpeg_with_exif(size=(400, 300)):
+    exif = Image.Exif()
+    exif[0x0110] = 'Secret Camera'  # Model
+    data = io.BytesIO()
+    Image.new('RGB', size, (10, 20, 30)).save(data, 'JPEG', exif=exif)
+    data.seek(0)
+    return data
+
+
+def test_variants_are_square_and_stripped(app):
+    storage = app.extensions['media_storage']
+    render_variants(jpeg_with_exif(), storage, 'aaaa')
+    names = sorted(name for name, _ in storage.list('aaaa'))
+    assert names == sorted(picture_filename('aaaa', width, ext)
+                           for width in PICTURE_SIZES.values() for ext, _ in PICTURE_FORMATS)
+    for width in PICTURE_SIZES.values():
+        for ext, fmt in PICTURE_FORMATS:
+            with Image.open(storage.open(picture_filename('aaaa', width, ext))) as variant:
+                assert variant.format == fmt and variant.size == (width, width)
+                assert not variant.getexif()
+
+
+def test_new_picture_is_rendered_in_the_background(app, logged_in, guide):
+    storage = app.extensions['media_storage']
+    response = logged_in.post('/account', content_type='multipart/form-data', data={
+        'name': 'Ann', 'surname': 'Smith', 'phone': '123456789', 'email': 'a@x.com',
+        'picture': (jpeg_with_exif(), 'me.jpg')})
+    assert response.status_code == 302
+    deadline = time.monotonic() + 10
+    key = None
+    while key is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+        with app.app_context():
+            key = Guide.query.get(guide).image_key
+    assert key is not None
+    assert len(storage.list(key)) == len(PICTURE_SIZES) * len(PICTURE_FORMATS)
+    page = logged_in.get('/guides/{}'.format(guide)).data.decode()
+    assert 'src="/media/{}"'.format(picture_filename(key, PICTURE_SIZES['card'])) in page
+    assert '/media/{} 250w'.format(picture_filename(key, 250, 'webp')) in page
+    response = logged_in.get('/media/' + picture_filename(key, PICTURE_SIZES['card']))
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_default_picture_comes_from_the_assets(logged_in, guide):
+    page = logged_in.get('/guides/{}'.format(guide)).data.decode()
+    assert '/assets/profile_pics/default-125.' in page
+    assert '/media/' not in page
@@ -0,0 +1,82 @@
+import io
+from datetime import datetime
+from travelbook import db, media
+from travelbook.guides.images import PICTURE_SIZES, picture_filename
+from travelbook.guides.purge import (delete_travels, purge_deleted_guides, purge_guide,
+                                     soft_delete)
+from travelbook.models import Guide, Tag, Travel, load_user
+
+
+def add_travels(guide, count, tags=()):
+    ann = Guide.query.get(guide)
+    travels = [Travel(title='Trip {}'.format(i), content='Content', guide=ann,
+                      tags=list(tags)) for i in range(count)]
+    for travel in travels:
+        travel.insert()
+    return [travel.id for travel in travels]
+
+
+def pictures(key):
+    return [picture_filename(key, width) for width in PICTURE_SIZES.values()]
+
+
+def test_soft_delete_hides_the_guide_then_purges(app, guide):
+    with app.test_request_context():
+        add_travels(guide, 3, [Tag(name='lakes')])
+        future = soft_delete(guide)
+        assert Guide.active().count() == 0 and load_user(guide) is None
+        assert future.result(timeout=10) is None
+        db.session.remove()
+        assert Guide.query.get(guide) is None and Travel.query.count() == 0
+        assert dict(db.session.query(Tag.name, Tag.travel_count)) == {'lakes': 0}
+
+
+def test_travels_go_in_batches_newest_first(app, guide):
+    with app.app_context():
+        ids = add_travels(guide, 5)
+        assert delete_travels(guide, 2) == 2
+        assert sorted(i for i, in db.session.query(Travel.id)) == ids[:3]
+        assert purge_guide(guide, batch=2) == 3
+        assert Travel.query.count() == 0 and Guide.query.get(guide) is None
+
+
+def test_hard_delete_removes_unshared_pictures(app, guide):
+    app.config['GUIDE_SOFT_DELETE'] = False
+    with app.app_context():
+        storage = media.backend
+        for name in pictures('mine') + pictures('shared'):
+            storage.save(name, io.BytesIO(b'picture'))
+        Guide.query.get(guide).image_key = 'mine'
+        db.session.add(Guide(name='Bob', surname='Jones', phone='123456789', email='b@x.com',
+                             password='x', image_key='shared'))
+        db.session.commit()
+        add_travels(guide, 2)
+        Guide.query.get(guide).delete()
+        assert Guide.query.get(guide) is None and Travel.query.count() == 0
+        assert not any(storage.exists(name) for name in pictures('mine'))
+
+        bob = Guide.query.filter_by(email='b@x.com').one()
+        db.session.add(Guide(name='Cy', surname='Lee', phone='123456789', email='c@x.com',
+                             password='x', image_key='shared'))
+        db.session.commit()
+        bob.delete()
+        # Another guide still shows it
+        assert all(storage.exists(name) for name in pictures('shared'))
+
+
+def test_leftover_soft_deleted_guides_are_purged(app, guide):
+    with app.app_context():
+        add_travels(guide, 2)
+        Guide.query.get(guide).deleted_at = datetime.utcnow()
+        db.session.commit()
+        assert purge_deleted_guides(batch=1) == [guide]
+        assert Guide.query.count() == 0 and Travel.query.count() == 0
+
+
+def test_delete_route_removes_the_guide(app, client, guide):
+    app.config['GUIDE_SOFT_DELETE'] = False
+    response = client.post('/guides/{}'.format(guide))
+    assert response.status_code == 302
+    with app.app_context():
+        assert Guide.query.get(guide) is None
+    assert client.get('/guides/{}'.format(guide)).status_code == 404
@@ -0,0 +1,45 @@
+import pytest
+import travelbook.main.routes as main_routes
+from travelbook import hasher
+from travelbook.models import Guide, Travel
+from travelbook.queries import QueryBudgetExceeded
+
+
+@pytest.fixture
+def feed(app, guide):
+    """Two travels by the logged-in guide, then one each by four other guides."""
+    with app.app_context():
+        ann = Guide.query.get(guide)
+        for i in range(2):
+            Travel(title='Mine {}'.format(i), content='Content', guide=ann).insert()
+        for n in range(4):
+            author = Guide(name='Guide{}'.format(n), surname='Other', phone='123456789',
+                           email='g{}@x.com'.format(n), password=hasher.hash('pw'))
+            author.insert()
+            Travel(title='Theirs {}'.format(n), content='Content', guide=author).insert()
+
+
+def test_listings_stay_within_their_budgets(app, logged_in, guide, feed):
+    for endpoint, path in (('main.home', '/'),
+                           ('guides.all_guides', '/guides'),
+                           ('guides.show_guide', '/guides/{}'.format(guide)),
+                           ('guides.guide_travels', '/my_travels')):
+        assert app.view_functions[endpoint].query_budget
+        response = logged_in.get(path)
+        # Streamed pages are checked once the body has been generated
+        assert response.status_code == 200 and response.data
+
+
+def test_n_plus_one_exceeds_the_budget(logged_in, feed, monkeypatch):
+    # Without the joined guide each card on the page loads its guide separately
+    monkeypatch.setattr(main_routes, 'feed_query', lambda: Travel.query)
+    with pytest.raises(QueryBudgetExceeded):
+        logged_in.get('/').data
+
+
+def test_default_budget_applies_to_other_views(app, client, guide, feed):
+    app.config['QUERY_BUDGET'] = 0
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/travels/1')
+    app.config['QUERY_BUDGET'] = None
+    assert client.get('/travels/2').status_code == 200
@@ -0,0 +1,73 @@
+import pytest
+from travelbook import create_app, db
+from tests.conftest import TestingConfig
+
+
+@pytest.fixture
+def limited(app):
+    """Rate limiting on, with three logins per address before the 429."""
+    app.config.update(RATELIMIT_ENABLED=True, RATELIMIT_LOGIN_IP='3/minute')
+    return app
+
+
+def login(client, email='a@x.com', **kwargs):
+    return client.post('/login', data={'email': email, 'password': 'nope'}, **kwargs)
+
+
+def test_bursts_are_answered_with_429(limited, client):
+    statuses = [login(client, 'g{}@x.com'.format(n)).status_code for n in range(4)]
+    assert statuses == [200, 200, 200, 429]
+    response = login(client, 'other@x.com')
+    assert response.status_code == 429 and int(response.headers['Retry-After']) >= 1
+
+
+def test_failed_logins_are_limited_per_email(app, client):
+    app.config['RATELIMIT_ENABLED'] = True
+    statuses = [login(client).status_code for _ in range(6)]
+    assert statuses == [200] * 5 + [429]
+    assert login(client, 'b@x.com').status_code == 200
+
+
+def test_rendering_the_form_is_not_counted(limited, client):
+    for _ in range(5):
+        assert client.get('/login').status_code == 200
+    assert login(client).status_code == 200
+
+
+def test_each_address_has_its_own_bucket(limited, client):
+    for _ in range(3):
+        login(client, environ_base={'REMOTE_ADDR': '198.51.100.1'})
+    assert login(client, environ_base={'REMOTE_ADDR': '198.51.100.1'}).status_code == 429
+    assert login(client, environ_base={'REMOTE_ADDR': '198.51.100.2'}).status_code == 200
+
+
+def test_forged_forwarded_for_is_ignored_by_default(limited, client):
+    for n in range(3):
+        login(client, headers={'X-Forwarded-For': '203.0.113.{}'.format(n)})
+    response = login(client, headers={'X-Forwarded-For': '203.0.113.99'})
+    assert response.status_code == 429
+
+
+def test_forwarded_for_is_trusted_behind_a_proxy(tmp_path):
+    class ProxiedConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(tmp_path / 'travelbook.db')
+        RATELIMIT_ENABLED = True
+        RATELIMIT_LOGIN_IP = '3/minute'
+        PROXY_FIX_X_FOR = 1
+
+    app = create_app(ProxiedConfig)
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    for _ in range(3):
+        login(client, headers={'X-Forwarded-For': '203.0.113.1'})
+    assert login(client, headers={'X-Forwarded-For': '203.0.113.1'}).status_code == 429
+    assert login(client, headers={'X-Forwarded-For': '203.0.113.2'}).status_code == 200
+
+
+def test_api_rejections_are_json(limited, client):
+    for _ in range(3):
+        client.post('/api/v1/tokens', json={'email': 'a@x.com', 'password': 'nope'})
+    response = client.post('/api/v1/tokens', json={'email': 'a@x.com', 'password': 'nope'})
+    assert response.status_code == 429 and 'error' in response.get_json()
+    assert 'Retry-After' in response.headers
@@ -0,0 +1,60 @@
+import pytest
+from flask import g
+from travelbook import create_app, db, hasher
+from travelbook.models import Guide, Travel
+from tests.conftest import TestingConfig
+
+
+@pytest.fixture
+def app(tmp_path):
+    """An app with one replica, seeded apart from the primary so reads show where they went."""
+    class ReplicaConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(tmp_path / 'primary.db')
+        SQLALCHEMY_REPLICA_URIS = ['sqlite:///{}'.format(tmp_path / 'replica.db')]
+        MAIL_SPOOL_DIR = str(tmp_path / 'mail_spool')
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        for name, engine in db.engines():
+            db.Model.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(Guide.__table__.insert().values(
+                    id=1, name='Ann', surname='Smith', phone='123456789', email='a@x.com',
+                    password=hasher.hash('pw')))
+                connection.execute(Travel.__table__.insert().values(
+                    id=1, guide_id=1, title='From ' + name, content='Content'))
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for _, engine in db.engines():
+            engine.dispose()
+
+
+def test_marked_views_read_from_the_replica(client):
+    assert b'From replica_0' in client.get('/').data
+
+
+def test_other_views_read_from_the_primary(client):
+    assert client.get('/api/v1/travels/1').get_json()['title'] == 'From primary'
+
+
+def test_writes_go_to_the_primary(app):
+    with app.test_request_context():
+        g.read_replica = True
+        assert Travel.query.get(1).title == 'From replica_0'
+        Travel(title='New', content='Content', guide_id=1).insert()
+    with app.app_context():
+        primary = db.get_engine()
+        replica = db.get_engine(bind='replica_0')
+        assert primary.execute('SELECT count(*) FROM travel').scalar() == 2
+        assert replica.execute('SELECT count(*) FROM travel').scalar() == 1
+
+
+def test_reads_after_a_write_stay_on_the_primary(app):
+    with app.test_request_context():
+        g.read_replica = True
+        db.session.add(Travel(title='New', content='Content', guide_id=1))
+        # Autoflushed first, so the new row must be visible
+        assert Travel.query.count() == 2
+        assert Travel.query.get(1).title == 'From primary'
+        db.session.rollback()
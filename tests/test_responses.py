@@ -0,0 +1,59 @@
+import gzip
+import pytest
+from travelbook.models import Guide, Travel
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+@pytest.fixture
+def feed(app, guide):
+    with app.app_context():
+        ann = Guide.query.get(guide)
+        for i in range(3):
+            Travel(title='Trip {}'.format(i), content='Lakes and castles ' * 50, guide=ann).insert()
+
+
+def test_listings_are_gzipped_as_they_stream(app, client, feed):
+    # Both requests really stream
+    app.extensions['page_cache'] = None
+    plain = client.get('/', headers={'Accept-Encoding': 'identity'}).data
+    response = client.get('/', headers=GZIP)
+    assert response.is_streamed and 'Content-Length' not in response.headers
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == plain
+
+
+def test_the_head_is_sent_before_the_body_renders(client, feed):
+    response = client.get('/guides', headers={'Accept-Encoding': 'identity'}, buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks)
+    assert b'</head>' in first and b'</html>' not in first
+    assert b'</html>' in b''.join(chunks)
+    response.close()
+
+
+def test_cached_listings_are_gzipped_too(client, feed):
+    client.get('/guides', headers=GZIP).data
+    response = client.get('/guides', headers=GZIP)
+    assert response.headers['X-Cache'] == 'HIT'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert b'Ann Smith' in gzip.decompress(response.data)
+
+
+def test_pages_with_csrf_tokens_are_not_compressed(app, client):
+    app.config['WTF_CSRF_ENABLED'] = True
+    response = client.get('/login', headers=GZIP)
+    assert b'csrf_token' in response.data
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_other_views_are_sent_as_they_are(client, feed):
+    for path in ('/api/v1/travels', '/about'):
+        response = client.get(path, headers=GZIP)
+        assert response.status_code == 200 and 'Content-Encoding' not in response.headers
+
+
+def test_head_requests_are_not_compressed(client, feed):
+    response = client.head('/', headers=GZIP)
+    assert response.status_code == 200 and 'Content-Encoding' not in response.headers
@@ -0,0 +1,72 @@
+from markupsafe import Markup
+from travelbook.models import Guide, Travel
+from travelbook.search.utils import highlight, search_terms, search_travels, snippet
+
+
+def add(app, guide, *travels):
+    with app.app_context():
+        author = Guide.query.get(guide)
+        for title, content in travels:
+            Travel(title=title, content=content, guide=author).insert()
+
+
+def test_search_terms():
+    assert search_terms('Old-town  Vilnius!') == ['old', 'town', 'vilnius']
+    assert search_terms('x' * 300) == ['x' * 200]
+
+
+def test_title_matches_rank_first(app, guide):
+    add(app, guide, ('Lakes of Trakai', 'Castle'), ('Coast', 'Lakes and more lakes'),
+        ('Forest', 'No water here'))
+    with app.app_context():
+        page = search_travels('lakes')
+        assert [hit.travel.title for hit in page.hits] == ['Lakes of Trakai', 'Coast']
+        assert page.hits[0].rank > page.hits[1].rank and not page.has_next
+
+
+def test_every_term_must_match(app, guide):
+    add(app, guide, ('Vilnius', 'old town walk'), ('Kaunas', 'old castle'))
+    with app.app_context():
+        assert [hit.travel.title for hit in search_travels('old town').hits] == ['Vilnius']
+        assert search_travels('   ').hits == []
+
+
+def test_cursor_pages_through_ties(app, guide):
+    add(app, guide, *[('Trip {}'.format(i), 'lake') for i in range(7)])
+    with app.app_context():
+        seen, after = [], None
+        while True:
+            page = search_travels('lake', after=after, per_page=3)
+            seen += [hit.travel.id for hit in page.hits]
+            if not page.has_next:
+                break
+            after = page.next_cursor
+        # Equal ranks come newest first, each exactly once
+        assert seen == sorted(seen, reverse=True) and len(set(seen)) == 7
+
+
+def test_api_pages_and_rejects_bad_cursors(app, client, guide):
+    add(app, guide, *[('Trip {}'.format(i), 'lake') for i in range(5)])
+    first = client.get('/api/search?q=lake&per_page=3').get_json()
+    second = client.get('/api/search?q=lake&per_page=3&after=' + first['next_cursor']).get_json()
+    assert len(first['results']) == 3 and len(second['results']) == 2
+    assert second['next_cursor'] is None
+    assert not {r['id'] for r in first['results']} & {r['id'] for r in second['results']}
+    assert client.get('/api/search?q=lake&after=garbage').status_code == 400
+    assert client.get('/search?q=lake&after=garbage').status_code == 404
+
+
+def test_highlighting_escapes_the_text():
+    assert highlight('<b>Lakes</b> & hills', ['lakes']) == \
+        Markup('&lt;b&gt;<mark>Lakes</mark>&lt;/b&gt; &amp; hills')
+    text = 'word ' * 100 + 'lake ' + 'word ' * 100
+    excerpt = snippet(text, ['lake'], width=40)
+    assert excerpt.startswith(Markup('&hellip;')) and excerpt.endswith(Markup('&hellip;'))
+    assert '<mark>lake</mark>' in excerpt
+
+
+def test_search_page_renders_hits(app, client, guide):
+    add(app, guide, ('Lakes of Trakai', 'Castle on a lake'))
+    page = client.get('/search?q=lake')
+    assert page.status_code == 200
+    assert b'<mark>Lakes</mark> of Trakai' in page.data
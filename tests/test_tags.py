@@ -0,0 +1,90 @@
+import threading
+from sqlalchemy import event
+from travelbook import db
+from travelbook.models import Tag, Travel
+from travelbook.travels.tags import facet_counts, get_or_create_tags, parse_tags, rebuild_counts
+
+
+def create(client, title, tags):
+    response = client.post('/travels/create', data={'title': title, 'content': 'Body ' * 20,
+                                                    'tags': tags})
+    assert response.status_code == 302
+    return Travel.query.filter_by(title=title).one().id
+
+
+def counts():
+    return dict(db.session.query(Tag.name, Tag.travel_count))
+
+
+def test_parse_tags():
+    assert parse_tags(['Lithuania, old  town', 'hiking, lithuania', ' , ']) == \
+        ['lithuania', 'old town', 'hiking']
+
+
+def test_counts_follow_travels(app, logged_in):
+    client = logged_in
+    with app.app_context():
+        first = create(client, 'Vilnius', 'Lithuania, old town')
+        create(client, 'Kaunas', 'lithuania, hiking')
+        assert counts() == {'lithuania': 2, 'old town': 1, 'hiking': 1}
+
+        response = client.post('/travels/{}/edit'.format(first),
+                               data={'title': 'Vilnius', 'content': 'Body', 'tags': 'hiking'})
+        assert response.status_code == 302
+        assert counts() == {'lithuania': 1, 'old town': 0, 'hiking': 2}
+
+        assert client.post('/travels/{}/delete'.format(first)).status_code == 302
+        assert counts() == {'lithuania': 1, 'old town': 0, 'hiking': 1}
+        assert facet_counts() == [('hiking', 1), ('lithuania', 1)]
+
+
+def test_feed_filters_by_tags(app, logged_in):
+    client = logged_in
+    with app.app_context():
+        create(client, 'Vilnius', 'lithuania, city')
+        create(client, 'Trakai', 'lithuania, lake')
+    assert client.get('/?tag=lithuania').data.count(b'<article') == 2
+    assert client.get('/?tag=lithuania&tag=lake').data.count(b'<article') == 1
+    assert client.get('/?tag=city&tag=lake&match=any').data.count(b'<article') == 2
+    assert client.get('/?tag=nowhere').data.count(b'<article') == 0
+
+
+def test_rebuild_counts(app, logged_in):
+    with app.app_context():
+        create(logged_in, 'Vilnius', 'lithuania')
+        Tag.query.update({Tag.travel_count: 5})
+        db.session.commit()
+        rebuild_counts()
+        db.session.commit()
+        assert counts() == {'lithuania': 1}
+
+
+def test_facets_are_dropped_after_the_commit(app, logged_in):
+    with app.app_context():
+        travel = Travel.query.get(create(logged_in, 'Vilnius', 'lithuania'))
+        assert facet_counts() == [('lithuania', 1)]
+
+        def read_facets(session):
+            # Another request, while the new count is flushed but not committed
+            def run():
+                with app.app_context():
+                    facet_counts()
+                    db.session.remove()
+            reader = threading.Thread(target=run)
+            reader.start()
+            reader.join()
+
+        session = db.session()
+        event.listen(session, 'before_commit', read_facets)
+        try:
+            travel.tags = travel.tags + get_or_create_tags(['city'])
+            travel.update()
+        finally:
+            event.remove(session, 'before_commit', read_facets)
+        assert facet_counts() == [('city', 1), ('lithuania', 1)]
+
+
+def test_new_tags_start_at_zero_in_the_database(app):
+    with app.app_context():
+        db.session.execute(Tag.__table__.insert().values(name='raw'))
+        assert db.session.query(Tag.travel_count).scalar() == 0
@@ -0,0 +1,174 @@
+import io
+import os
+import time
+import pytest
+from PIL import Image
+from travelbook import create_app, hasher, media
+from travelbook.guides.images import (InvalidPicture, PICTURE_FORMATS, PICTURE_SIZES,
+                                      check_picture, collect_orphans, content_key,
+                                      picture_filename, remove_pictures, render_variants,
+                                      switch_picture)
+from travelbook.models import Guide
+from travelbook.storage import MemoryStorage, UploadTooLarge, spool_upload
+from tests.conftest import TestingConfig
+
+
+def png(color=(1, 2, 3), size=(300, 300)):
+    data = io.BytesIO()
+    Image.new('RGB', size, color).save(data, 'PNG')
+    data.seek(0)
+    return data
+
+
+def variant_names(key):
+    return sorted(picture_filename(key, width, ext)
+                  for width in PICTURE_SIZES.values() for ext, _ in PICTURE_FORMATS)
+
+
+def upload(client, data, filename='me.png'):
+    return client.post('/account', content_type='multipart/form-data', data={
+        'name': 'Ann', 'surname': 'Smith', 'phone': '123456789', 'email': 'a@x.com',
+        'picture': (data, filename)})
+
+
+@pytest.fixture
+def storage(app):
+    return app.extensions['media_storage']
+
+
+@pytest.fixture
+def second_guide(app):
+    with app.app_context():
+        guide = Guide(name='Bob', surname='Jones', phone='123456789', email='b@x.com',
+                      password=hasher.hash('pw'))
+        guide.insert()
+        return guide.id
+
+
+# ----------------------------------------------------------------#
+# Size caps
+# ----------------------------------------------------------------#
+def test_unknown_storage_fails_at_startup():
+    class BadConfig(TestingConfig):
+        MEDIA_STORAGE = 'memroy'
+
+    with pytest.raises(ValueError):
+        create_app(BadConfig)
+
+
+def test_body_cap_defaults_to_upload_cap(app):
+    assert app.config['MAX_CONTENT_LENGTH'] > app.config['UPLOAD_MAX_SIZE']
+
+
+def test_oversized_body_is_refused(logged_in):
+    response = upload(logged_in, io.BytesIO(os.urandom(300 * 1024)))
+    assert response.status_code == 413
+
+
+def test_oversized_chunked_body_is_refused(logged_in):
+    body = (b'--b\r\nContent-Disposition: form-data; name="picture"; filename="me.png"\r\n\r\n'
+            + b'x' * 300 * 1024 + b'\r\n--b--\r\n')
+    response = logged_in.post('/account', input_stream=io.BytesIO(body),
+                              content_type='multipart/form-data; boundary=b',
+                              environ_overrides={'wsgi.input_terminated': True,
+                                                 'CONTENT_LENGTH': ''})
+    assert response.status_code == 413
+
+
+def test_oversized_upload_is_a_form_error(logged_in):
+    response = upload(logged_in, io.BytesIO(os.urandom(220 * 1024)))
+    assert response.status_code == 200
+    assert b'Uploads can be at most 200 KB.' in response.data
+
+
+def test_spool_upload(tmp_path):
+    path, digest, size = spool_upload(io.BytesIO(b'abc' * 50000), 10 ** 6, str(tmp_path))
+    assert size == 150000 and os.path.getsize(path) == size and len(digest) == 64
+    with pytest.raises(UploadTooLarge):
+        spool_upload(io.BytesIO(b'x' * 1000), 999, str(tmp_path))
+    assert os.listdir(str(tmp_path)) == [os.path.basename(path)]
+
+
+# ----------------------------------------------------------------#
+# Validation
+# ----------------------------------------------------------------#
+def test_check_picture(tmp_path):
+    path = str(tmp_path / 'me.png')
+    with open(path, 'wb') as f:
+        f.write(png().read())
+    check_picture(path)
+    with pytest.raises(InvalidPicture):
+        check_picture(path, max_pixels=300 * 300 - 1)
+    with open(path, 'wb') as f:
+        f.write(b'not a picture at all')
+    with pytest.raises(InvalidPicture):
+        check_picture(path)
+
+
+def test_invalid_picture_is_a_form_error(app, logged_in, guide):
+    response = upload(logged_in, io.BytesIO(b'not a picture at all'), 'me.jpg')
+    assert response.status_code == 200
+    assert b'That file is not a picture we can read.' in response.data
+    with app.app_context():
+        assert Guide.query.get(guide).image_key is None
+
+
+# ----------------------------------------------------------------#
+# Storing and removing
+# ----------------------------------------------------------------#
+def test_known_picture_is_applied_at_once(app, logged_in, guide, storage, tmp_path):
+    path = str(tmp_path / 'me.png')
+    with open(path, 'wb') as f:
+        f.write(png().read())
+    with open(path, 'rb') as f:
+        _, digest, _ = spool_upload(f, 10 ** 6, str(tmp_path))
+    key = content_key(digest)
+    render_variants(path, storage, key)
+    assert upload(logged_in, png()).status_code == 302
+    with app.app_context():
+        assert Guide.query.get(guide).image_key == key
+
+
+def test_switch_picture_keeps_shared_files(app, guide, second_guide, storage):
+    with app.app_context():
+        for key, color in (('aaaa', (1, 1, 1)), ('bbbb', (2, 2, 2))):
+            render_variants(png(color), storage, key)
+        first, second = Guide.query.get(guide), Guide.query.get(second_guide)
+        switch_picture(first, 'aaaa', storage)
+        switch_picture(second, 'aaaa', storage)
+        switch_picture(first, 'bbbb', storage)
+        # Still shown by the second guide
+        assert len(storage.list('aaaa')) == len(variant_names('aaaa'))
+        switch_picture(second, 'bbbb', storage)
+        assert storage.list('aaaa') == []
+        assert len(storage.list('bbbb')) == len(variant_names('bbbb'))
+
+
+def test_remove_pictures_of_an_old_upload(app, guide, storage):
+    with app.app_context():
+        storage.save('legacy.jpg', io.BytesIO(b'x'))
+        storage.save('default.jpg', io.BytesIO(b'x'))
+        remove_pictures(guide, None, 'legacy.jpg', storage)
+        remove_pictures(guide, None, 'default.jpg', storage)
+        assert [name for name, _ in storage.list()] == ['default.jpg']
+
+
+def test_collect_orphans(app, guide, storage):
+    with app.app_context():
+        render_variants(png(), storage, 'aaaa')
+        switch_picture(Guide.query.get(guide), 'aaaa', storage)
+        storage.save('bbbb-65.jpg', io.BytesIO(b'x'))
+        storage.save('cccc-65.jpg', io.BytesIO(b'x'))
+        # Written long ago and never used, unlike the recent upload
+        storage._files['bbbb-65.jpg'] = (b'x', time.time() - 7200)
+        assert collect_orphans(storage) == ['bbbb-65.jpg']
+        assert collect_orphans(storage, grace=0) == ['cccc-65.jpg']
+        assert sorted(name for name, _ in storage.list()) == variant_names('aaaa')
+
+
+def test_memory_storage_is_per_app(app, storage):
+    assert isinstance(storage, MemoryStorage)
+    other = create_app(TestingConfig)
+    assert other.extensions['media_storage'] is not storage
+    with app.app_context():
+        assert media.backend is storage
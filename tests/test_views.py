@@ -0,0 +1,69 @@
+from travelbook import db, view_counter
+from travelbook.models import Guide, Travel, TravelStats
+
+
+def add_travels(app, guide, n):
+    with app.app_context():
+        author = Guide.query.get(guide)
+        travels = [Travel(title='Trip {}'.format(i), content='Content', guide=author)
+                   for i in range(n)]
+        for travel in travels:
+            travel.insert()
+        return [travel.id for travel in travels]
+
+
+def views():
+    return dict(db.session.query(TravelStats.travel_id, TravelStats.views))
+
+
+def test_views_are_buffered_until_flushed(app, client, guide):
+    first, second = add_travels(app, guide, 2)
+    for _ in range(3):
+        assert client.get('/travels/{}'.format(first)).status_code == 200
+    client.get('/travels/{}'.format(second))
+    assert client.get('/travels/999').status_code == 404
+    with app.app_context():
+        assert views() == {}
+        view_counter.flush()
+        assert views() == {first: 3, second: 1}
+        client.get('/travels/{}'.format(second))
+        view_counter.flush()
+        assert views() == {first: 3, second: 2}
+        # Nothing pending: the next flush writes nothing
+        view_counter.flush()
+        assert views() == {first: 3, second: 2}
+
+
+def test_deleted_travels_are_skipped(app, client, guide):
+    travel_id, = add_travels(app, guide, 1)
+    client.get('/travels/{}'.format(travel_id))
+    with app.app_context():
+        Travel.query.get(travel_id).delete()
+        view_counter.flush()
+        assert views() == {}
+
+
+def test_popular_ranking(app, client, guide):
+    quiet, busy = add_travels(app, guide, 2)
+    client.get('/travels/{}'.format(quiet))
+    for _ in range(2):
+        client.get('/travels/{}'.format(busy))
+    with app.app_context():
+        view_counter.flush()
+        view_counter.refresh()
+        assert view_counter.popular() == [(busy, 2), (quiet, 1)]
+    page = client.get('/travels/popular').data.decode()
+    assert page.index('/travels/{}"'.format(busy)) < page.index('/travels/{}"'.format(quiet))
+
+
+def test_reranking_does_not_spoil_the_cached_page(app, client, guide):
+    travel_id, = add_travels(app, guide, 1)
+    client.get('/travels/{}'.format(travel_id))
+    app.config['VIEW_RANK_INTERVAL'] = 3600
+    with app.app_context():
+        view_counter.flush()
+    # The first request ranks for the first time, before the page is cached
+    first = client.get('/travels/popular')
+    assert first.headers['X-Cache'] == 'MISS' and first.data
+    second = client.get('/travels/popular')
+    assert second.headers['X-Cache'] == 'HIT' and second.data == first.data
@@ -1,49 +1,96 @@
 import os
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_cors import CORS
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_mail import Mail
-# from travelbook.config import Config       # And when you can move all app.config variables + import os
+from werkzeug.middleware.proxy_fix import ProxyFix
+from travelbook.mail_queue import MailDispatcher
+from travelbook.assets import AssetManifest
+from travelbook.cache import PageCache
+from travelbook.passwords import PasswordHasher
+from travelbook.database import RoutingSQLAlchemy
+from travelbook.metrics import RequestMetrics
+from travelbook.ratelimit import RateLimiter
+from travelbook.responses import ResponseCompressor
+from travelbook.popularity import ViewCounter
+from travelbook.storage import MediaStorage
+from config import Config
 
 
-database_name = "travelbook_login"
-database_path = 'postgresql://postgres@localhost:5432/travelbook_login'
+# Extensions are created unbound and attached to each app in create_app()
+db = RoutingSQLAlchemy()
+hasher = PasswordHasher()
+cors = CORS()
+login_manager = LoginManager()
+# login_manager.login_view = 'login'   - If we don't use Blueprints
+login_manager.login_view = 'guides.login'
+login_manager.login_message_category = 'info'
+mail_dispatcher = MailDispatcher()
+assets = AssetManifest()
+page_cache = PageCache()
+metrics = RequestMetrics()
+rate_limiter = RateLimiter()
+compressor = ResponseCompressor()
+view_counter = ViewCounter()
+media = MediaStorage()
 
-SECRET_KEY = os.urandom(32)
 
+def load_secret_key(app):
+    """Secret shared by every worker: ``SECRET_KEY`` or ``instance/secret_key``.
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = database_path
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = SECRET_KEY
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-migrate = Migrate(app, db)
-CORS(app)
+    The file is created once with O_EXCL, so workers forked or started in
+    parallel all end up signing sessions with the same key.
+    """
+    path = os.path.join(app.instance_path, 'secret_key')
+    os.makedirs(app.instance_path, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+    with open(path, 'rb') as f:
+        return f.read()
 
-login_manager = LoginManager(app)
-# login_manager.login_view = 'login'   - If we don't use Blueprints
-login_manager.login_view = 'guides.login'
-login_manager.login_message_category = 'info'
 
-app.config['MAIL_SERVER'] = 'smtp.googlemail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.environ.get('EMAIL_USER')
-app.config['MAIL_PASSWORD'] = os.environ.get('EMAIL_PASS')
+def create_app(config_class=Config):
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    x_for, x_proto = app.config.get('PROXY_FIX_X_FOR', 0), app.config.get('PROXY_FIX_X_PROTO', 0)
+    if x_for or x_proto:
+        # Client addresses (rate limits, metrics) come from the proxy's X-Forwarded-For
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=x_for, x_proto=x_proto)
+    if not app.config['SECRET_KEY']:
+        app.config['SECRET_KEY'] = load_secret_key(app)
+
+    metrics.init_app(app)
+    db.init_app(app)
+    hasher.init_app(app)
+    cors.init_app(app)
+    login_manager.init_app(app)
+    mail_dispatcher.init_app(app)
+    assets.init_app(app)
+    page_cache.init_app(app)
+    rate_limiter.init_app(app)
+    compressor.init_app(app)
+    view_counter.init_app(app)
+    media.init_app(app)
 
-mail = Mail(app)
+    from travelbook.guides.routes import guides
+    from travelbook.travels.routes import travels
+    from travelbook.main.routes import main
+    from travelbook.errors.handlers import errors
+    from travelbook.search.routes import search
+    from travelbook.api.routes import api
 
+    app.register_blueprint(guides)
+    app.register_blueprint(travels)
+    app.register_blueprint(main)
+    app.register_blueprint(errors)
+    app.register_blueprint(search)
+    app.register_blueprint(api)
 
-from travelbook.guides.routes import guides
-from travelbook.travels.routes import travels
-from travelbook.main.routes import main
-from travelbook.errors.handlers import errors
+    from travelbook.queries import init_query_budget
 
-app.register_blueprint(guides)
-app.register_blueprint(travels)
-app.register_blueprint(main)
-app.register_blueprint(errors)
+    init_query_budget(app)
+    return app
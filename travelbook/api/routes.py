@@ -0,0 +1,252 @@
+from flask import abort, current_app, request, url_for, Blueprint
+from flask_login import current_user, logout_user
+from sqlalchemy import and_, case
+from sqlalchemy.orm import load_only
+from travelbook import db, hasher, page_cache, rate_limiter
+from travelbook.models import Guide, Travel
+from travelbook.guides.forms import GuideForm, RegistrationForm
+from travelbook.pagination import paginate_keyset, forget_count
+from travelbook.passwords import HasherBusy
+from travelbook.ratelimit import form_email
+from travelbook.travels.tags import forget_facets, release_tags
+from travelbook.travels.utils import summarize
+from travelbook.api.utils import (GUIDE_FIELDS, TRAVEL_FIELDS, MAX_BULK_SIZE, api_login_required,
+                                  bulk_body, form_errors, is_id, json_body, json_error,
+                                  json_response, page_size, selected_fields,
+                                  serialize, serialize_page, validate_travel)
+
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+for code in (400, 401, 403, 404, 409, 413, 429, 503):
+    api.register_error_handler(code, json_error)
+
+
+def _projection(fields):
+    return load_only(*set(fields) | {'id'})
+
+
+def _own_travel(travel_id):
+    travel = Travel.query.get_or_404(travel_id)
+    if travel.guide_id != current_user.id:
+        abort(403, 'Not your travel')
+    return travel
+
+
+def _travels_changed(guide_id):
+    forget_count(('travels', guide_id))
+    forget_facets()
+    page_cache.invalidate('travels', 'guides')
+
+
+# ----------------------------------------------------------------#
+# Tokens
+# ----------------------------------------------------------------#
+@api.route('/tokens', methods=['POST'])
+# Same buckets as the login form
+@rate_limiter.limit('login_ip', '30/minute')
+@rate_limiter.limit('login_email', '5/minute', key=form_email)
+def create_token():
+    payload = json_body()
+    email, password = payload.get('email'), payload.get('password')
+    if not isinstance(email, str) or not isinstance(password, str):
+        abort(400, 'Expected an email and a password')
+    guide = Guide.active().filter_by(email=email).first()
+    try:
+        valid = guide is not None and hasher.check(guide.password, password)
+    except HasherBusy:
+        abort(503, 'Too many logins right now, try again shortly')
+    if not valid:
+        abort(401, 'Invalid email or password')
+    expires = current_app.config.get('API_TOKEN_EXPIRES', 3600)
+    response = json_response({'token': guide.get_api_token(expires), 'expires_in': expires}, 201)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# ----------------------------------------------------------------#
+# Guides
+# ----------------------------------------------------------------#
+@api.route('/guides')
+def list_guides():
+    fields = selected_fields(GUIDE_FIELDS)
+    try:
+        pagination = paginate_keyset(Guide.active().options(_projection(fields)), Guide.id,
+                                     per_page=page_size(),
+                                     after=request.args.get('after'), before=request.args.get('before'))
+    except ValueError:
+        abort(400, 'Invalid cursor')
+    return json_response(serialize_page(pagination, fields))
+
+
+@api.route('/guides/<int:guide_id>')
+def get_guide(guide_id):
+    fields = selected_fields(GUIDE_FIELDS)
+    guide = Guide.active().options(_projection(fields))\
+        .filter(Guide.id == guide_id).first_or_404()
+    return json_response(serialize(guide, fields))
+
+
+@api.route('/guides', methods=['POST'])
+# Same bucket as the sign-up form, so the API is no way around it
+@rate_limiter.limit('register_ip', '10/hour')
+def create_guide():
+    payload = json_body()
+    form = RegistrationForm(formdata=None, meta={'csrf': False},
+                            confirm_password=payload.get('password'),
+                            **{f: payload.get(f) for f in ('name', 'surname', 'phone', 'email', 'password')})
+    if not form.validate():
+        return json_response({'errors': form_errors(form)}, 400)
+    try:
+        password = hasher.hash(form.password.data)
+    except HasherBusy:
+        abort(503, 'Too many sign-ups right now, try again shortly')
+    guide = Guide(name=form.name.data, surname=form.surname.data, phone=form.phone.data,
+                  email=form.email.data, password=password)
+    guide.insert()
+    response = json_response(serialize(guide, GUIDE_FIELDS), 201)
+    response.headers['Location'] = url_for('api.get_guide', guide_id=guide.id)
+    return response
+
+
+@api.route('/guides/<int:guide_id>', methods=['PATCH'])
+@api_login_required
+def update_guide(guide_id):
+    if guide_id != current_user.id:
+        abort(403, 'You can only update your own account')
+    payload = json_body()
+    data = {f: payload.get(f, getattr(current_user, f)) for f in ('name', 'surname', 'phone', 'email')}
+    form = GuideForm(formdata=None, meta={'csrf': False}, **data)
+    if not form.validate():
+        return json_response({'errors': form_errors(form)}, 400)
+    for field, value in data.items():
+        setattr(current_user, field, value)
+    current_user.update()
+    return json_response(serialize(current_user, GUIDE_FIELDS))
+
+
+@api.route('/guides/<int:guide_id>', methods=['DELETE'])
+@api_login_required
+def delete_guide(guide_id):
+    if guide_id != current_user.id:
+        abort(403, 'You can only delete your own account')
+    current_user.delete()
+    logout_user()
+    return '', 204
+
+
+# ----------------------------------------------------------------#
+# Travels
+# ----------------------------------------------------------------#
+@api.route('/travels')
+def list_travels():
+    fields = selected_fields(TRAVEL_FIELDS)
+    query = Travel.query.options(_projection(fields))
+    guide_id = request.args.get('guide_id', type=int)
+    if guide_id is not None:
+        query = query.filter_by(guide_id=guide_id)
+    try:
+        pagination = paginate_keyset(query, Travel.id, per_page=page_size(),
+                                     after=request.args.get('after'), before=request.args.get('before'))
+    except ValueError:
+        abort(400, 'Invalid cursor')
+    return json_response(serialize_page(pagination, fields))
+
+
+@api.route('/travels/<int:travel_id>')
+def get_travel(travel_id):
+    fields = selected_fields(TRAVEL_FIELDS)
+    travel = Travel.query.options(_projection(fields)).get_or_404(travel_id)
+    return json_response(serialize(travel, fields))
+
+
+@api.route('/travels', methods=['POST'])
+@api_login_required
+def create_travel():
+    travel = Travel(guide_id=current_user.id, **validate_travel(json_body()))
+    travel.insert()
+    response = json_response(serialize(travel, TRAVEL_FIELDS), 201)
+    response.headers['Location'] = url_for('api.get_travel', travel_id=travel.id)
+    return response
+
+
+@api.route('/travels/<int:travel_id>', methods=['PATCH'])
+@api_login_required
+def update_travel(travel_id):
+    travel = _own_travel(travel_id)
+    for field, value in validate_travel(json_body(), partial=True).items():
+        setattr(travel, field, value)
+    travel.update()
+    return json_response(serialize(travel, TRAVEL_FIELDS))
+
+
+@api.route('/travels/<int:travel_id>', methods=['DELETE'])
+@api_login_required
+def delete_travel(travel_id):
+    _own_travel(travel_id).delete()
+    return '', 204
+
+# Bulk travels
+# ----------------------------------------------------------------#
+@api.route('/travels/bulk', methods=['POST'])
+@api_login_required
+def bulk_create_travels():
+    rows = []
+    for item in bulk_body():
+        values = validate_travel(item)
+        rows.append(dict(values, guide_id=current_user.id, **summarize(values['content'])))
+    if db.engine.dialect.name == 'postgresql':
+        table = Travel.__table__
+        statement = table.insert().values(rows).returning(table.c.id)
+        ids = [row.id for row in db.session.execute(statement)]
+    else:
+        # No RETURNING here, so let the ORM insert row by row and read back the keys
+        travels = [Travel(**row) for row in rows]
+        db.session.add_all(travels)
+        db.session.flush()
+        ids = [travel.id for travel in travels]
+    db.session.commit()
+    _travels_changed(current_user.id)
+    return json_response({'created': len(rows), 'ids': ids}, 201)
+
+
+@api.route('/travels/bulk', methods=['PATCH'])
+@api_login_required
+def bulk_update_travels():
+    changes = {}
+    for item in bulk_body():
+        values = validate_travel(item, partial=True)
+        if not is_id(item.get('id')) or not values:
+            abort(400, 'Every item needs an integer id and a field to change')
+        if 'content' in values:
+            values.update(summarize(values['content']))
+        changes[item['id']] = values
+    columns = {}
+    for field in ('title', 'content', 'excerpt', 'word_count', 'reading_time'):
+        whens = {travel_id: values[field] for travel_id, values in changes.items() if field in values}
+        if whens:
+            column = getattr(Travel, field)
+            columns[field] = case(whens, value=Travel.id, else_=column)
+    result = db.session.execute(
+        Travel.__table__.update()
+        .where(and_(Travel.id.in_(list(changes)), Travel.guide_id == current_user.id))
+        .values(**columns))
+    db.session.commit()
+    _travels_changed(current_user.id)
+    return json_response({'updated': result.rowcount})
+
+
+@api.route('/travels/bulk', methods=['DELETE'])
+@api_login_required
+def bulk_delete_travels():
+    ids = json_body().get('ids')
+    if not isinstance(ids, list) or not ids or not all(is_id(i) for i in ids):
+        abort(400, 'Expected {"ids": [...]} with integer ids')
+    if len(ids) > MAX_BULK_SIZE:
+        abort(413, 'At most {} ids per request'.format(MAX_BULK_SIZE))
+    own = Travel.query.filter(Travel.id.in_(ids), Travel.guide_id == current_user.id)
+    release_tags(own.with_entities(Travel.id).subquery())
+    deleted = own.delete(synchronize_session=False)
+    db.session.commit()
+    _travels_changed(current_user.id)
+    return json_response({'deleted': deleted})
@@ -0,0 +1,119 @@
+from functools import wraps
+from flask import abort, jsonify, request
+from flask_login import current_user
+
+
+GUIDE_FIELDS = ('id', 'name', 'surname', 'phone', 'email', 'image_file')
+TRAVEL_FIELDS = ('id', 'title', 'content', 'excerpt', 'word_count', 'reading_time', 'guide_id')
+TRAVEL_TITLE_MAX = 40
+MAX_PAGE_SIZE = 100
+MAX_BULK_SIZE = 1000
+
+
+def json_error(error):
+    headers = [(k, v) for k, v in error.get_headers() if k == 'Retry-After']
+    return jsonify(error=error.description), error.code, headers
+
+
+def json_response(payload, status=200):
+    """JSON response with an ETag; answers 304 when the client's copy matches.
+
+    The ETag is weak: it is taken before the body may be compressed, so it
+    only promises the same JSON, not the same bytes.
+    """
+    response = jsonify(payload)
+    response.status_code = status
+    if request.method == 'GET':
+        response.add_etag(weak=True)
+        response = response.make_conditional(request)
+    return response
+
+
+def api_login_required(f):
+    """Require a session login or an ``Authorization: Bearer`` API token."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            if request.headers.get('Authorization', '').lower().startswith('bearer '):
+                abort(401, 'Invalid or expired token')
+            abort(401, 'Login required')
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+# ----------------------------------------------------------------#
+# Request parsing
+# ----------------------------------------------------------------#
+def selected_fields(allowed):
+    """Fields named in ``?fields=a,b``; all of ``allowed`` if not given."""
+    fields = request.args.get('fields')
+    if not fields:
+        return allowed
+    selected = tuple(f for f in fields.split(',') if f)
+    unknown = set(selected) - set(allowed)
+    if unknown:
+        abort(400, 'Unknown fields: ' + ', '.join(sorted(unknown)))
+    return selected
+
+
+def is_id(value):
+    # JSON true/false arrive as bools, which are ints to Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def page_size():
+    return max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+
+
+def json_body(kind=dict):
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, kind):
+        abort(400, 'Expected a JSON ' + ('object' if kind is dict else 'array'))
+    return payload
+
+
+def bulk_body():
+    items = json_body(list)
+    if not items:
+        abort(400, 'Expected at least one item')
+    if len(items) > MAX_BULK_SIZE:
+        abort(413, 'At most {} items per request'.format(MAX_BULK_SIZE))
+    return items
+
+
+def validate_travel(item, partial=False):
+    """Return the writable travel fields of ``item`` or abort with 400."""
+    if not isinstance(item, dict):
+        abort(400, 'Expected a JSON object per travel')
+    values = {}
+    for field in ('title', 'content'):
+        if field not in item:
+            if not partial:
+                abort(400, 'Missing field: ' + field)
+            continue
+        value = item[field]
+        if not isinstance(value, str) or not value.strip():
+            abort(400, field + ' must be a non-empty string')
+        values[field] = value
+    if len(values.get('title', '')) > TRAVEL_TITLE_MAX:
+        abort(400, 'title must be at most {} characters'.format(TRAVEL_TITLE_MAX))
+    return values
+
+
+def form_errors(form):
+    return {name: errors for name, errors in form.errors.items()}
+
+
+# ----------------------------------------------------------------#
+# Serialization
+# ----------------------------------------------------------------#
+def serialize(obj, fields):
+    return {field: getattr(obj, field) for field in fields}
+
+
+def serialize_page(pagination, fields):
+    return {
+        'items': [serialize(item, fields) for item in pagination.items],
+        'next_cursor': pagination.next_cursor,
+        'prev_cursor': pagination.prev_cursor,
+    }
@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from flask import abort, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+FINGERPRINT = re.compile(r'^(?P<name>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.txt', '.json')
+# (content-coding, file suffix) in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class AssetManifest:
+    """Content-addressed URLs for files under the static folder.
+
+    ``asset_url('main.css')`` returns ``/assets/main.<digest>.css`` where the
+    digest is taken from the file's content, so the URL changes whenever the
+    file does and responses can be cached forever. Digests are computed
+    lazily and remembered until the file's mtime or size changes, which also
+    covers profile pictures uploaded at runtime.
+    """
+
+    def __init__(self, app=None):
+        self._digests = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.send_asset)
+        app.add_template_global(self.url, 'asset_url')
+        app.extensions['assets'] = self
+
+    def digest(self, filename):
+        path = os.path.join(current_app.static_folder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self._digests.get(path)
+        if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+        digest = h.hexdigest()[:12]
+        self._digests[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+        return digest
+
+    def url(self, filename, **kwargs):
+        digest = self.digest(filename)
+        if digest is None:
+            return url_for('static', filename=filename, **kwargs)
+        name, ext = os.path.splitext(filename)
+        return url_for('assets', filename=f'{name}.{digest}{ext}', **kwargs)
+
+    def send_asset(self, filename):
+        match = FINGERPRINT.match(filename)
+        if match is None:
+            abort(404)
+        original = match.group('name') + match.group('ext')
+        current = self.digest(original)
+        if current is None:
+            abort(404)
+        served, encoding = original, None
+        source = os.path.join(current_app.static_folder, original)
+        accepted = request.accept_encodings
+        for coding, suffix in ENCODINGS:
+            if accepted[coding] and _fresh(source + suffix, source):
+                served, encoding = original + suffix, coding
+                break
+        response = send_from_directory(current_app.static_folder, served,
+                                       mimetype=mimetypes.guess_type(original)[0],
+                                       conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        if current == match.group('digest'):
+            response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(
+                current_app.config['ASSETS_MAX_AGE'])
+        else:
+            # Stale URL from a page rendered before the file changed:
+            # serve the current file but make the browser revalidate
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+def _fresh(compressed, source):
+    try:
+        return os.stat(compressed).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except OSError:
+        return False
+
+
+def compress_assets(static_folder):
+    """Write .gz (and .br if brotli is installed) next to compressible files."""
+    written = []
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            variants = [('.gz', gzip.compress(data, 9))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(data)))
+            for suffix, compressed in variants:
+                if len(compressed) < len(data):
+                    with open(path + suffix, 'wb') as f:
+                        f.write(compressed)
+                    written.append(path + suffix)
+    return written
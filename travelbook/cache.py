@@ -0,0 +1,277 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, has_app_context, request, session
+from flask_login import current_user
+
+
+# ----------------------------------------------------------------#
+# Backends
+# ----------------------------------------------------------------#
+class LRUCache:
+    """Thread-safe in-process cache bounded by entry count and total size.
+
+    ``max_timeout`` caps every entry's lifetime, including explicit timeouts.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, default_timeout=300,
+                 max_timeout=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+        self._data = OrderedDict()
+        self._counters = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, size, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None, size=1):
+        if size > self.max_bytes:
+            return
+        timeout = self.default_timeout if timeout is None else timeout
+        if self.max_timeout is not None:
+            timeout = min(timeout, self.max_timeout)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + timeout, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        # Counters are kept apart from cached values so eviction never resets them
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        self._bytes -= self._data.pop(key)[1]
+
+
+class RedisCache:
+    """Shared cache for several processes or hosts; needs the ``redis`` package."""
+
+    def __init__(self, url, prefix='travelbook:', default_timeout=300):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.default_timeout = default_timeout
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, timeout=None, size=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        self._client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(timeout)))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def counter(self, key):
+        return int(self._client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        return self._client.incr(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+class FakeSharedCache:
+    """Stand-in for :class:`RedisCache` in tests.
+
+    Values are pickled like the real backend, so whatever is cached must
+    survive a round trip through another process.
+    """
+
+    def __init__(self, default_timeout=300):
+        self.default_timeout = default_timeout
+        self._data = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return pickle.loads(entry[1])
+
+    def set(self, key, value, timeout=None, size=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, pickle.dumps(value))
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+
+def app_cache(name, max_entries=1024):
+    """The current app's :class:`LRUCache` stored as ``app.extensions[name]``.
+
+    Created on first use, so module-level caches stay separate per app.
+    """
+    extensions = current_app.extensions
+    cache = extensions.get(name)
+    if cache is None:
+        cache = extensions.setdefault(name, LRUCache(max_entries=max_entries))
+    return cache
+
+
+# ----------------------------------------------------------------#
+# Page cache
+# ----------------------------------------------------------------#
+def _tee(chunks, source, backend, key, headers, timeout):
+    """Pass a streamed body through, caching it once it has been sent in full."""
+    body = []
+    try:
+        for chunk in chunks:
+            body.append(chunk)
+            yield chunk
+        body = b''.join(body)
+        backend.set(key, (body, 200, headers), timeout=timeout, size=len(body))
+    finally:
+        close = getattr(source, 'close', None)
+        if close is not None:
+            close()
+
+
+class PageCache:
+    """Caches whole rendered pages for anonymous visitors.
+
+    Pages are stored under a key made of the request path, query string
+    and the current generation of each namespace the page depends on.
+    :meth:`invalidate` bumps a namespace's generation, so every page
+    rendered from older data simply stops being looked up and ages out.
+    ``PAGE_CACHE_BACKEND`` is ``'local'`` (per-process LRU), ``'redis'``
+    (shared, ``PAGE_CACHE_REDIS_URL``), ``'fake'`` (shared stand-in for
+    tests) or ``None`` to disable caching. Each app gets its own backend.
+
+    Generations of the local backend live in one process, so a write
+    served by one worker cannot reach the pages cached by the others;
+    their pages are kept for at most ``PAGE_CACHE_LOCAL_TIMEOUT`` seconds.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_BACKEND', 'local')
+        app.config.setdefault('PAGE_CACHE_TIMEOUT', 60)
+        app.config.setdefault('PAGE_CACHE_LOCAL_TIMEOUT', 5)
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        app.config.setdefault('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        backend = app.config['PAGE_CACHE_BACKEND']
+        timeout = app.config['PAGE_CACHE_TIMEOUT']
+        if backend == 'local':
+            local_timeout = app.config['PAGE_CACHE_LOCAL_TIMEOUT']
+            backend = LRUCache(app.config['PAGE_CACHE_MAX_ENTRIES'],
+                               app.config['PAGE_CACHE_MAX_BYTES'],
+                               min(timeout, local_timeout), max_timeout=local_timeout)
+        elif backend == 'redis':
+            backend = RedisCache(app.config['PAGE_CACHE_REDIS_URL'], default_timeout=timeout)
+        elif backend == 'fake':
+            backend = FakeSharedCache(timeout)
+        else:
+            backend = None
+        app.extensions['page_cache'] = backend
+
+    @property
+    def backend(self):
+        if not has_app_context():
+            return None
+        return current_app.extensions.get('page_cache')
+
+    def invalidate(self, *namespaces):
+        backend = self.backend
+        if backend is None:
+            return
+        for namespace in namespaces:
+            backend.incr('gen:' + namespace)
+
+    def _cacheable_request(self, backend):
+        return (backend is not None
+                and request.method in ('GET', 'HEAD')
+                and '_flashes' not in session
+                and not current_user.is_authenticated)
+
+    def cached(self, *namespaces, timeout=None):
+        """Serve the view from cache for anonymous GETs."""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                backend = self.backend
+                if not self._cacheable_request(backend):
+                    return f(*args, **kwargs)
+                generations = '.'.join(str(backend.counter('gen:' + ns)) for ns in namespaces)
+                key = 'page:{}:{}:{}'.format(','.join(namespaces), generations, request.full_path)
+                hit = backend.get(key)
+                if hit is not None:
+                    body, status, headers = hit
+                    response = current_app.response_class(body, status=status, headers=headers)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    headers = [(k, v) for k, v in response.headers if k.lower() != 'set-cookie']
+                    if response.is_streamed:
+                        response.response = _tee(response.iter_encoded(), response.response, backend,
+                                                 key, headers, timeout)
+                    else:
+                        body = response.get_data()
+                        backend.set(key, (body, response.status_code, headers),
+                                    timeout=timeout, size=len(body))
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated_function
+        return decorator
@@ -0,0 +1,95 @@
+import random
+from functools import wraps
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class RoutingSession(SignallingSession):
+    """Sends reads to a replica during requests marked with :func:`read_replica`.
+
+    Anything that writes (a flush, an INSERT/UPDATE/DELETE statement or a
+    session with pending changes) goes to the primary, and so does every
+    query after it in the same request.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context() and g.get('read_replica'):
+            if (self._flushing or isinstance(clause, UpdateBase)
+                    or self.new or self.dirty or self.deleted):
+                # Read the request's own writes: stay on the primary from here on
+                g.read_replica = False
+            else:
+                replica = self._replica()
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper, clause)
+
+    def _replica(self):
+        db = self.app.extensions['sqlalchemy'].db
+        keys = db.replica_keys(self.app)
+        if not keys:
+            return None
+        if 'replica_key' not in g:
+            # Stick to one replica for the whole request
+            g.replica_key = random.choice(keys)
+        return db.get_engine(self.app, bind=g.replica_key)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy with pool tuning from config and read-replica routing.
+
+    Each URL in ``SQLALCHEMY_REPLICA_URIS`` becomes a ``replica_<n>`` bind.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('DB_POOL_SIZE', 5)
+        app.config.setdefault('DB_MAX_OVERFLOW', 10)
+        app.config.setdefault('DB_POOL_TIMEOUT', 10)
+        app.config.setdefault('DB_POOL_RECYCLE', 1800)
+        app.config.setdefault('DB_POOL_PRE_PING', True)
+        app.config.setdefault('DB_STATEMENT_TIMEOUT', None)
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for i, uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS']):
+            binds['replica_{}'.format(i)] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+        super().init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        super().apply_driver_hacks(app, sa_url, options)
+        options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+        if sa_url.drivername.startswith('sqlite'):
+            return
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+        timeout = app.config['DB_STATEMENT_TIMEOUT']
+        if timeout and sa_url.drivername.startswith('postgresql'):
+            connect_args = options.setdefault('connect_args', {})
+            connect_args.setdefault('options', '-c statement_timeout={:d}'.format(timeout))
+
+    def replica_keys(self, app=None):
+        binds = self.get_app(app).config['SQLALCHEMY_BINDS'] or {}
+        return sorted(key for key in binds if key.startswith('replica_'))
+
+    def engines(self, app=None):
+        """``(name, engine)`` for the primary and every replica."""
+        app = self.get_app(app)
+        yield 'primary', self.get_engine(app)
+        for key in self.replica_keys(app):
+            yield key, self.get_engine(app, bind=key)
+
+
+def read_replica(f):
+    """Let the view's queries run on a read replica, if any are configured."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = True
+        return f(*args, **kwargs)
+    return decorated_function
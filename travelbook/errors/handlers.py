@@ -13,6 +13,22 @@ def error_403(error):
     return render_template('errors/403.html'), 403
 
 
+@errors.app_errorhandler(413)
+def error_413(error):
+    return render_template('errors/413.html'), 413
+
+
+@errors.app_errorhandler(429)
+def error_429(error):
+    headers = [(k, v) for k, v in error.get_headers() if k == 'Retry-After']
+    return render_template('errors/429.html', retry_after=error.retry_after), 429, headers
+
+
+@errors.app_errorhandler(503)
+def error_503(error):
+    return render_template('errors/503.html'), 503
+
+
 @errors.app_errorhandler(500)
 def error_500(error):
     return render_template('errors/500.html'), 500
@@ -0,0 +1,179 @@
+import json
+import re
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from sqlalchemy import event, func
+from travelbook import db
+from travelbook.guides.purge import delete_travels, hard_delete
+from travelbook.models import Tag, Travel
+from travelbook.pagination import encode_cursor
+from travelbook.storage import MemoryStorage
+
+TABLE_ALIAS = re.compile(r'(?:FROM|JOIN)\s+"?(\w+)"?\s+AS\s+"?(\w+)', re.I)
+
+
+# ----------------------------------------------------------------#
+# Capturing route queries
+# ----------------------------------------------------------------#
+def route_paths(guide_id, travel_id):
+    """GET paths covering every listing and detail route, first and later pages."""
+    # Later pages filter on the key, which can take a different plan from the first
+    travel_after = 'after=' + encode_cursor([travel_id])
+    guide_after = 'after=' + encode_cursor([guide_id])
+    paths = [
+        '/', '/?' + travel_after, '/?before=' + encode_cursor([travel_id]),
+        '/travels/{}'.format(travel_id), '/travels/popular',
+        '/guides', '/guides?' + guide_after, '/guides/{}'.format(guide_id),
+        '/my_travels', '/my_travels?' + travel_after,
+        '/api/v1/guides', '/api/v1/guides?' + guide_after, '/api/v1/guides/{}'.format(guide_id),
+        '/api/v1/travels', '/api/v1/travels?' + travel_after,
+        '/api/v1/travels?guide_id={}'.format(guide_id),
+        '/api/v1/travels?guide_id={}&{}'.format(guide_id, travel_after),
+        '/api/v1/travels/{}'.format(travel_id),
+    ]
+    top = [name for name, in db.session.query(Tag.name).order_by(Tag.travel_count.desc()).limit(2)]
+    if top:
+        every = [('tag', name) for name in top]
+        paths += ['/travels?' + urlencode({'tag': top[-1]}),
+                  '/travels?' + urlencode(every),
+                  '/travels?' + urlencode(every + [('match', 'any')]),
+                  '/travels?' + urlencode(every + [('after', encode_cursor([travel_id]))]),
+                  '/travels?' + urlencode(every + [('match', 'any'),
+                                                   ('after', encode_cursor([travel_id]))])]
+    if db.engine.dialect.name == 'postgresql':
+        # Elsewhere search falls back to LIKE, which always scans
+        search_after = urlencode({'after': encode_cursor([0.1, travel_id])})
+        paths += ['/search?q=old+town', '/api/search?q=old+town',
+                  '/search?q=old+town&' + search_after, '/api/search?q=old+town&' + search_after]
+    return paths
+
+
+@contextmanager
+def capture_statements(engine, kinds=('SELECT',)):
+    """Collect ``(statement, parameters)`` for every statement of ``kinds`` run on ``engine``."""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in kinds and not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def route_queries(app):
+    """``[(label, statement, parameters)]`` issued by the routes, deduplicated.
+
+    Pages are requested as the guide with the most travels, with the page
+    cache off so every view really runs. Deleting that guide is run as
+    well, through the same set-based statements as the purge, in a
+    transaction that is rolled back.
+    """
+    guide_id, = db.session.query(Travel.guide_id)\
+        .group_by(Travel.guide_id).order_by(func.count(Travel.id).desc()).first()
+    travel_id = db.session.query(func.max(Travel.id))\
+        .filter(Travel.guide_id == guide_id).scalar()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(guide_id)
+        session['_fresh'] = True
+
+    found, seen = [], set()
+    page_cache = app.extensions['page_cache']
+    app.extensions['page_cache'] = None
+    try:
+        for label in route_paths(guide_id, travel_id) + ['delete_guide purge']:
+            if label.startswith('/'):
+                with capture_statements(db.engine) as captured:
+                    # A fresh app context per request, as in production, so
+                    # g and the recorded queries don't leak between views
+                    with app.app_context():
+                        client.get(label)
+            else:
+                with capture_statements(db.engine, ('SELECT', 'UPDATE', 'DELETE')) as captured:
+                    with rolled_back():
+                        delete_travels(guide_id, app.config.get('GUIDE_PURGE_BATCH', 500))
+                        hard_delete(guide_id, storage=MemoryStorage())
+            for statement, parameters in captured:
+                if statement not in seen:
+                    seen.add(statement)
+                    found.append((label, statement, parameters))
+    finally:
+        app.extensions['page_cache'] = page_cache
+    return found
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in one transaction that is rolled back; its commits only flush."""
+    session = db.session
+    # An instance attribute shadows scoped_session.commit until deleted
+    session.commit = session.flush
+    try:
+        yield
+    finally:
+        del session.commit
+        session.rollback()
+
+
+# ----------------------------------------------------------------#
+# Plans
+# ----------------------------------------------------------------#
+def table_rows(table):
+    if db.engine.dialect.name == 'postgresql':
+        return db.session.execute('SELECT reltuples FROM pg_class WHERE relname = :t',
+                                  {'t': table}).scalar() or 0
+    return db.session.execute('SELECT COUNT(*) FROM "{}"'.format(table)).scalar()
+
+
+def full_scans(statement, parameters):
+    """Tables read with a sequential scan by ``statement``, and a plan summary."""
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'postgresql':
+        plan = connection.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes, scans = [plan[0]['Plan']], []
+        while nodes:
+            node = nodes.pop()
+            if node['Node Type'] == 'Seq Scan':
+                scans.append(node['Relation Name'])
+            nodes.extend(node.get('Plans', ()))
+        return scans, plan[0]['Plan']['Node Type']
+    details = [row[-1] for row in
+               connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    aliases = {alias: name for name, alias in TABLE_ALIAS.findall(statement)}
+    if (re.search(r'\bLIMIT\b', statement, re.I) and not re.search(r'\bWHERE\b', statement, re.I)
+            and not any('TEMP B-TREE' in detail for detail in details)):
+        # Walks the table in index order and stops at the LIMIT
+        return [], '; '.join(details)
+    scans = []
+    for detail in details:
+        # 'SCAN travel' / 'SCAN TABLE travel' without an index is a full scan;
+        # scans of materialized subqueries are not table reads
+        words = detail.replace('SCAN TABLE ', 'SCAN ').split()
+        table = aliases.get(words[1], words[1]) if len(words) > 1 else None
+        if words[0] == 'SCAN' and 'INDEX' not in words and table in db.metadata.tables:
+            scans.append(table)
+    return scans, '; '.join(details)
+
+
+def check_plans(app, threshold=1000):
+    """Yield ``(label, statement, plan, scans)`` for every route query.
+
+    ``scans`` lists the tables with more than ``threshold`` rows that the
+    query reads sequentially; an empty list means the plan is fine.
+    """
+    sizes = {}
+    for label, statement, parameters in route_queries(app):
+        scans, summary = full_scans(statement, parameters)
+        big = []
+        for table in scans:
+            if table not in sizes:
+                sizes[table] = table_rows(table)
+            if sizes[table] > threshold:
+                big.append('{} ({:.0f} rows)'.format(table, sizes[table]))
+        yield label, ' '.join(statement.split()), summary, big
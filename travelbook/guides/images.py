@@ -0,0 +1,218 @@
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from flask import current_app
+from travelbook import assets, media
+from travelbook.storage import spool_upload
+
+
+# Rendered widths: feed avatar, profile card and the card at 2x density
+PICTURE_SIZES = {'avatar': 65, 'card': 125, 'retina': 250}
+PICTURE_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+DEFAULT_PICTURE = 'default.jpg'
+# Decoded size limit, checked from the header before any pixel is decoded
+MAX_PIXELS = 40 * 1000 * 1000
+
+_executor = None
+_executor_pid = None
+_threads = None
+
+
+class InvalidPicture(ValueError):
+    pass
+
+
+def content_key(digest):
+    return digest[:16]
+
+
+def picture_filename(key, width, ext='jpg'):
+    return f'{key}-{width}.{ext}'
+
+
+# ----------------------------------------------------------------#
+# Rendering (runs in the process pool)
+# ----------------------------------------------------------------#
+def check_picture(source, max_pixels=MAX_PIXELS):
+    """Reject files that aren't pictures or would decode to too many pixels.
+
+    Only the header is read.
+    """
+    from PIL import Image
+
+    too_large = InvalidPicture(
+        'Pictures can be at most {} megapixels.'.format(max_pixels // 10 ** 6))
+    try:
+        with Image.open(source) as original:
+            width, height = original.size
+    except Image.DecompressionBombError:
+        raise too_large
+    except (OSError, SyntaxError):
+        raise InvalidPicture('That file is not a picture we can read.')
+    if width * height > max_pixels:
+        raise too_large
+
+
+def render_variants(source, storage, key):
+    """Write every size/format variant of ``source`` to ``storage`` without metadata."""
+    from PIL import Image, ImageOps
+
+    check_picture(source)
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    for width in PICTURE_SIZES.values():
+        variant = ImageOps.fit(image, (width, width), Image.LANCZOS)
+        variant.info = {}
+        for ext, fmt in PICTURE_FORMATS:
+            data = io.BytesIO()
+            variant.save(data, fmt, quality=82)
+            data.seek(0)
+            storage.save(picture_filename(key, width, ext), data)
+    return key
+
+
+def variants_exist(storage, key):
+    return all(storage.exists(picture_filename(key, width, ext))
+               for width in PICTURE_SIZES.values() for ext, _ in PICTURE_FORMATS)
+
+
+def remove_pictures(guide_id, image_key, image_file, storage):
+    """Delete a guide's former picture files unless another guide shows the same picture."""
+    from travelbook.models import Guide
+
+    names = []
+    if image_key and not Guide.query.filter(Guide.image_key == image_key,
+                                            Guide.id != guide_id).count():
+        names += [picture_filename(image_key, width, ext)
+                  for width in PICTURE_SIZES.values() for ext, _ in PICTURE_FORMATS]
+    if image_file and image_file != DEFAULT_PICTURE and not image_key:
+        names.append(image_file)
+    for name in names:
+        storage.delete(name)
+
+
+def collect_orphans(storage, grace=3600):
+    """Delete stored pictures no guide refers to; returns their names.
+
+    Files younger than ``grace`` seconds are kept, since a picture being
+    rendered is written before the guide is switched to it.
+    """
+    from travelbook import db
+    from travelbook.models import Guide
+
+    keys, files = set(), set()
+    for image_key, image_file in db.session.query(Guide.image_key, Guide.image_file):
+        keys.add(image_key)
+        files.add(image_file)
+    cutoff = time.time() - grace
+    removed = []
+    for name, modified in list(storage.list()):
+        if name.startswith('default') or modified > cutoff:
+            continue
+        if name in files or name.split('-', 1)[0] in keys:
+            continue
+        storage.delete(name)
+        removed.append(name)
+    return removed
+
+
+# ----------------------------------------------------------------#
+# Scheduling (runs in the web process)
+# ----------------------------------------------------------------#
+def _pool(app, storage):
+    global _executor, _executor_pid, _threads
+    if storage.in_process:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(max_workers=1)
+        return _threads
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ProcessPoolExecutor(max_workers=app.config.get('IMAGE_WORKERS', 2),
+                                        mp_context=multiprocessing.get_context('spawn'))
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def set_picture(guide, key):
+    guide.image_key = key
+    guide.image_file = picture_filename(key, PICTURE_SIZES['card'])
+
+
+def switch_picture(guide, key, storage):
+    """Show ``key`` for ``guide`` and remove the files of the picture it replaces."""
+    old_key, old_file = guide.image_key, guide.image_file
+    set_picture(guide, key)
+    guide.update()
+    if old_key != key:
+        remove_pictures(guide.id, old_key, old_file, storage)
+
+
+def _picture_ready(app, guide_id, key, source, future):
+    from travelbook.models import Guide
+
+    try:
+        os.remove(source)
+    except OSError:
+        pass
+    if future.exception() is not None:
+        app.logger.error('Processing picture %s failed: %s', key, future.exception())
+        return
+    with app.app_context():
+        guide = Guide.query.get(guide_id)
+        if guide is not None:
+            switch_picture(guide, key, media.backend)
+
+
+def save_picture(guide, form_picture):
+    """Store an uploaded profile picture for ``guide``.
+
+    The upload is streamed to a temporary file, up to ``UPLOAD_MAX_SIZE``
+    bytes, and only its header is read here. Files are named after a hash
+    of their content, so re-uploading a known picture switches to the
+    existing variants at once. Anything new is resized in a process pool
+    and written to the media storage; the guide's picture is swapped, and
+    the old files removed, once the variants are stored. Returns True if
+    the picture was applied immediately. Raises
+    :class:`~travelbook.storage.UploadTooLarge` or :class:`InvalidPicture`.
+    """
+    app = current_app._get_current_object()
+    storage = media.backend
+    source, digest, _ = spool_upload(form_picture.stream, app.config['UPLOAD_MAX_SIZE'])
+    key = content_key(digest)
+    try:
+        check_picture(source)
+        known = variants_exist(storage, key)
+    except BaseException:
+        os.remove(source)
+        raise
+    if known:
+        os.remove(source)
+        switch_picture(guide, key, storage)
+        return True
+    future = _pool(app, storage).submit(render_variants, source, storage, key)
+    future.add_done_callback(partial(_picture_ready, app, guide.id, key, source))
+    return False
+
+
+# ----------------------------------------------------------------#
+# Template helpers
+# ----------------------------------------------------------------#
+def picture_key(guide):
+    if guide.image_key:
+        return guide.image_key
+    if guide.image_file == DEFAULT_PICTURE:
+        return 'default'
+
+
+def picture_url(filename):
+    # The default pictures ship with the app; uploads live in the media storage
+    if filename.startswith('default'):
+        return assets.url('profile_pics/' + filename)
+    return media.url(filename)
+
+
+def picture_srcset(key, ext='jpg'):
+    return ', '.join('{} {}w'.format(picture_url(picture_filename(key, width, ext)), width)
+                     for width in sorted(PICTURE_SIZES.values()))
@@ -0,0 +1,118 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from travelbook import db, media, page_cache
+from travelbook.guides.images import remove_pictures
+from travelbook.pagination import forget_count
+from travelbook.travels.tags import forget_facets, release_tags
+
+_executor = None
+_executor_pid = None
+
+
+# ----------------------------------------------------------------#
+# Deleting (runs in the web process or the purge thread)
+# ----------------------------------------------------------------#
+def delete_travels(guide_id, batch):
+    """Delete up to ``batch`` of the guide's newest travels; returns how many went."""
+    from travelbook.models import Travel
+
+    ids = [i for i, in db.session.query(Travel.id)
+           .filter(Travel.guide_id == guide_id)
+           .order_by(Travel.id.desc())
+           .limit(batch)]
+    if ids:
+        release_tags(ids)
+        Travel.query.filter(Travel.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        forget_count(('travels', guide_id))
+        forget_facets()
+        page_cache.invalidate('travels', 'guides')
+    return len(ids)
+
+
+def hard_delete(guide_id, storage=None):
+    """Delete a guide and all their travels with two set-based statements."""
+    from travelbook.models import Guide, Travel
+
+    storage = storage or media.backend
+    picture = db.session.query(Guide.image_key, Guide.image_file)\
+        .filter(Guide.id == guide_id).first()
+    # travel.guide_id cascades on delete; the explicit statement also covers
+    # SQLite, which leaves foreign keys unenforced by default
+    release_tags(db.session.query(Travel.id).filter(Travel.guide_id == guide_id).subquery())
+    Travel.query.filter(Travel.guide_id == guide_id).delete(synchronize_session=False)
+    Guide.query.filter(Guide.id == guide_id).delete(synchronize_session=False)
+    db.session.commit()
+    forget_count(('travels', guide_id))
+    forget_facets()
+    page_cache.invalidate('guides', 'travels')
+    if picture is not None:
+        remove_pictures(guide_id, picture.image_key, picture.image_file, storage)
+
+
+def purge_guide(guide_id, batch=500, pause=0.0, storage=None):
+    """Delete a soft-deleted guide's travels ``batch`` at a time, then the guide.
+
+    Newest travels go first, so the feed clears before the archive. Each
+    batch is its own transaction, with ``pause`` seconds between batches.
+    """
+    deleted = 0
+    while True:
+        count = delete_travels(guide_id, batch)
+        deleted += count
+        if count < batch:
+            break
+        if pause:
+            time.sleep(pause)
+    hard_delete(guide_id, storage)
+    return deleted
+
+
+def purge_deleted_guides(batch=500, pause=0.0):
+    """Purge every soft-deleted guide, e.g. ones left over by a restarted worker."""
+    from travelbook.models import Guide
+
+    ids = [i for i, in db.session.query(Guide.id).filter(Guide.deleted_at.isnot(None))]
+    for guide_id in ids:
+        purge_guide(guide_id, batch, pause)
+    return ids
+
+
+# ----------------------------------------------------------------#
+# Scheduling (runs in the web process)
+# ----------------------------------------------------------------#
+def _pool():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        # One purge at a time per process keeps the load on the database flat
+        _executor = ThreadPoolExecutor(max_workers=1)
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _purge_in_background(app, guide_id):
+    with app.app_context():
+        try:
+            purge_guide(guide_id, app.config.get('GUIDE_PURGE_BATCH', 500),
+                        app.config.get('GUIDE_PURGE_PAUSE', 0.05))
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Purging guide %s failed; run manage.py purge_guides', guide_id)
+
+
+def soft_delete(guide_id):
+    """Hide a guide at once and purge their travels and pictures in the background.
+
+    Only the guide row is touched in the request. Their travels stay
+    readable until the purge reaches them. Returns the purge's future.
+    """
+    from travelbook.models import Guide
+
+    Guide.query.filter(Guide.id == guide_id)\
+        .update({'deleted_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    page_cache.invalidate('guides', 'travels')
+    return _pool().submit(_purge_in_background, current_app._get_current_object(), guide_id)
@@ -1,22 +1,39 @@
 from flask import render_template, url_for, flash, redirect, request, abort, Blueprint
 from flask_login import login_user, current_user, logout_user, login_required
-from travelbook import db, bcrypt
+from travelbook import db, hasher, page_cache, rate_limiter
 from travelbook.models import Guide, Travel
 from travelbook.guides.forms import (GuideForm, RegistrationForm, LoginForm,
                                         RequestResetForm, ResetPasswordForm)
-from travelbook.guides.utils import save_picture, send_reset_email
+from travelbook.guides.utils import send_reset_email
+from travelbook.guides.images import (InvalidPicture, save_picture, picture_key, picture_url,
+                                      picture_srcset)
+from travelbook.pagination import paginate_keyset, cached_count
+from travelbook.database import read_replica
+from travelbook.passwords import HasherBusy
+from travelbook.ratelimit import form_email
+from travelbook.responses import compressed, stream_template
+from travelbook.storage import UploadTooLarge
+from travelbook.queries import (guide_directory_query, guide_profile_query, guide_summaries,
+                                guide_trips_query, guide_travels_query, query_budget)
 
 
 guides = Blueprint('guides', __name__)
+guides.add_app_template_global(picture_key)
+guides.add_app_template_global(picture_url)
+guides.add_app_template_global(picture_srcset)
 
 
 @guides.route('/register', methods=['GET', 'POST'])
+@rate_limiter.limit('register_ip', '10/hour')
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        try:
+            hashed_password = hasher.hash(form.password.data)
+        except HasherBusy:
+            abort(503)
         guide = Guide(name = form.name.data,
                     surname = form.surname.data,
                     phone = form.phone.data,
@@ -32,13 +49,21 @@ def register():
 
 
 @guides.route('/login', methods=['GET', 'POST'])
+@rate_limiter.limit('login_ip', '30/minute')
+@rate_limiter.limit('login_email', '5/minute', key=form_email)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
     form = LoginForm()
     if form.validate_on_submit():
-        user = Guide.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        user = Guide.active().filter_by(email=form.email.data).first()
+        try:
+            valid = user is not None and hasher.check(user.password, form.password.data)
+            if valid and hasher.needs_rehash(user.password):
+                user.set_password(hasher.hash(form.password.data))
+        except HasherBusy:
+            abort(503)
+        if valid:
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
             flash('You have been logged in!', 'success')
@@ -60,8 +85,12 @@ def account():
     form = GuideForm()
     if form.validate_on_submit():
         if form.picture.data:
-            picture_file = save_picture(form.picture.data)
-            current_user.image_file = picture_file
+            try:
+                if not save_picture(current_user, form.picture.data):
+                    flash('Your new picture will appear in a moment.', 'info')
+            except (UploadTooLarge, InvalidPicture) as e:
+                form.picture.errors.append(str(e))
+                return render_template('account.html', title='Account', form=form)
         current_user.name = form.name.data
         current_user.surname = form.surname.data
         current_user.phone = form.phone.data
@@ -74,36 +103,43 @@ def account():
         form.surname.data = current_user.surname
         form.phone.data = current_user.phone
         form.email.data = current_user.email
-    image_file = url_for('static', filename='profile_pics/' + current_user.image_file)
-    return render_template('account.html', title='Account', image_file=image_file, form=form)
+    return render_template('account.html', title='Account', form=form)
 
 #  All Guides
 # ----------------------------------------------------------------#
 @guides.route('/guides')
+@compressed
+@page_cache.cached('guides')
+@query_budget(2)
+@read_replica
 def all_guides():
     try:
-        guides=Guide.query.all()
-        for guide in guides:
-            guide.image_file = url_for('static', filename='profile_pics/' + guide.image_file)
+        guides = paginate_keyset(guide_directory_query(), Guide.id, per_page=12,
+                                 after=request.args.get('after'),
+                                 before=request.args.get('before'))
     except Exception:
         abort(404)
-    return render_template('guides.html', guides=guides, title='Guides')
+    summaries = guide_summaries([guide.id for guide in guides.items])
+    return stream_template('guides.html', guides=guides, summaries=summaries, title='Guides')
 
 # Show Guide
 # ----------------------------------------------------------------#
 @guides.route('/guides/<guide_id>')
+@compressed
+@page_cache.cached('guides')
+@query_budget(3)
+@read_replica
 def show_guide(guide_id):
-    guide = Guide.query.get_or_404(guide_id)
-    travels = Travel.query.filter_by(guide_id=guide.id).all()
-    guide.image_file = url_for('static', filename='profile_pics/' + guide.image_file)
+    guide = guide_profile_query().filter(Guide.id == guide_id).first_or_404()
+    travels = guide_trips_query(guide.id).all()
     title = 'Guide ' + guide.name + ' ' + guide.surname
-    return render_template('show_guide.html', guide=guide, travels=travels, title=title)
+    return stream_template('show_guide.html', guide=guide, travels=travels, title=title)
 
 # Delete Guide
 # ----------------------------------------------------------------#
 @guides.route('/guides/<guide_id>', methods=['POST', 'DELETE'])
 def delete_guide(guide_id):
-    guide = Guide.query.get_or_404(guide_id)
+    guide = Guide.active().filter(Guide.id == guide_id).first_or_404()
     try:
         guide.delete()
         flash('Deleted!', 'success')
@@ -114,25 +150,33 @@ def delete_guide(guide_id):
 # Only Guide's travels
 # ----------------------------------------------------------------#
 @guides.route("/my_travels")
+@compressed
 @login_required
+@query_budget(3)
 def guide_travels():
-    page = request.args.get('page', 1, type=int)
     guide = current_user
-    travels = Travel.query.filter_by(guide=guide)\
-        .order_by(Travel.id.desc())\
-        .paginate(page=page, per_page=3)
-    return render_template('guide_travels.html', travels=travels, guide=guide)
+    query = guide_travels_query(guide.id)
+    try:
+        travels = paginate_keyset(query, Travel.id, per_page=3,
+                                  after=request.args.get('after'),
+                                  before=request.args.get('before'),
+                                  total=lambda: cached_count(query, ('travels', guide.id)))
+    except Exception:
+        abort(404)
+    return stream_template('guide_travels.html', travels=travels, guide=guide)
 
 # ----------------------------------------------------------------#
 # Password reset
 # ----------------------------------------------------------------#
 @guides.route("/reset_password", methods=['GET', 'POST'])
+@rate_limiter.limit('reset_ip', '5/minute')
+@rate_limiter.limit('reset_email', '3/hour', key=form_email)
 def reset_request():
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
     form = RequestResetForm()
     if form.validate_on_submit():
-        user = Guide.query.filter_by(email=form.email.data).first()
+        user = Guide.active().filter_by(email=form.email.data).first()
         send_reset_email(user)
         flash('An email has been sent with instructions to reset your password.', 'info')
         return redirect(url_for('guides.login'))
@@ -140,6 +184,7 @@ def reset_request():
 
 
 @guides.route("/reset_password/<token>", methods=['GET', 'POST'])
+@rate_limiter.limit('reset_token_ip', '10/minute')
 def reset_token(token):
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
@@ -149,8 +194,10 @@ def reset_token(token):
         return redirect(url_for('guides.reset_request'))
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
-        user.password = hashed_password
+        try:
+            user.password = hasher.hash(form.password.data)
+        except HasherBusy:
+            abort(503)
         try:
             user.update()
             flash('Your password has been updated! You are now able to log in', 'success')
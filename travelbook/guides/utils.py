@@ -1,34 +1,12 @@
-import os
-import secrets
-from PIL import Image
 from flask import url_for
-from flask_mail import Message
-from travelbook import mail, app
-
-
-
-def save_picture(form_picture):
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    picture_path = os.path.join(app.root_path, 'static/profile_pics', picture_fn)
-# If we want just save picture:
-    # form_picture.save(picture_path)
-
-# This will resize picture (don't forget to install Pillow):
-    output_size = (125, 125)
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
-    i.save(picture_path)
-
-    return picture_fn
-
+from travelbook import mail_dispatcher
 
 
 # ----------------------------------------------------------------#
 # Send email
 # ----------------------------------------------------------------#
 def send_reset_email(user):
+    from flask_mail import Message
     token = user.get_reset_token()
     msg = Message('Password Reset Request',
                   sender='jurgita.codes@mail.com',
@@ -37,4 +15,4 @@ def send_reset_email(user):
 {url_for('guides.reset_token', token=token, _external=True)}
 If you did not make this request then simply ignore this email and no changes will be made.
 '''
-    mail.send(msg)
+    mail_dispatcher.send(msg)
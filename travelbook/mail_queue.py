@@ -0,0 +1,341 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from flask import current_app
+from travelbook.metrics import Histogram
+
+
+# Seconds from send() to delivery, retries included
+DELIVERY_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+PAYLOAD_KEYS = {'subject', 'sender', 'recipients', 'body', 'html', 'enqueued_at', 'attempts'}
+
+
+class MailQueue:
+    """One app's spool, queue and worker thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self._pid = None
+        self._queue = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latencies = deque(maxlen=1000)
+        self.latency = Histogram(DELIVERY_BUCKETS)
+        # Retries waiting out their backoff
+        self._timers = set()
+
+    def send(self, msg):
+        """Spool ``msg`` and return immediately; the worker delivers it."""
+        payload = {
+            'subject': msg.subject,
+            'sender': msg.sender,
+            'recipients': msg.recipients,
+            'body': msg.body,
+            'html': msg.html,
+            'enqueued_at': time.time(),
+            'attempts': 0,
+        }
+        self.ensure_started()
+        path = self._spool(payload)
+        claimed = self._claim(path)
+        if claimed is not None:
+            self._offer(claimed, payload)
+
+    def join(self, timeout=None, cancel_retries=False):
+        """Block until every queued message was delivered or given up on.
+
+        Messages waiting to be retried count as queued. With
+        ``cancel_retries`` their retries are cancelled instead and the
+        messages go back to the spool for the next process to start.
+        """
+        if cancel_retries:
+            self.cancel_retries()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._busy():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def cancel_retries(self):
+        with self._lock:
+            timers, self._timers = self._timers, set()
+        for timer in timers:
+            timer.cancel()
+            self._release(timer.args[0])
+
+    def _busy(self):
+        # A retry moves from _timers to the queue under the lock
+        with self._lock:
+            return bool(self._timers or self._queue is not None and self._queue.unfinished_tasks)
+
+    def stats(self):
+        latencies = list(self.latencies)
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'spooled': len(self._pending_files()),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_max': max(latencies) if latencies else 0.0,
+        }
+
+    # ----------------------------------------------------------------#
+    # Spool
+    # ----------------------------------------------------------------#
+    @property
+    def spool_dir(self):
+        return self.app.config['MAIL_SPOOL_DIR']
+
+    def _spool(self, payload):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        name = '{:020d}-{}.json'.format(time.time_ns(), uuid.uuid4().hex)
+        path = os.path.join(self.spool_dir, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(payload, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        return path
+
+    def _claim(self, path):
+        claimed = '{}.{}'.format(path, os.getpid())
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _release(self, claimed):
+        os.rename(claimed, claimed.rsplit('.', 1)[0])
+
+    def _pending_files(self):
+        try:
+            names = os.listdir(self.spool_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(self.spool_dir, n) for n in names if n.endswith('.json'))
+
+    def _recover(self):
+        """Release messages claimed by dead processes, then claim pending ones."""
+        try:
+            names = os.listdir(self.spool_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            base, _, pid = name.rpartition('.')
+            if base.endswith('.json') and pid.isdigit() and not _pid_alive(int(pid)):
+                try:
+                    self._release(os.path.join(self.spool_dir, name))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    self.app.logger.exception('Could not release spooled mail %s', name)
+        for path in self._pending_files():
+            if self._queue.full():
+                break
+            claimed = self._claim(path)
+            if claimed is None:
+                continue
+            payload = self._load(claimed)
+            if payload is not None:
+                self._offer(claimed, payload)
+
+    def _load(self, claimed):
+        """The message in a claimed spool file; unreadable files are set aside."""
+        try:
+            with open(claimed) as f:
+                payload = json.load(f)
+            if not isinstance(payload, dict) or not PAYLOAD_KEYS <= payload.keys():
+                raise ValueError('not a spooled message')
+        except (OSError, ValueError) as e:
+            self.app.logger.error('Setting aside spooled mail %s: %s', claimed, e)
+            self._set_aside(claimed)
+            return None
+        return payload
+
+    def _set_aside(self, claimed):
+        # <id>.json.<pid> -> <id>.failed, kept for a person to look at
+        try:
+            os.replace(claimed, claimed.rsplit('.', 2)[0] + '.failed')
+        except OSError:
+            self.app.logger.exception('Could not set aside spooled mail %s', claimed)
+
+    def _offer(self, claimed, payload):
+        try:
+            self._queue.put_nowait((claimed, payload))
+        except queue.Full:
+            # Stays in the spool; picked up by _recover once the queue drains
+            self._release(claimed)
+
+    # ----------------------------------------------------------------#
+    # Worker
+    # ----------------------------------------------------------------#
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.app.config['MAIL_QUEUE_SIZE'])
+            # A forked worker inherits the parent's timers but not their threads
+            self._timers = set()
+            thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _next(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self._serve()
+                except Exception:
+                    # A spool or configuration error must not stop mail for good
+                    self.app.logger.exception('Mail dispatcher failed, restarting it')
+                    time.sleep(self.app.config['MAIL_QUEUE_BACKOFF'])
+
+    def _serve(self):
+        idle = self.app.config['MAIL_QUEUE_IDLE_TIMEOUT']
+        self._recover()
+        mail = self._mail()
+        while True:
+            item = self._next(timeout=idle)
+            if item is None:
+                self._recover()
+                continue
+            try:
+                with mail.connect() as connection:
+                    while item is not None:
+                        self._deliver(connection, *item)
+                        item = self._next(timeout=idle)
+            except Exception as e:
+                if item is not None:
+                    self._retry(item, e)
+
+    def _mail(self):
+        # Flask-Mail (and the email package) is only imported by the worker
+        mail = self.app.extensions.get('mail')
+        if mail is None:
+            from flask_mail import Mail
+            mail = Mail(self.app)
+        return mail
+
+    def _deliver(self, connection, claimed, payload):
+        from flask_mail import Message
+        sender = payload['sender']
+        connection.send(Message(subject=payload['subject'],
+                                sender=tuple(sender) if isinstance(sender, list) else sender,
+                                recipients=payload['recipients'],
+                                body=payload['body'],
+                                html=payload['html']))
+        os.remove(claimed)
+        self.sent += 1
+        latency = time.time() - payload['enqueued_at']
+        self.latencies.append(latency)
+        self.latency.observe(latency)
+        self._queue.task_done()
+
+    def _retry(self, item, error):
+        claimed, payload = item
+        payload['attempts'] += 1
+        try:
+            if payload['attempts'] > self.app.config['MAIL_QUEUE_RETRIES']:
+                self.failed += 1
+                self.app.logger.error('Giving up on mail to %s: %s', payload['recipients'], error)
+                self._set_aside(claimed)
+                return
+            self.retried += 1
+            delay = self.app.config['MAIL_QUEUE_BACKOFF'] * 2 ** (payload['attempts'] - 1)
+            self.app.logger.warning('Mail to %s failed (%s), retrying in %.1fs',
+                                    payload['recipients'], error, delay)
+            with open(claimed, 'w') as f:
+                json.dump(payload, f)
+            timer = threading.Timer(delay, self._requeue, (claimed, payload))
+            timer.daemon = True
+            with self._lock:
+                self._timers.add(timer)
+            timer.start()
+        finally:
+            # Only now, so join() never sees the message neither queued nor waiting
+            self._queue.task_done()
+
+    def _requeue(self, claimed, payload):
+        with self._lock:
+            timer = threading.current_thread()
+            # Unless cancel_retries() got to it first
+            if timer in self._timers:
+                self._timers.discard(timer)
+                self._offer(claimed, payload)
+
+
+# ----------------------------------------------------------------#
+# Extension
+# ----------------------------------------------------------------#
+class MailDispatcher:
+    """Sends Flask-Mail messages from a background thread.
+
+    Every message is first written to an on-disk spool, so nothing is lost if
+    the process dies, and then handed to a bounded in-memory queue. A single
+    worker thread per process drains the queue over one SMTP connection that
+    is kept open while mail keeps arriving and closed after
+    ``MAIL_QUEUE_IDLE_TIMEOUT`` seconds of quiet. Failed deliveries are
+    retried with exponential backoff; messages given up on, and spool files
+    that cannot be read, are renamed to ``<id>.failed``.
+
+    Spool files are named ``<id>.json`` while pending and
+    ``<id>.json.<pid>`` once a process has claimed them, so several gunicorn
+    workers can share one spool directory without sending twice. Each app
+    gets its own :class:`MailQueue`.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_QUEUE_SIZE', 1000)
+        app.config.setdefault('MAIL_QUEUE_RETRIES', 5)
+        app.config.setdefault('MAIL_QUEUE_BACKOFF', 2.0)
+        app.config.setdefault('MAIL_QUEUE_IDLE_TIMEOUT', 30.0)
+        app.config.setdefault('MAIL_SPOOL_DIR', os.path.join(app.instance_path, 'mail_spool'))
+        mail_queue = MailQueue(app)
+        app.extensions['mail_dispatcher'] = mail_queue
+        app.before_first_request(mail_queue.ensure_started)
+
+    @property
+    def queue(self):
+        return current_app.extensions['mail_dispatcher']
+
+    def send(self, msg):
+        """Spool ``msg`` and return immediately; the worker delivers it."""
+        self.queue.send(msg)
+
+    def join(self, timeout=None, cancel_retries=False):
+        """Block until every queued message was delivered or given up on."""
+        return self.queue.join(timeout, cancel_retries)
+
+    def stats(self):
+        return self.queue.stats()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
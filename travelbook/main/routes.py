@@ -1,5 +1,13 @@
-from flask import render_template, request, abort, Blueprint
+import time
+from flask import render_template, request, abort, jsonify, Blueprint
+from sqlalchemy import false, text
+from travelbook import db, page_cache
+from travelbook.database import read_replica
 from travelbook.models import Travel
+from travelbook.pagination import paginate_keyset
+from travelbook.queries import feed_query, query_budget
+from travelbook.responses import compressed, stream_template
+from travelbook.travels.tags import MAX_TAGS, facet_counts, parse_tags, tagged, tags_by_name
 
 
 main = Blueprint('main', __name__)
@@ -8,15 +16,49 @@ main = Blueprint('main', __name__)
 @main.route('/')
 @main.route('/home')
 @main.route('/travels')
+@compressed
+@page_cache.cached('travels')
+@query_budget(4)
+@read_replica
 def home():
+    names = parse_tags(request.args.getlist('tag'))[:MAX_TAGS]
+    match = 'any' if request.args.get('match') == 'any' else 'all'
+    query = feed_query()
+    if names:
+        tags = tags_by_name(names)
+        if not tags or (match == 'all' and len(tags) < len(names)):
+            query = query.filter(false())
+        else:
+            query = tagged(query, tags, match_all=match == 'all')
     try:
-        page = request.args.get('page', 1, type=int)
-        travels=Travel.query.order_by(Travel.id.desc()).paginate(page=page, per_page=3)
+        travels = paginate_keyset(query, Travel.id, per_page=3,
+                                  after=request.args.get('after'),
+                                  before=request.args.get('before'))
     except Exception:
         abort(404)
-    return render_template('home.html', travels=travels)
+    return stream_template('home.html', travels=travels, selected=names, match=match,
+                           facets=facet_counts())
 
 
 @main.route('/about')
 def about():
     return render_template('about.html', title='About')
+
+
+@main.route('/health')
+def health():
+    """SELECT 1 on the primary and every replica; 503 if any fails."""
+    checks, healthy = {}, True
+    for name, engine in db.engines():
+        start = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception as e:
+            checks[name] = {'ok': False, 'error': str(e)}
+            healthy = False
+            continue
+        checks[name] = {'ok': True, 'ms': round((time.perf_counter() - start) * 1000, 2)}
+    pool = db.engine.pool
+    checks['pool'] = pool.status() if hasattr(pool, 'status') else None
+    return jsonify(status='ok' if healthy else 'error', checks=checks), 200 if healthy else 503
@@ -0,0 +1,270 @@
+import bisect
+import hmac
+import ipaddress
+import threading
+import time
+from flask import (abort, before_render_template, current_app, g, has_request_context, request,
+                   template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from travelbook.responses import after_body
+
+
+# Seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus bucket layout."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Return ``[(upper_bound, cumulative_count), ...]``, ``sum`` and ``count``."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+
+class Counter:
+    """Monotonic counter."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+# Queries per request and response bytes
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class MetricFamilies:
+    """One app's metrics, by name and then by sorted label pairs."""
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, factory, **labels):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is None or key not in family:
+            with self._lock:
+                family = self._families.setdefault(name, {})
+                family.setdefault(key, factory())
+        return family[key]
+
+    def items(self):
+        with self._lock:
+            return sorted((name, list(family.items())) for name, family in self._families.items())
+
+
+# ----------------------------------------------------------------#
+# Request instrumentation
+# ----------------------------------------------------------------#
+class RequestMetrics:
+    """Per-endpoint timings exported in Prometheus text format at ``/metrics``.
+
+    Records request latency, status codes, SQL statement count and time
+    (from SQLAlchemy engine events, so replicas are included), Jinja render
+    time per template and response size. Requests slower than
+    ``METRICS_SLOW_REQUEST`` seconds are logged with the statements they ran.
+    Password hasher and mail queue statistics are exported alongside.
+    Metrics are kept per app in ``app.extensions['metrics']``.
+
+    ``/metrics`` answers only requests from ``METRICS_ALLOWED_NETWORKS``
+    (e.g. ``['10.0.0.0/8']``) or with ``Authorization: Bearer`` set to
+    ``METRICS_TOKEN``; anyone else gets a 404.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_SLOW_REQUEST', 1.0)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_ALLOWED_NETWORKS', [])
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        _listen_to_engines()
+        app.extensions['metrics'] = MetricFamilies()
+
+    @property
+    def families(self):
+        return current_app.extensions['metrics']
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, **labels):
+        return self.families.get(name, lambda: Histogram(buckets), **labels)
+
+    def counter(self, name, **labels):
+        return self.families.get(name, Counter, **labels)
+
+    # ----------------------------------------------------------------#
+    # Hooks
+    # ----------------------------------------------------------------#
+    def _start(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = []
+        g.metrics_templates = []
+
+    def _finish(self, response):
+        after_body(response, self._record)
+        return response
+
+    def _record(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        queries = g.pop('metrics_queries', [])
+        sql_time = sum(duration for _, duration in queries)
+        self.histogram('request_duration_seconds', endpoint=endpoint,
+                       method=request.method).observe(elapsed)
+        self.counter('requests_total', endpoint=endpoint, method=request.method,
+                     status=str(response.status_code)).inc()
+        self.histogram('request_sql_queries', QUERY_BUCKETS, endpoint=endpoint).observe(len(queries))
+        self.histogram('request_sql_duration_seconds', endpoint=endpoint).observe(sql_time)
+        size = g.get('stream_bytes') if response.is_streamed else response.content_length
+        if size is not None:
+            self.histogram('response_size_bytes', SIZE_BUCKETS, endpoint=endpoint).observe(size)
+        if elapsed >= current_app.config['METRICS_SLOW_REQUEST']:
+            self.counter('slow_requests_total', endpoint=endpoint).inc()
+            current_app.logger.warning(
+                'Slow request %s %s: %.3fs, %d queries in %.3fs\n%s',
+                request.method, request.full_path, elapsed, len(queries), sql_time,
+                '\n'.join('{:8.1f}ms  {}'.format(duration * 1000, statement)
+                          for statement, duration in queries))
+
+    def _template_started(self, sender, template, context, **extra):
+        if 'metrics_templates' in g:
+            g.metrics_templates.append(time.perf_counter())
+
+    def _template_finished(self, sender, template, context, **extra):
+        if g.get('metrics_templates'):
+            elapsed = time.perf_counter() - g.metrics_templates.pop()
+            self.histogram('template_render_seconds',
+                           template=template.name or 'string').observe(elapsed)
+
+    # ----------------------------------------------------------------#
+    # Export
+    # ----------------------------------------------------------------#
+    def _allowed(self):
+        config = current_app.config
+        token = config['METRICS_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('Authorization', ''),
+                                         'Bearer ' + token):
+            return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in ipaddress.ip_network(network)
+                   for network in config['METRICS_ALLOWED_NETWORKS'])
+
+    def export(self):
+        if not self._allowed():
+            abort(404)
+        lines = []
+        for name, family in self.families.items():
+            kind = 'histogram' if isinstance(family[0][1], Histogram) else 'counter'
+            _write_family(lines, name, kind, family)
+        hasher = current_app.extensions.get('password_hasher')
+        if hasher is not None:
+            _write_family(lines, 'password_hasher_seconds', 'histogram',
+                          [((('operation', op),), h) for op, h in sorted(hasher.latency.items())])
+            lines.append('travelbook_password_hasher_rejected_total {}'.format(hasher.rejected))
+        rejected = current_app.extensions.get('rate_limit_rejected')
+        if rejected is not None:
+            _write_family(lines, 'rate_limited_total', 'counter',
+                          [((('scope', scope),), counter)
+                           for scope, counter in sorted(rejected.items())])
+        dispatcher = current_app.extensions.get('mail_dispatcher')
+        if dispatcher is not None:
+            stats = dispatcher.stats()
+            for key in ('queue_depth', 'spooled'):
+                lines.append('# TYPE travelbook_mail_{} gauge'.format(key))
+                lines.append('travelbook_mail_{} {}'.format(key, stats[key]))
+            for key in ('sent', 'failed', 'retried'):
+                lines.append('# TYPE travelbook_mail_{}_total counter'.format(key))
+                lines.append('travelbook_mail_{}_total {}'.format(key, stats[key]))
+            _write_family(lines, 'mail_delivery_seconds', 'histogram', [((), dispatcher.latency)])
+        return current_app.response_class('\n'.join(lines) + '\n',
+                                          mimetype='text/plain; version=0.0.4')
+
+
+def _labels(key, **extra):
+    pairs = list(key) + sorted(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+def _write_family(lines, name, kind, items):
+    name = 'travelbook_' + name
+    lines.append('# TYPE {} {}'.format(name, kind))
+    for key, metric in items:
+        if kind == 'counter':
+            lines.append('{}{} {}'.format(name, _labels(key), metric.value))
+            continue
+        buckets, total, count = metric.snapshot()
+        for bound, cumulative in buckets:
+            lines.append('{}_bucket{} {}'.format(name, _labels(key, le=_bound(bound)), cumulative))
+        lines.append('{}_sum{} {}'.format(name, _labels(key), total))
+        lines.append('{}_count{} {}'.format(name, _labels(key), count))
+
+
+# ----------------------------------------------------------------#
+# SQL timing
+# ----------------------------------------------------------------#
+_listening = False
+
+
+def _listen_to_engines():
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['metrics_query_start'].pop()
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries.append((statement, time.perf_counter() - start))
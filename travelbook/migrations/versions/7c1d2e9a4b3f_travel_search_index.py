@@ -0,0 +1,32 @@
+"""full-text search index on travel
+
+Revision ID: 7c1d2e9a4b3f
+Revises: 48579570fe05
+Create Date: 2026-10-18 09:12:41.218304
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d2e9a4b3f'
+down_revision = '48579570fe05'
+branch_labels = None
+depends_on = None
+
+
+# Must stay the same expression as travelbook.search.utils.SEARCH_DOCUMENT
+# so the planner can match queries to the expression index.
+SEARCH_DOCUMENT = "to_tsvector('english', title || ' ' || content)"
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE INDEX ix_travel_search ON travel USING gin ({})'.format(SEARCH_DOCUMENT))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX ix_travel_search')
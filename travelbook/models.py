@@ -1,11 +1,50 @@
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from travelbook import db, login_manager, app
+from flask import current_app, g
+from sqlalchemy.orm import make_transient_to_detached
+from travelbook import db, login_manager, page_cache
 from flask_login import UserMixin
+from travelbook.cache import app_cache
+from travelbook.guides.purge import hard_delete, soft_delete
+from travelbook.pagination import forget_count
+from travelbook.travels.tags import adjust_counts, forget_facets
+from travelbook.travels.utils import summarize
+
+
+# Everything the session identity needs; the password hash is left unloaded
+IDENTITY_COLUMNS = ('id', 'name', 'surname', 'phone', 'email', 'image_file', 'image_key')
+
+
+def identity_cache():
+    return app_cache('identity_cache', max_entries=10000)
 
 
 @login_manager.user_loader
 def load_user(guide_id):
-    return Guide.query.get(int(guide_id))
+    guide_id = int(guide_id)
+    values = identity_cache().get(guide_id)
+    if values is None:
+        row = db.session.query(*[getattr(Guide, c) for c in IDENTITY_COLUMNS])\
+            .filter(Guide.id == guide_id, Guide.deleted_at.is_(None)).first()
+        # Not charged to the view's query budget
+        g.identity_queries = g.get('identity_queries', 0) + 1
+        if row is None:
+            return None
+        values = dict(zip(IDENTITY_COLUMNS, row))
+        identity_cache().set(guide_id, values,
+                           timeout=current_app.config.get('IDENTITY_CACHE_TIMEOUT', 300))
+    guide = Guide(**values)
+    make_transient_to_detached(guide)
+    return db.session.merge(guide, load=False)
+
+
+@login_manager.request_loader
+def load_user_from_token(request):
+    """The guide named by an ``Authorization: Bearer`` token, on API routes only."""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if request.blueprint != 'api' or scheme.lower() != 'bearer':
+        return None
+    guide_id = Guide.verify_api_token(token.strip())
+    return load_user(guide_id) if guide_id is not None else None
 
 
 class Guide(db.Model, UserMixin):
@@ -15,8 +54,12 @@ class Guide(db.Model, UserMixin):
     phone = db.Column(db.String(20), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     image_file = db.Column(db.String(120), nullable=False, default='default.jpg')
+    image_key = db.Column(db.String(16))
     password = db.Column(db.String(60), nullable=False)
-    travels = db.relationship('Travel', backref='guide', lazy=True)
+    # Set by a soft delete; the guide is hidden until the purge removes the row
+    deleted_at = db.Column(db.DateTime, index=True)
+    # The database cascades deletes; the ORM never loads travels to do it
+    travels = db.relationship('Travel', backref='guide', lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f'<Guide: {self.name} {self.surname}>'
@@ -24,44 +67,151 @@ class Guide(db.Model, UserMixin):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        page_cache.invalidate('guides', 'travels')
 
     def update(self):
         db.session.commit()
+        # After the commit, so a concurrent load can't cache the old row again
+        identity_cache().delete(self.id)
+        page_cache.invalidate('guides', 'travels')
 
-    def delete(self):
-        db.session.delete(self)
+    def set_password(self, hashed):
+        """Store a new password hash without touching cached pages or identities.
+
+        Neither shows the hash, so unlike :meth:`update` nothing is invalidated.
+        """
+        Guide.query.filter_by(id=self.id).update({'password': hashed},
+                                                 synchronize_session=False)
         db.session.commit()
 
+    def delete(self, soft=None):
+        """Soft delete (``GUIDE_SOFT_DELETE``, the default) or delete outright.
+
+        Neither loads the guide's travels; see :mod:`travelbook.guides.purge`.
+        """
+        guide_id = self.id
+        if soft is None:
+            soft = current_app.config.get('GUIDE_SOFT_DELETE', True)
+        if soft:
+            soft_delete(guide_id)
+        else:
+            hard_delete(guide_id)
+        identity_cache().delete(guide_id)
+
+    @classmethod
+    def active(cls):
+        return cls.query.filter(cls.deleted_at.is_(None))
+
     def get_reset_token(self, expires_sec=1800):
-        s = Serializer(app.config['SECRET_KEY'], expires_sec)
+        s = Serializer(current_app.config['SECRET_KEY'], expires_sec)
         return s.dumps({'user_id': self.id}).decode('utf-8')
 
     @staticmethod
     def verify_reset_token(token):
-        s = Serializer(app.config['SECRET_KEY'])
+        s = Serializer(current_app.config['SECRET_KEY'])
         try:
             user_id = s.loads(token)['user_id']
         except:
             return None
-        return User.query.get(user_id)
+        return Guide.active().filter(Guide.id == user_id).first()
+
+    def get_api_token(self, expires_sec=3600):
+        # Salted apart from reset tokens, so neither passes for the other
+        s = Serializer(current_app.config['SECRET_KEY'], expires_sec, salt='api-token')
+        return s.dumps({'guide_id': self.id}).decode('utf-8')
+
+    @staticmethod
+    def verify_api_token(token):
+        """Id of the guide ``token`` was issued to, or None."""
+        s = Serializer(current_app.config['SECRET_KEY'], salt='api-token')
+        try:
+            return int(s.loads(token)['guide_id'])
+        except Exception:
+            return None
+
+
+# Links are looked up both ways: a travel's tags through the primary key,
+# a tag's travels newest first through (tag_id, travel_id)
+travel_tag = db.Table(
+    'travel_tag',
+    db.Column('travel_id', db.Integer, db.ForeignKey('travel.id', ondelete='CASCADE'),
+              primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'),
+              primary_key=True),
+    db.Index('ix_travel_tag_tag_id_travel_id', 'tag_id', 'travel_id'),
+)
+
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(40), unique=True, nullable=False)
+    # Facet count, kept up to date by Travel.insert/update/delete
+    travel_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+
+    def __repr__(self):
+        return f'<Tag: {self.name}>'
 
 
 class Travel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(40), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    guide_id = db.Column(db.Integer, db.ForeignKey('guide.id'), nullable=False)
+    # Kept in step with content by insert()/update() so listings never load it
+    excerpt = db.Column(db.String(300))
+    word_count = db.Column(db.Integer)
+    reading_time = db.Column(db.Integer)
+    guide_id = db.Column(db.Integer, db.ForeignKey('guide.id', ondelete='CASCADE'),
+                         nullable=False)
+    tags = db.relationship('Tag', secondary=travel_tag, lazy=True, order_by='Tag.name')
+
+    # A guide's travels newest first, and the guide_id lookups of deletes
+    __table_args__ = (db.Index('ix_travel_guide_id_id', 'guide_id', 'id'),)
 
     def __repr__(self):
         return f'<Travel: {self.title}>'
 
+    def summarize(self):
+        for field, value in summarize(self.content).items():
+            setattr(self, field, value)
+
     def insert(self):
+        self.summarize()
         db.session.add(self)
+        db.session.flush()
+        adjust_counts(self.tags, 1)
         db.session.commit()
+        forget_count(('travels', self.guide_id))
+        forget_facets()
+        page_cache.invalidate('travels', 'guides')
 
     def update(self):
+        if 'content' in db.inspect(self).committed_state or self.excerpt is None:
+            self.summarize()
+        added, _, removed = db.inspect(self).attrs.tags.history
+        db.session.flush()
+        adjust_counts(added or (), 1)
+        adjust_counts(removed or (), -1)
         db.session.commit()
+        forget_facets()
+        page_cache.invalidate('travels', 'guides')
 
     def delete(self):
+        adjust_counts(self.tags, -1)
         db.session.delete(self)
         db.session.commit()
+        forget_count(('travels', self.guide_id))
+        forget_facets()
+        page_cache.invalidate('travels', 'guides')
+
+
+class TravelStats(db.Model):
+    """View counts per travel, written in batches by :class:`travelbook.popularity.ViewCounter`."""
+    travel_id = db.Column(db.Integer, db.ForeignKey('travel.id', ondelete='CASCADE'),
+                          primary_key=True)
+    views = db.Column(db.BigInteger, nullable=False, default=0)
+    # Views halved every VIEW_SCORE_HALF_LIFE, as of scored_at (Unix time)
+    score = db.Column(db.Float, nullable=False, default=0)
+    scored_at = db.Column(db.Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<TravelStats: {self.travel_id} {self.views}>'
@@ -0,0 +1,108 @@
+import base64
+import binascii
+import json
+from travelbook.cache import app_cache
+
+
+# ----------------------------------------------------------------#
+# Cursors
+# ----------------------------------------------------------------#
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or not values:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+# ----------------------------------------------------------------#
+# Keyset pagination
+# ----------------------------------------------------------------#
+class KeysetPagination:
+    """One page of a listing ordered by a unique key, newest first.
+
+    Pages are addressed by opaque ``after``/``before`` cursors instead of
+    page numbers, so fetching any page is a single indexed range scan
+    (``WHERE id < :cursor ORDER BY id DESC LIMIT n``) and never needs an
+    OFFSET or a COUNT(*).
+    """
+
+    def __init__(self, items, key, per_page, has_prev, has_next, total=None):
+        self.items = items
+        self.key = key
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self._total = total
+
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            return encode_cursor([getattr(self.items[0], self.key)])
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            return encode_cursor([getattr(self.items[-1], self.key)])
+
+    @property
+    def total(self):
+        if callable(self._total):
+            self._total = self._total()
+        return self._total
+
+
+def paginate_keyset(query, column, per_page=3, after=None, before=None, total=None):
+    """Return a :class:`KeysetPagination` for ``query`` ordered by ``column``.
+
+    ``after`` / ``before`` are cursors taken from a previous page's
+    ``next_cursor`` / ``prev_cursor``. ``total`` may be a number or a
+    callable (e.g. a :func:`cached_count`) that is only evaluated if the
+    template asks for it.
+    """
+    query = query.order_by(None)
+    if before:
+        key = decode_cursor(before)[0]
+        rows = query.filter(column > key).order_by(column.asc()).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_next = True
+    else:
+        if after:
+            query = query.filter(column < decode_cursor(after)[0])
+        rows = query.order_by(column.desc()).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = bool(after)
+    return KeysetPagination(items, column.key, per_page, has_prev, has_next, total)
+
+
+# ----------------------------------------------------------------#
+# Cached counts
+# ----------------------------------------------------------------#
+def _counts():
+    return app_cache('cached_counts', max_entries=10000)
+
+
+def cached_count(query, key, timeout=300):
+    """COUNT(*) for ``query``, remembered under ``key`` for ``timeout`` seconds."""
+    counts = _counts()
+    value = counts.get(key)
+    if value is None:
+        value = query.order_by(None).count()
+        counts.set(key, value, timeout=timeout)
+    return value
+
+
+def forget_count(*keys):
+    counts = _counts()
+    for key in keys:
+        counts.delete(key)
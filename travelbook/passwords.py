@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from flask import current_app
+from travelbook.metrics import Histogram
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashes are already queued."""
+
+
+# ----------------------------------------------------------------#
+# bcrypt calls (run in the pool)
+# ----------------------------------------------------------------#
+def _hashpw(password, rounds):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(hashed, password):
+    import bcrypt
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def gevent_patched():
+    """True inside a gevent worker, where threads are greenlets."""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def hash_rounds(hashed):
+    """Work factor of a ``$2b$<rounds>$...`` hash, or None if unparsable."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+# ----------------------------------------------------------------#
+# Hasher
+# ----------------------------------------------------------------#
+class HasherPool:
+    """One app's executor, queue slots and latency figures."""
+
+    def __init__(self, app):
+        self.app = app
+        self.latency = {'hash': Histogram(), 'check': Histogram()}
+        self.rejected = 0
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        if self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._pid != os.getpid():
+                config = self.app.config
+                if config['HASHER_POOL'] == 'process':
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=config['HASHER_WORKERS'],
+                        mp_context=multiprocessing.get_context('spawn'))
+                elif config['HASHER_POOL'] == 'thread':
+                    self._executor = ThreadPoolExecutor(max_workers=config['HASHER_WORKERS'])
+                elif config['HASHER_POOL'] == 'gevent':
+                    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+                    self._executor = NativeThreadPoolExecutor(
+                        max_workers=config['HASHER_WORKERS'])
+                else:
+                    self._executor = None
+                self._slots = threading.BoundedSemaphore(config['HASHER_MAX_PENDING'])
+                self._pid = os.getpid()
+        return self._executor
+
+    def run(self, operation, fn, *args):
+        executor = self.executor()
+        if not self._slots.acquire(timeout=self.app.config['HASHER_QUEUE_TIMEOUT']):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        start = time.perf_counter()
+        try:
+            if executor is None:
+                return fn(*args)
+            return executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            self.latency[operation].observe(time.perf_counter() - start)
+
+
+class PasswordHasher:
+    """Runs bcrypt outside the request thread with bounded concurrency.
+
+    ``HASHER_POOL`` is ``'process'`` (default), ``'thread'``, ``'gevent'``
+    (gevent's pool of real OS threads; the default in gevent workers, where
+    patched threads would run bcrypt on the hub) or ``'inline'``. At most
+    ``HASHER_MAX_PENDING`` hashes may be queued or running per process;
+    callers beyond that wait up to ``HASHER_QUEUE_TIMEOUT`` seconds and then
+    get :class:`HasherBusy`, so a login burst is shed instead of starving
+    every other request. ``BCRYPT_LOG_ROUNDS`` sets the work factor for new
+    hashes; stored hashes with a different factor are reported by
+    :meth:`needs_rehash`. Each app gets its own :class:`HasherPool`.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('HASHER_POOL', 'gevent' if gevent_patched() else 'process')
+        # Every gunicorn worker has its own pool, so a couple of hashers each
+        # is already more bcrypt than the CPUs can run at once
+        app.config.setdefault('HASHER_WORKERS', min(2, os.cpu_count() or 1))
+        app.config.setdefault('HASHER_MAX_PENDING', 4 * app.config['HASHER_WORKERS'])
+        app.config.setdefault('HASHER_QUEUE_TIMEOUT', 5.0)
+        app.extensions['password_hasher'] = HasherPool(app)
+
+    @property
+    def pool(self):
+        return current_app.extensions['password_hasher']
+
+    def hash(self, password):
+        return self.pool.run('hash', _hashpw, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+    def check(self, hashed, password):
+        return self.pool.run('check', _checkpw, hashed, password)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != current_app.config['BCRYPT_LOG_ROUNDS']
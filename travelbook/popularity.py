@@ -0,0 +1,233 @@
+import atexit
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+
+# One row per travel and flush. The score is decayed to the flush time
+# before the new hits are added, so it always means "hits, halved every
+# half-life". Travels deleted since the hit are skipped by the SELECT.
+UPSERT = text('''
+    INSERT INTO travel_stats (travel_id, views, score, scored_at)
+    SELECT id, :hits, :hits, :now FROM travel WHERE id = :travel_id
+    ON CONFLICT (travel_id) DO UPDATE SET
+        views = travel_stats.views + excluded.views,
+        score = travel_stats.score
+                * power(0.5, (excluded.scored_at - travel_stats.scored_at) / :half_life)
+                + excluded.score,
+        scored_at = excluded.scored_at
+''')
+
+RANKING = text('''
+    SELECT travel_id, views FROM travel_stats
+    WHERE scored_at > :since
+    ORDER BY score * power(0.5, (:now - scored_at) / :half_life) DESC
+    LIMIT :size
+''')
+
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_power(dbapi_connection, connection_record):
+    # PostgreSQL has power(); SQLite only with its optional math functions
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('power', 2, math.pow)
+
+
+# ----------------------------------------------------------------#
+# Writing and ranking
+# ----------------------------------------------------------------#
+def write_views(hits, now, half_life, batch=500):
+    """Add ``{travel_id: hits}`` to travel_stats with one executemany per batch.
+
+    Rows go in travel_id order so workers flushing at the same time lock
+    them in the same order and cannot deadlock.
+    """
+    from travelbook import db
+
+    rows = [{'travel_id': travel_id, 'hits': count, 'now': now, 'half_life': half_life}
+            for travel_id, count in sorted(hits.items())]
+    for start in range(0, len(rows), batch):
+        db.session.execute(UPSERT, rows[start:start + batch])
+        db.session.commit()
+    return len(rows)
+
+
+def rank_travels(now, half_life, window, size):
+    """``[(travel_id, views)]`` with the highest decayed score right now.
+
+    Only travels viewed within ``window`` seconds are considered; older
+    scores have decayed to next to nothing.
+    """
+    from travelbook import db
+
+    return [tuple(row) for row in db.session.execute(
+        RANKING, {'since': now - window, 'now': now, 'half_life': half_life, 'size': size})]
+
+
+# ----------------------------------------------------------------#
+# Counter
+# ----------------------------------------------------------------#
+class ViewBuffer:
+    """Per-process hit counts and ranking for one app."""
+
+    def __init__(self, app):
+        self.app = app
+        self.hits = {}
+        self.ranking = None
+        self.ranked_at = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def add(self, travel_id):
+        self.ensure_running()
+        with self._lock:
+            self.hits[travel_id] = self.hits.get(travel_id, 0) + 1
+            full = len(self.hits) >= self.app.config['VIEW_FLUSH_MAX_KEYS']
+        if full:
+            self._wake.set()
+
+    def take(self):
+        with self._lock:
+            hits, self.hits = self.hits, {}
+        return hits
+
+    def flush(self):
+        hits = self.take()
+        if hits:
+            config = self.app.config
+            write_views(hits, time.time(), config['VIEW_SCORE_HALF_LIFE'],
+                        config['VIEW_FLUSH_BATCH'])
+
+    def refresh(self):
+        config = self.app.config
+        self.ranking = rank_travels(time.time(), config['VIEW_SCORE_HALF_LIFE'],
+                                    config['VIEW_RANK_WINDOW'], config['POPULAR_SIZE'])
+        self.ranked_at = time.monotonic()
+        from travelbook import page_cache
+        page_cache.invalidate('popular')
+
+    def ensure_running(self):
+        if self._pid != os.getpid():
+            self._start()
+
+    def stale(self):
+        return (self.ranking is None
+                or time.monotonic() - self.ranked_at >= self.app.config['VIEW_RANK_INTERVAL'])
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Forked workers start with an empty buffer and their own thread
+            self.hits = {}
+            self._pid = os.getpid()
+        if self.app.config['VIEW_FLUSH_INTERVAL']:
+            threading.Thread(target=self._run, name='view-counter', daemon=True).start()
+            atexit.register(self._flush_quietly)
+
+    def _run(self):
+        config = self.app.config
+        while True:
+            self._wake.wait(config['VIEW_FLUSH_INTERVAL'])
+            self._wake.clear()
+            self._flush_quietly()
+            if time.monotonic() - self.ranked_at >= config['VIEW_RANK_INTERVAL']:
+                with self.app.app_context():
+                    try:
+                        self.refresh()
+                    except Exception:
+                        self.app.logger.exception('Ranking popular travels failed')
+
+    def _flush_quietly(self):
+        from travelbook import db
+
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Flushing travel views failed')
+
+
+class ViewCounter:
+    """Travel view counts without a write per page view.
+
+    Views are added up in memory and written to ``travel_stats`` every
+    ``VIEW_FLUSH_INTERVAL`` seconds (sooner once ``VIEW_FLUSH_MAX_KEYS``
+    travels are pending) by a background thread, as batched upserts. Each
+    row keeps the total ``views`` and a ``score`` that halves every
+    ``VIEW_SCORE_HALF_LIFE`` seconds. The same thread re-ranks the top
+    ``POPULAR_SIZE`` travels every ``VIEW_RANK_INTERVAL`` seconds for
+    :meth:`popular`. Counts pending in a worker that is killed are lost.
+    ``VIEW_FLUSH_INTERVAL = 0`` disables the thread; call :meth:`flush` and
+    :meth:`refresh` instead.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('VIEW_FLUSH_INTERVAL', 10)
+        app.config.setdefault('VIEW_FLUSH_MAX_KEYS', 10000)
+        app.config.setdefault('VIEW_FLUSH_BATCH', 500)
+        app.config.setdefault('VIEW_SCORE_HALF_LIFE', 24 * 3600)
+        app.config.setdefault('VIEW_RANK_WINDOW', 7 * 24 * 3600)
+        app.config.setdefault('VIEW_RANK_INTERVAL', 60)
+        app.config.setdefault('POPULAR_SIZE', 30)
+        app.extensions['view_counter'] = ViewBuffer(app)
+
+    @property
+    def buffer(self):
+        return current_app.extensions['view_counter']
+
+    def counted(self, f):
+        """Count a view of ``travel_id`` whenever the view answers 200."""
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                try:
+                    self.buffer.add(int(kwargs['travel_id']))
+                except ValueError:
+                    pass
+            return response
+        return decorated_function
+
+    def flush(self):
+        self.buffer.flush()
+
+    def refresh(self):
+        self.buffer.refresh()
+
+    def ranked(self, f):
+        """Re-rank, if stale, before ``f`` and the page cache around it run.
+
+        Re-ranking invalidates the cached popular page, so doing it inside
+        the cached view would store the page under the old generation and
+        render it again on the next request.
+        """
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            self.popular()
+            return f(*args, **kwargs)
+        return decorated_function
+
+    def popular(self):
+        """``[(travel_id, views)]``, best first, at most ``VIEW_RANK_INTERVAL`` old.
+
+        Workers that only serve this page start the re-ranking thread too,
+        and re-rank inline if the thread has fallen behind.
+        """
+        buffer = self.buffer
+        buffer.ensure_running()
+        if buffer.stale():
+            buffer.refresh()
+        return buffer.ranking
@@ -0,0 +1,109 @@
+from functools import partial, wraps
+from flask import current_app, g, request
+from flask_sqlalchemy import get_debug_queries
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, load_only, defer
+from travelbook import db
+from travelbook.models import Guide, Travel
+from travelbook.responses import after_body
+
+
+# Only the guide columns the travel cards render
+GUIDE_CARD_COLUMNS = ('id', 'name', 'surname', 'image_file', 'image_key')
+
+
+# ----------------------------------------------------------------#
+# Query shapes for listings
+# ----------------------------------------------------------------#
+def feed_query():
+    """Travel cards (excerpt, not content) with their guide's card columns joined in."""
+    return Travel.query.options(
+        defer(Travel.content),
+        joinedload(Travel.guide).load_only(*GUIDE_CARD_COLUMNS))
+
+
+def guide_directory_query():
+    """Plain rows with just the directory card columns."""
+    return db.session.query(*[getattr(Guide, c) for c in GUIDE_CARD_COLUMNS])\
+        .filter(Guide.deleted_at.is_(None))
+
+
+def guide_summaries(guide_ids):
+    """``{guide_id: (travel_count, latest_travel_id, latest_travel_title)}``.
+
+    Counts and the newest travel id come from one GROUP BY over the given
+    guides only, joined back to travel for the title, in a single statement.
+    """
+    if not guide_ids:
+        return {}
+    stats = db.session.query(Travel.guide_id.label('guide_id'),
+                             func.count(Travel.id).label('travel_count'),
+                             func.max(Travel.id).label('latest_id'))\
+        .filter(Travel.guide_id.in_(guide_ids))\
+        .group_by(Travel.guide_id)\
+        .subquery()
+    rows = db.session.query(stats.c.guide_id, stats.c.travel_count, Travel.id, Travel.title)\
+        .join(Travel, Travel.id == stats.c.latest_id)
+    return {guide_id: (count, travel_id, title) for guide_id, count, travel_id, title in rows}
+
+
+def guide_travels_query(guide_id):
+    return Travel.query.filter_by(guide_id=guide_id).options(defer(Travel.content))
+
+
+def guide_profile_query():
+    return Guide.active().options(defer(Guide.password))
+
+
+def guide_trips_query(guide_id):
+    return Travel.query.filter_by(guide_id=guide_id)\
+        .options(load_only('id', 'title'))\
+        .order_by(Travel.id.desc())
+
+
+# ----------------------------------------------------------------#
+# Query budget
+# ----------------------------------------------------------------#
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Cap the number of SQL statements a view may issue.
+
+    Only checked while Flask-SQLAlchemy records queries (debug, testing or
+    ``SQLALCHEMY_RECORD_QUERIES``); see :func:`init_query_budget`. The
+    session's identity lookup on a cache miss is not counted.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return f(*args, **kwargs)
+        decorated_function.query_budget = limit
+        return decorated_function
+    return decorator
+
+
+def init_query_budget(app):
+    app.config.setdefault('QUERY_BUDGET', None)
+
+    @app.after_request
+    def check_query_budget(response):
+        view = current_app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', current_app.config['QUERY_BUDGET'])
+        if limit is not None:
+            # Streamed pages run most of their queries while the body is sent
+            after_body(response, partial(_check_budget, limit))
+        return response
+
+
+def _check_budget(limit, response):
+    queries = get_debug_queries()
+    issued = len(queries) - g.get('identity_queries', 0)
+    if issued > limit:
+        message = '{} issued {} queries (budget {}):\n{}'.format(
+            request.endpoint, issued, limit,
+            '\n'.join(q.statement for q in queries))
+        if current_app.testing:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
@@ -0,0 +1,188 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, has_app_context, request
+from werkzeug.exceptions import TooManyRequests
+from travelbook.metrics import Counter
+
+
+def parse_rate(rate):
+    """``'5/minute'`` -> ``(5, 60.0)``."""
+    count, _, period = rate.partition('/')
+    seconds = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}[period.strip()]
+    return int(count), float(seconds)
+
+
+def take(state, capacity, rate, now):
+    """Take one token from a bucket given as ``(tokens, updated)`` or None.
+
+    Returns ``(allowed, retry_after, new_state)``.
+    """
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return True, 0.0, (tokens - 1, now)
+    return False, (1 - tokens) / rate, (tokens, now)
+
+
+# ----------------------------------------------------------------#
+# Backends
+# ----------------------------------------------------------------#
+class LocalBuckets:
+    """Per-process buckets; least recently used keys are dropped past ``max_keys``."""
+
+    def __init__(self, max_keys=100000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, capacity, rate):
+        with self._lock:
+            allowed, retry_after, state = take(self._buckets.get(key), capacity, rate,
+                                               self.clock())
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBuckets:
+    """Buckets shared by every worker and host; needs the ``redis`` package."""
+
+    SCRIPT = '''
+    local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local allowed, retry_after = 0, (1 - tokens) / rate
+    if tokens >= 1 then
+        tokens, allowed, retry_after = tokens - 1, 1, 0
+    end
+    redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(retry_after)}
+    '''
+
+    def __init__(self, url, prefix='travelbook:rl:'):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.SCRIPT)
+        self.prefix = prefix
+
+    def hit(self, key, capacity, rate):
+        allowed, retry_after = self._take(keys=[self.prefix + key],
+                                          args=[capacity, rate, time.time()])
+        return bool(allowed), float(retry_after)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+class FakeSharedBuckets(LocalBuckets):
+    """Stand-in for :class:`RedisBuckets` in tests: wall clock, no eviction."""
+
+    def __init__(self, clock=time.time):
+        super().__init__(max_keys=float('inf'), clock=clock)
+
+
+# ----------------------------------------------------------------#
+# Limiter
+# ----------------------------------------------------------------#
+def client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def form_email():
+    """Submitted ``email``, from a form or a JSON object."""
+    email = request.form.get('email')
+    if email is None:
+        payload = request.get_json(silent=True)
+        email = payload.get('email') if isinstance(payload, dict) else None
+    if not isinstance(email, str):
+        return None
+    return email.strip().lower() or None
+
+
+class RateLimiter:
+    """Token-bucket limits for expensive endpoints.
+
+    A rule like ``'5/minute'`` allows bursts of 5 and refills one token every
+    12 seconds. Rules are named by scope and can be overridden with
+    ``RATELIMIT_<SCOPE>`` (e.g. ``RATELIMIT_LOGIN_EMAIL = '10/hour'``).
+    ``RATELIMIT_BACKEND`` is ``'local'``, ``'redis'`` (shared,
+    ``RATELIMIT_REDIS_URL``), ``'fake'`` or ``None`` to disable limiting;
+    ``RATELIMIT_ENABLED`` switches it off at runtime. Rejections are counted
+    per scope in ``app.extensions['rate_limit_rejected']`` and exported by
+    ``/metrics``.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_BACKEND', 'local')
+        app.config.setdefault('RATELIMIT_REDIS_URL', 'redis://localhost:6379/0')
+        backend = app.config['RATELIMIT_BACKEND']
+        if backend == 'local':
+            backend = LocalBuckets()
+        elif backend == 'redis':
+            backend = RedisBuckets(app.config['RATELIMIT_REDIS_URL'])
+        elif backend == 'fake':
+            backend = FakeSharedBuckets()
+        else:
+            backend = None
+        app.extensions['rate_limit_buckets'] = backend
+        app.extensions['rate_limit_rejected'] = {}
+        app.extensions['rate_limiter'] = self
+
+    @property
+    def backend(self):
+        if not has_app_context():
+            return None
+        return current_app.extensions.get('rate_limit_buckets')
+
+    def _rejected(self, scope):
+        rejected = current_app.extensions['rate_limit_rejected']
+        counter = rejected.get(scope)
+        if counter is None:
+            with self._lock:
+                counter = rejected.setdefault(scope, Counter())
+        counter.inc()
+
+    def limit(self, scope, rate, key=client_ip, methods=('POST',)):
+        """Reject with 429 and ``Retry-After`` once ``key()`` exceeds ``rate``.
+
+        ``key`` returning None skips the check (e.g. no email submitted).
+        Only ``methods`` are counted, so rendering a form stays free.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                backend = self.backend
+                if (backend is not None and current_app.config['RATELIMIT_ENABLED']
+                        and request.method in methods):
+                    value = key()
+                    if value is not None:
+                        rule = current_app.config.get('RATELIMIT_' + scope.upper(), rate)
+                        capacity, period = parse_rate(rule)
+                        allowed, retry_after = backend.hit(
+                            '{}:{}'.format(scope, value), capacity, capacity / period)
+                        if not allowed:
+                            self._rejected(scope)
+                            raise TooManyRequests(retry_after=max(1, math.ceil(retry_after)))
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
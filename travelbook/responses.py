@@ -0,0 +1,201 @@
+import weakref
+import zlib
+from flask import (before_render_template, current_app, g, get_flashed_messages, request,
+                   stream_with_context, template_rendered)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = ('text/html', 'text/css', 'text/plain', 'text/xml', 'application/json',
+                          'application/javascript', 'image/svg+xml')
+
+
+# ----------------------------------------------------------------#
+# Streamed templates
+# ----------------------------------------------------------------#
+def _generate(app, template, context, buffer_size):
+    before_render_template.send(app, template=template, context=context)
+    buffered, size, head_sent = [], 0, False
+    try:
+        for piece in template.generate(context):
+            buffered.append(piece)
+            size += len(piece)
+            # The first chunk goes out as soon as the head is complete, so the
+            # browser fetches CSS while the rest of the page renders
+            if size >= buffer_size or (not head_sent and '</head>' in piece):
+                head_sent = True
+                yield _chunk(buffered)
+                buffered, size = [], 0
+        if buffered:
+            yield _chunk(buffered)
+        template_rendered.send(app, template=template, context=context)
+    finally:
+        for callback, response in g.pop('stream_callbacks', ()):
+            response = response()
+            if response is not None:
+                callback(response)
+
+
+def _chunk(pieces):
+    chunk = ''.join(pieces).encode('utf-8')
+    g.stream_bytes = g.get('stream_bytes', 0) + len(chunk)
+    return chunk
+
+
+def stream_template(template_name, **context):
+    """Like ``render_template`` but sends the page in chunks as it renders.
+
+    Chunks are ``STREAM_BUFFER_SIZE`` bytes, apart from an early flush after
+    ``</head>``. Flashed messages are taken from the session up front: the
+    session cookie is written before the body, so popping them while
+    rendering would show them again on the next page.
+    """
+    app = current_app._get_current_object()
+    get_flashed_messages()
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    g.stream_callbacks = []
+    chunks = _generate(app, template, context, app.config['STREAM_BUFFER_SIZE'])
+    return app.response_class(stream_with_context(chunks), mimetype='text/html')
+
+
+def after_body(response, callback):
+    """Call ``callback(response)`` once the body has been generated.
+
+    For a streamed template that is after the last chunk (still inside the
+    request), since its queries and rendering only happen while it is sent;
+    for anything else it is right away. ``g.stream_bytes`` then holds the
+    streamed size, before compression. A HEAD request sends no body, so
+    the template never runs and the callback is not kept waiting for it.
+    """
+    pending = g.get('stream_callbacks')
+    if pending is not None and response.is_streamed and request.method != 'HEAD':
+        # A weak reference: g -> response -> body -> request context -> g
+        # would otherwise be a cycle left for the garbage collector
+        pending.append((callback, weakref.ref(response)))
+    else:
+        callback(response)
+
+
+# ----------------------------------------------------------------#
+# Compression
+# ----------------------------------------------------------------#
+class _Gzip:
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._z.compress(data)
+
+    def flush(self):
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._z.flush()
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._b = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._b.process(data)
+
+    def flush(self):
+        return self._b.flush()
+
+    def finish(self):
+        return self._b.finish()
+
+
+def _compress_stream(chunks, compressor, source):
+    try:
+        for chunk in chunks:
+            # Flush per chunk so each one reaches the client as it is rendered
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(source, 'close', None)
+        if close is not None:
+            close()
+
+
+def compressed(f):
+    """Let :class:`ResponseCompressor` compress the view's responses.
+
+    Only for pages without secrets (session or CSRF tokens) next to
+    reflected input: compressing those leaks the secret (BREACH).
+    """
+    f.compress = True
+    return f
+
+
+class ResponseCompressor:
+    """Compresses text responses with brotli or gzip per ``Accept-Encoding``.
+
+    Only views marked with :func:`compressed` are compressed; by default
+    that is the streamed listing pages. Brotli is preferred when the
+    ``brotli`` package is installed. Buffered
+    responses smaller than ``COMPRESS_MIN_SIZE`` bytes go out as they are.
+    Streamed responses are always compressed, chunk by chunk, since their
+    size isn't known up front. ``COMPRESS_LEVEL`` (gzip, 1-9) and
+    ``COMPRESS_BR_QUALITY`` (0-11) trade CPU for bytes; the defaults suit
+    on-the-fly compression. Files sent with ``send_file`` are left alone.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BR_QUALITY', 4)
+        app.config.setdefault('STREAM_BUFFER_SIZE', 8192)
+        app.after_request(self.compress)
+        app.extensions['response_compressor'] = self
+
+    def encoding(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def compressor(self, coding):
+        if coding == 'br':
+            return _Brotli(current_app.config['COMPRESS_BR_QUALITY'])
+        return _Gzip(current_app.config['COMPRESS_LEVEL'])
+
+    def compress(self, response):
+        view = current_app.view_functions.get(request.endpoint)
+        if (not current_app.config['COMPRESS_ENABLED']
+                or not getattr(view, 'compress', False)
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or response.direct_passthrough
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        coding = self.encoding()
+        if coding is None or request.method == 'HEAD':
+            return response
+        if response.is_streamed:
+            response.response = _compress_stream(response.iter_encoded(), self.compressor(coding),
+                                                 response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+                return response
+            compressor = self.compressor(coding)
+            response.set_data(compressor.compress(data) + compressor.finish())
+        response.headers['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,39 @@
+from flask import render_template, request, abort, jsonify, url_for, Blueprint
+from travelbook.search.utils import search_travels
+
+
+search = Blueprint('search', __name__)
+
+
+# Search page
+# ----------------------------------------------------------------#
+@search.route('/search')
+def search_page():
+    q = request.args.get('q', '').strip()
+    try:
+        results = search_travels(q, after=request.args.get('after'))
+    except Exception:
+        abort(404)
+    return render_template('search.html', results=results, q=q, title='Search')
+
+# Search API
+# ----------------------------------------------------------------#
+@search.route('/api/search')
+def search_api():
+    q = request.args.get('q', '').strip()
+    try:
+        results = search_travels(q, after=request.args.get('after'),
+                                 per_page=max(1, min(request.args.get('per_page', 10, type=int), 50)))
+    except ValueError:
+        return jsonify(error='Invalid cursor'), 400
+    return jsonify(
+        query=q,
+        results=[{
+            'id': hit.travel.id,
+            'title': hit.travel.title,
+            'guide_id': hit.travel.guide_id,
+            'rank': hit.rank,
+            'url': url_for('travels.show_travel', travel_id=hit.travel.id),
+            'highlight': str(hit.snippet),
+        } for hit in results.hits],
+        next_cursor=results.next_cursor)
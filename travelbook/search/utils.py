@@ -0,0 +1,143 @@
+import math
+import re
+from collections import namedtuple
+from markupsafe import Markup, escape
+from sqlalchemy import and_, cast, func, literal_column, or_
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from sqlalchemy.orm import undefer
+from travelbook import db
+from travelbook.models import Travel
+from travelbook.pagination import encode_cursor, decode_cursor
+from travelbook.queries import feed_query
+
+
+# Same expression as the GIN index created in migration 7c1d2e9a4b3f
+SEARCH_DOCUMENT = "to_tsvector('english', travel.title || ' ' || travel.content)"
+MAX_QUERY_LENGTH = 200
+
+SearchHit = namedtuple('SearchHit', 'travel rank title snippet')
+
+
+class SearchPage:
+    def __init__(self, hits, next_cursor=None):
+        self.hits = hits
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def search_terms(q):
+    return [term.lower() for term in re.findall(r'\w+', q[:MAX_QUERY_LENGTH])]
+
+
+# ----------------------------------------------------------------#
+# Ranking backends
+# ----------------------------------------------------------------#
+def _parse_cursor(after):
+    values = decode_cursor(after)
+    if len(values) != 2:
+        raise ValueError('Invalid cursor')
+    rank, travel_id = values
+    if type(rank) not in (int, float) or not math.isfinite(rank) or type(travel_id) is not int:
+        raise ValueError('Invalid cursor')
+    return float(rank), travel_id
+
+
+def _rank_postgresql(q, after, limit):
+    """Ranked (id, rank) rows from the GIN-indexed tsvector expression."""
+    document = literal_column(SEARCH_DOCUMENT)
+    tsquery = func.plainto_tsquery('english', q[:MAX_QUERY_LENGTH])
+    matches = db.session.query(
+        Travel.id.label('id'),
+        # float8, so the rank survives the round trip through the cursor
+        cast(func.ts_rank_cd(document, tsquery), DOUBLE_PRECISION).label('rank'))\
+        .filter(document.op('@@')(tsquery))\
+        .subquery()
+    query = db.session.query(matches.c.id, matches.c.rank)
+    if after:
+        last_rank, last_id = _parse_cursor(after)
+        query = query.filter(or_(
+            matches.c.rank < last_rank,
+            and_(matches.c.rank == last_rank, matches.c.id < last_id)))
+    rows = query.order_by(matches.c.rank.desc(), matches.c.id.desc()).limit(limit)
+    return [(row.id, row.rank) for row in rows]
+
+
+def _rank_python(terms, after, limit):
+    """Fallback for SQLite and other local databases: LIKE filter, ranked in Python."""
+    query = db.session.query(Travel.id, Travel.title, Travel.content)
+    for term in terms:
+        pattern = '%{}%'.format(term.replace('_', '\\_'))
+        query = query.filter(or_(Travel.title.ilike(pattern, escape='\\'),
+                                 Travel.content.ilike(pattern, escape='\\')))
+    ranked = []
+    for travel_id, title, content in query:
+        title, content = title.lower(), content.lower()
+        rank = float(sum(3 * title.count(term) + content.count(term) for term in terms))
+        ranked.append((rank, travel_id))
+    ranked.sort(reverse=True)
+    if after:
+        last = _parse_cursor(after)
+        ranked = [key for key in ranked if key < last]
+    return [(travel_id, rank) for rank, travel_id in ranked[:limit]]
+
+
+def search_travels(q, after=None, per_page=10):
+    """Return a :class:`SearchPage` of travels matching ``q``, best match first.
+
+    ``after`` is the previous page's ``next_cursor``; it encodes the last
+    (rank, id) seen so paging never needs an OFFSET.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return SearchPage([])
+    if db.engine.dialect.name == 'postgresql':
+        ranked = _rank_postgresql(q, after, per_page + 1)
+    else:
+        ranked = _rank_python(terms, after, per_page + 1)
+    has_next = len(ranked) > per_page
+    ranked = ranked[:per_page]
+    ids = [travel_id for travel_id, _ in ranked]
+    # Snippets need the content, which the feed query defers
+    query = feed_query().options(undefer(Travel.content)).filter(Travel.id.in_(ids))
+    travels = {travel.id: travel for travel in query} if ids else {}
+    hits = [SearchHit(travels[travel_id], rank,
+                      highlight(travels[travel_id].title, terms),
+                      snippet(travels[travel_id].content, terms))
+            for travel_id, rank in ranked if travel_id in travels]
+    next_cursor = encode_cursor([ranked[-1][1], ranked[-1][0]]) if has_next else None
+    return SearchPage(hits, next_cursor)
+
+
+# ----------------------------------------------------------------#
+# Highlighting
+# ----------------------------------------------------------------#
+def _terms_pattern(terms):
+    # PostgreSQL matches stemmed words, so highlight any word starting with the term
+    stems = [term[:-1] if len(term) > 3 and term.endswith('s') else term for term in terms]
+    return re.compile(r'\b(?:{})\w*'.format('|'.join(map(re.escape, stems))), re.IGNORECASE)
+
+
+def highlight(text, terms):
+    pattern = _terms_pattern(terms)
+    parts, pos = [], 0
+    for match in pattern.finditer(text):
+        parts.append(escape(text[pos:match.start()]))
+        parts.append(Markup('<mark>{}</mark>').format(match.group(0)))
+        pos = match.end()
+    parts.append(escape(text[pos:]))
+    return Markup('').join(parts)
+
+
+ELLIPSIS = Markup('&hellip;')
+
+
+def snippet(text, terms, width=200):
+    match = _terms_pattern(terms).search(text)
+    start = max(0, match.start() - width // 4) if match else 0
+    end = start + width
+    return Markup('{}{}{}').format(ELLIPSIS if start else '',
+                                   highlight(text[start:end], terms),
+                                   ELLIPSIS if end < len(text) else '')
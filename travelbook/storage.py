@@ -0,0 +1,351 @@
+import hashlib
+import hmac
+import io
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from flask import abort, current_app, request, send_file, send_from_directory, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from travelbook.cache import LRUCache
+
+
+CHUNK_SIZE = 64 * 1024
+# Room for the other fields of a form carrying an upload
+FORM_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised while an upload is read, as soon as it passes the size cap."""
+
+
+class CappedInput:
+    """A request body of unknown length that answers 413 once it passes ``limit`` bytes.
+
+    Werkzeug only enforces ``MAX_CONTENT_LENGTH`` against a Content-Length
+    header; chunked bodies (``wsgi.input_terminated``) would otherwise be
+    read, and spooled to disk by the form parser, whatever their size.
+    """
+
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self._limit = limit
+        self._read = 0
+
+    def _count(self, data):
+        self._read += len(data)
+        if self._read > self._limit:
+            raise RequestEntityTooLarge()
+        return data
+
+    def read(self, size=-1):
+        return self._count(self._stream.read(size))
+
+    def readline(self, size=-1):
+        return self._count(self._stream.readline(size))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def spool_upload(stream, max_size, directory=None):
+    """Copy an upload to a temporary file ``CHUNK_SIZE`` bytes at a time.
+
+    Nothing is decoded and at most one chunk is held in memory. Returns
+    ``(path, sha256 hexdigest, size)``; the caller removes the file.
+    """
+    h, size = hashlib.sha256(), 0
+    fd, path = tempfile.mkstemp(suffix='.upload', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge('Uploads can be at most {} KB.'.format(max_size // 1024))
+                h.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, h.hexdigest(), size
+
+
+# ----------------------------------------------------------------#
+# Backends
+# ----------------------------------------------------------------#
+class LocalStorage:
+    """Files in a directory on this node."""
+
+    # Whether the files only exist inside this process
+    in_process = False
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        path = safe_join(self.directory, name)
+        if path is None:
+            raise FileNotFoundError(name)
+        return path
+
+    def save(self, name, fileobj):
+        path = self.path(name)
+        with open(path + '.tmp', 'wb') as f:
+            shutil.copyfileobj(fileobj, f, CHUNK_SIZE)
+        os.replace(path + '.tmp', path)
+
+    def open(self, name):
+        return open(self.path(name), 'rb')
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix=''):
+        """``(name, modified)`` for every stored file starting with ``prefix``."""
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.startswith(prefix) \
+                        and not entry.name.endswith('.tmp'):
+                    yield entry.name, entry.stat().st_mtime
+
+    def url(self, name, expires=None):
+        # Served by the /media route
+        return None
+
+
+class S3Storage:
+    """A bucket on S3 or an S3-compatible service such as MinIO; needs ``boto3``.
+
+    The client is created lazily and left out when pickled, so the storage
+    can be handed to the picture process pool.
+    """
+
+    in_process = False
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None):
+        import boto3  # noqa: F401 - fail at startup rather than on the first upload
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self._client = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_client'] = None
+        return state
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url,
+                                        region_name=self.region)
+        return self._client
+
+    def save(self, name, fileobj):
+        # upload_fileobj sends large files as a multipart upload, part by part
+        self.client.upload_fileobj(fileobj, self.bucket, self.prefix + name, ExtraArgs={
+            'ContentType': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            'CacheControl': 'public, max-age=31536000, immutable',
+        })
+
+    def open(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + name)['Body']
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(name)
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + name)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + name)
+
+    def list(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get('Contents', ()):
+                yield item['Key'][len(self.prefix):], item['LastModified'].timestamp()
+
+    def url(self, name, expires=None):
+        key = self.prefix + name
+        if expires:
+            return self.client.generate_presigned_url(
+                'get_object', Params={'Bucket': self.bucket, 'Key': key}, ExpiresIn=expires)
+        return '{}/{}/{}'.format(self.client.meta.endpoint_url, self.bucket, key)
+
+
+class MemoryStorage:
+    """Stand-in for the other backends in tests.
+
+    Files only exist in this process, so work that writes them has to run
+    in a thread rather than a process pool.
+    """
+
+    in_process = True
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def save(self, name, fileobj):
+        data = fileobj.read()
+        with self._lock:
+            self._files[name] = (data, time.time())
+
+    def open(self, name):
+        with self._lock:
+            entry = self._files.get(name)
+        if entry is None:
+            raise FileNotFoundError(name)
+        return io.BytesIO(entry[0])
+
+    def exists(self, name):
+        return name in self._files
+
+    def delete(self, name):
+        with self._lock:
+            self._files.pop(name, None)
+
+    def list(self, prefix=''):
+        with self._lock:
+            items = [(name, modified) for name, (_, modified) in self._files.items()]
+        return [item for item in items if item[0].startswith(prefix)]
+
+    def url(self, name, expires=None):
+        return None
+
+
+# ----------------------------------------------------------------#
+# Extension
+# ----------------------------------------------------------------#
+class MediaStorage:
+    """Uploaded media, stored where every worker and node can reach it.
+
+    ``MEDIA_STORAGE`` is ``'local'`` (``MEDIA_ROOT``, by default
+    ``static/profile_pics``), ``'s3'`` (``MEDIA_S3_BUCKET``, with
+    ``MEDIA_S3_ENDPOINT_URL`` for MinIO and other S3-compatible services)
+    or ``'memory'`` (tests). Files are linked under ``MEDIA_URL`` when a CDN
+    fronts the storage, otherwise from the bucket or the ``/media`` route.
+    ``MEDIA_URL_EXPIRES`` makes those links signed and valid for that many
+    seconds; signed links are reused for half their lifetime so pages keep
+    stable URLs. Uploads are capped at ``UPLOAD_MAX_SIZE`` bytes and request
+    bodies at ``MAX_CONTENT_LENGTH``, by default that plus ``FORM_OVERHEAD``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MEDIA_STORAGE', 'local')
+        app.config.setdefault('MEDIA_ROOT', os.path.join(app.static_folder, 'profile_pics'))
+        app.config.setdefault('MEDIA_S3_BUCKET', None)
+        app.config.setdefault('MEDIA_S3_PREFIX', 'profile_pics/')
+        app.config.setdefault('MEDIA_S3_ENDPOINT_URL', None)
+        app.config.setdefault('MEDIA_S3_REGION', None)
+        app.config.setdefault('MEDIA_URL', None)
+        app.config.setdefault('MEDIA_URL_EXPIRES', None)
+        app.config.setdefault('MEDIA_MAX_AGE', 365 * 24 * 3600)
+        app.config.setdefault('UPLOAD_MAX_SIZE', 4 * 1024 * 1024)
+        # Request bodies as a whole: an upload plus the rest of its form. Flask's
+        # own default is None, so setdefault() would never apply.
+        if app.config.get('MAX_CONTENT_LENGTH') is None:
+            app.config['MAX_CONTENT_LENGTH'] = app.config['UPLOAD_MAX_SIZE'] + FORM_OVERHEAD
+        backend = app.config['MEDIA_STORAGE']
+        if backend == 'local':
+            backend = LocalStorage(app.config['MEDIA_ROOT'])
+        elif backend == 's3':
+            backend = S3Storage(app.config['MEDIA_S3_BUCKET'], app.config['MEDIA_S3_PREFIX'],
+                                app.config['MEDIA_S3_ENDPOINT_URL'], app.config['MEDIA_S3_REGION'])
+        elif backend == 'memory':
+            backend = MemoryStorage()
+        else:
+            raise ValueError("MEDIA_STORAGE must be 'local', 's3' or 'memory', not {!r}"
+                             .format(backend))
+        app.add_url_rule('/media/<path:name>', 'media', self.send_media)
+        # Ahead of other extensions' hooks, which may read the form
+        app.before_request_funcs.setdefault(None, []).insert(0, self.cap_request_body)
+        app.extensions['media_storage'] = backend
+        app.extensions['media_urls'] = LRUCache(max_entries=10000)
+
+    @property
+    def backend(self):
+        return current_app.extensions['media_storage']
+
+    def url(self, name):
+        config = current_app.config
+        if config['MEDIA_URL']:
+            return config['MEDIA_URL'].rstrip('/') + '/' + name
+        expires = config['MEDIA_URL_EXPIRES']
+        if not expires:
+            return self.backend.url(name) or url_for('media', name=name)
+        urls = current_app.extensions['media_urls']
+        url = urls.get(name)
+        if url is None:
+            url = self.backend.url(name, expires)
+            if url is None:
+                expires_at = int(time.time()) + expires
+                url = url_for('media', name=name, expires=expires_at,
+                              signature=self.signature(name, expires_at))
+            urls.set(name, url, timeout=expires // 2)
+        return url
+
+    def signature(self, name, expires_at):
+        key = current_app.config['SECRET_KEY']
+        if isinstance(key, str):
+            key = key.encode()
+        message = '{}:{}'.format(name, expires_at).encode()
+        return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+    def send_media(self, name):
+        config = current_app.config
+        cache_control = 'public, max-age={}, immutable'.format(config['MEDIA_MAX_AGE'])
+        if config['MEDIA_URL_EXPIRES']:
+            expires_at = request.args.get('expires', 0, type=int)
+            signature = request.args.get('signature', '')
+            if expires_at < time.time() or not hmac.compare_digest(
+                    signature, self.signature(name, expires_at)):
+                abort(403)
+            cache_control = 'private, max-age={}'.format(int(expires_at - time.time()))
+        backend = self.backend
+        try:
+            if isinstance(backend, LocalStorage):
+                response = send_from_directory(backend.directory, name, conditional=True)
+            else:
+                response = send_file(backend.open(name), add_etags=False,
+                                     mimetype=mimetypes.guess_type(name)[0])
+        except FileNotFoundError:
+            abort(404)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def cap_request_body(self):
+        """Hold bodies without a Content-Length to ``MAX_CONTENT_LENGTH`` as they are read.
+
+        Werkzeug checks the header itself when there is one.
+        """
+        limit = current_app.config['MAX_CONTENT_LENGTH']
+        environ = request.environ
+        if limit and request.content_length is None and environ.get('wsgi.input_terminated'):
+            environ['wsgi.input'] = CappedInput(environ['wsgi.input'], limit)
@@ -0,0 +1,227 @@
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import tuple_
+from travelbook import db
+from travelbook.models import Guide, Tag, Travel, travel_tag
+from travelbook.travels.tags import forget_facets, rebuild_counts
+from travelbook.travels.utils import summarize
+
+
+# In import order: travels reference guides, travel_tags both travels and tags.
+# Each table is exported in the order of its key columns.
+TABLES = {
+    # deleted_at keeps soft-deleted guides hidden until purged
+    'guides': (Guide.__table__, ('id', 'name', 'surname', 'phone', 'email', 'image_file',
+                                 'image_key', 'password', 'deleted_at'), ('id',)),
+    'travels': (Travel.__table__, ('id', 'title', 'content', 'excerpt', 'word_count',
+                                   'reading_time', 'guide_id'), ('id',)),
+    # travel_count is rebuilt from travel_tags on import
+    'tags': (Tag.__table__, ('id', 'name'), ('id',)),
+    'travel_tags': (travel_tag, ('travel_id', 'tag_id'), ('travel_id', 'tag_id')),
+}
+INTEGER_COLUMNS = {'id', 'word_count', 'reading_time', 'guide_id', 'travel_id', 'tag_id'}
+DATETIME_COLUMNS = {'deleted_at'}
+
+
+def table(name):
+    if name not in TABLES:
+        raise ValueError('Unknown table {!r}; expected one of {}'.format(name, ', '.join(TABLES)))
+    return TABLES[name]
+
+
+def file_format(path, fmt=None):
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError('Unknown format {!r}; expected csv or ndjson'.format(fmt))
+    return fmt
+
+
+# ----------------------------------------------------------------#
+# Checkpoints
+# ----------------------------------------------------------------#
+def checkpoint_path(path):
+    return path + '.checkpoint'
+
+
+def read_checkpoint(path):
+    try:
+        with open(checkpoint_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path, **state):
+    tmp = checkpoint_path(path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, checkpoint_path(path))
+
+
+def clear_checkpoint(path):
+    try:
+        os.remove(checkpoint_path(path))
+    except FileNotFoundError:
+        pass
+
+
+class Progress:
+    def __init__(self, label, done=0, stream=sys.stderr):
+        self.label = label
+        self.done = done
+        self.stream = stream
+        self.start = time.perf_counter()
+
+    def update(self, n):
+        self.done += n
+        elapsed = time.perf_counter() - self.start
+        self.stream.write('\r{}: {} rows ({:.0f}/s)'.format(
+            self.label, self.done, self.done / elapsed if elapsed else 0))
+        self.stream.flush()
+
+    def finish(self):
+        self.stream.write('\n')
+
+
+# ----------------------------------------------------------------#
+# Export
+# ----------------------------------------------------------------#
+def export_table(name, path, fmt=None, batch=1000, resume=False):
+    """Stream ``name`` to ``path`` ordered by its key, ``batch`` rows per fetch.
+
+    Rows are fetched with ``yield_per`` (a server-side cursor on
+    PostgreSQL), so memory use does not grow with the table. After every
+    batch the last key and file offset are checkpointed; ``resume``
+    truncates the file to the checkpoint and carries on after that key.
+    """
+    source, columns, key = table(name)
+    fmt = file_format(path, fmt)
+    state = read_checkpoint(path) if resume else None
+    progress = Progress('export ' + name, state['rows'] if state else 0)
+
+    f = open(path, 'r+' if state else 'w', newline='', encoding='utf-8')
+    with f:
+        if state:
+            f.seek(state['offset'])
+            f.truncate()
+        writer = csv.writer(f) if fmt == 'csv' else None
+        if writer is not None and not state:
+            writer.writerow(columns)
+        key_columns = [source.c[c] for c in key]
+        query = db.session.query(*[source.c[c] for c in columns])
+        if state:
+            # Checkpoints written before composite keys only have last_id
+            last_key = state.get('last_key') or [state['last_id']]
+            query = query.filter(tuple_(*key_columns) > tuple_(*last_key))
+        query = query.order_by(*key_columns).yield_per(batch)
+        pending = 0
+        for row in query:
+            row = [_to_text(v) for v in row]
+            record = dict(zip(columns, row))
+            if writer is not None:
+                writer.writerow(['' if v is None else v for v in row])
+            else:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            last_key = [record[c] for c in key]
+            pending += 1
+            if pending == batch:
+                f.flush()
+                progress.update(pending)
+                write_checkpoint(path, last_key=last_key, offset=f.tell(), rows=progress.done)
+                pending = 0
+        progress.update(pending)
+    progress.finish()
+    clear_checkpoint(path)
+    return progress.done
+
+
+# ----------------------------------------------------------------#
+# Import
+# ----------------------------------------------------------------#
+def read_records(path, fmt, source):
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for record in csv.DictReader(f):
+                yield {k: _from_csv(source.c[k], v) for k, v in record.items() if k in source.c}
+        else:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield {k: _from_text(k, v) for k, v in record.items()}
+
+
+def _to_text(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _from_text(column, value):
+    if value is not None and column in DATETIME_COLUMNS:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _from_csv(column, value):
+    # CSV writes NULL as an empty cell; a NOT NULL column's '' is a real empty string
+    if value == '' and column.nullable:
+        return None
+    if column.name in INTEGER_COLUMNS:
+        return int(value)
+    return _from_text(column.name, value)
+
+
+def import_table(name, path, fmt=None, batch=1000, resume=False):
+    """Insert the records in ``path`` into ``name`` with one executemany per batch.
+
+    Each batch is committed with a checkpoint of how many records are in;
+    ``resume`` skips that many and continues. Ids are kept, so travels
+    still point at their guides. Importing travel_tags recounts the tags.
+    """
+    source, columns, _ = table(name)
+    fmt = file_format(path, fmt)
+    state = read_checkpoint(path) if resume else None
+    skip = state['rows'] if state else 0
+    progress = Progress('import ' + name, skip)
+    statement = source.insert()
+
+    rows = []
+    for i, record in enumerate(read_records(path, fmt, source)):
+        if i < skip:
+            continue
+        row = {c: record.get(c) for c in columns}
+        if source is Travel.__table__ and row['excerpt'] is None:
+            row.update(summarize(row['content']))
+        rows.append(row)
+        if len(rows) == batch:
+            _insert_batch(statement, rows, path, progress)
+            rows = []
+    if rows:
+        _insert_batch(statement, rows, path, progress)
+    progress.finish()
+    if 'id' in source.c:
+        _reset_sequence(source.name)
+    if source is travel_tag:
+        rebuild_counts()
+        db.session.commit()
+        forget_facets()
+    clear_checkpoint(path)
+    return progress.done
+
+
+def _insert_batch(statement, rows, path, progress):
+    db.session.execute(statement, rows)
+    db.session.commit()
+    progress.update(len(rows))
+    write_checkpoint(path, rows=progress.done)
+
+
+def _reset_sequence(name):
+    # Explicit ids leave PostgreSQL's serial sequence behind the table
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+            "COALESCE((SELECT MAX(id) FROM \"{}\"), 1))".format(name), {'table': name})
+        db.session.commit()
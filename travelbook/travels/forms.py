@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, TextAreaField
-from wtforms.validators import DataRequired
+from wtforms.validators import DataRequired, ValidationError
+from travelbook.travels.tags import MAX_TAGS, TAG_MAX_LENGTH, parse_tags
 
 
 class TravelForm(FlaskForm):
@@ -10,4 +11,14 @@ class TravelForm(FlaskForm):
     content = TextAreaField(
         'Content',
         validators=[DataRequired()])
+    tags = StringField(
+        'Tags',
+        description='Destinations and themes, separated by commas')
     submit = SubmitField('Submit')
+
+    def validate_tags(self, tags):
+        names = parse_tags(tags.data or '')
+        if len(names) > MAX_TAGS:
+            raise ValidationError('At most {} tags, please.'.format(MAX_TAGS))
+        if any(len(name) > TAG_MAX_LENGTH for name in names):
+            raise ValidationError('Tags can be at most {} characters long.'.format(TAG_MAX_LENGTH))
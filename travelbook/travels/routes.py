@@ -1,16 +1,37 @@
 from flask import render_template, url_for, flash, request, redirect, abort, Blueprint
 from flask_login import login_user, current_user, login_required
-from travelbook import db
+from travelbook import db, page_cache, view_counter
 from travelbook.models import Travel
+from travelbook.database import read_replica
+from travelbook.queries import feed_query
+from travelbook.responses import compressed, stream_template
 from travelbook.travels.forms import TravelForm
+from travelbook.travels.tags import get_or_create_tags, parse_tags
 
 
 travels = Blueprint('travels', __name__)
 
 
+# Popular Travels
+# ----------------------------------------------------------------#
+@travels.route('/travels/popular')
+@compressed
+@view_counter.ranked
+@page_cache.cached('travels', 'popular')
+@read_replica
+def popular_travels():
+    ranking = view_counter.popular()
+    ids = [travel_id for travel_id, _ in ranking]
+    rows = {travel.id: travel for travel in feed_query().filter(Travel.id.in_(ids))} if ids else {}
+    travels = [(rows[travel_id], views) for travel_id, views in ranking if travel_id in rows]
+    return stream_template('popular.html', travels=travels, title='Popular trips')
+
 # Show Travel
 # ----------------------------------------------------------------#
 @travels.route('/travels/<travel_id>')
+@view_counter.counted
+@page_cache.cached('travels')
+@read_replica
 def show_travel(travel_id):
     travel = Travel.query.get_or_404(travel_id)
     title = 'Trip: ' + travel.title
@@ -26,6 +47,7 @@ def create_travel():
         travel = Travel(title = form.title.data,
                         content = form.content.data,
                         guide = current_user)
+        travel.tags = get_or_create_tags(parse_tags(form.tags.data or ''))
         try:
             travel.insert()
             flash('Trip ' + form.title.data  + ' was successfully created!', 'success')
@@ -46,6 +68,7 @@ def edit_travel(travel_id):
     if form.validate_on_submit():
         travel.title = form.title.data
         travel.content = form.content.data
+        travel.tags = get_or_create_tags(parse_tags(form.tags.data or ''))
         try:
             travel.update()
             flash('Your travel has been updated!', 'success')
@@ -55,6 +78,7 @@ def edit_travel(travel_id):
     elif request.method == 'GET':
         form.title.data = travel.title
         form.content.data = travel.content
+        form.tags.data = ', '.join(tag.name for tag in travel.tags)
     title = 'Trip ' + travel.title
 
     return render_template('travel.html', form=form, travel=travel,
@@ -70,4 +94,4 @@ def delete_travel(travel_id):
         flash('Deleted!', 'success')
     except:
         flash('There was a problem deleting that guide', 'danger')
-    return redirect(url_for('main.travels'))
+    return redirect(url_for('main.home'))
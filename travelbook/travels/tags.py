@@ -0,0 +1,128 @@
+import re
+from sqlalchemy import and_, exists, func, select
+from travelbook import db
+from travelbook.cache import app_cache
+
+TAG_MAX_LENGTH = 40
+MAX_TAGS = 10
+
+
+
+def parse_tags(values):
+    """``['Lithuania, old town', 'hiking']`` -> ``['lithuania', 'old town', 'hiking']``."""
+    if isinstance(values, str):
+        values = [values]
+    names = []
+    for value in values:
+        for name in value.split(','):
+            name = re.sub(r'\s+', ' ', name).strip().lower()
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def tags_by_name(names):
+    from travelbook.models import Tag
+
+    if not names:
+        return []
+    return Tag.query.filter(Tag.name.in_(names)).all()
+
+
+def get_or_create_tags(names):
+    """Tag rows for ``names`` in that order; new ones are added to the session."""
+    from travelbook.models import Tag
+
+    found = {tag.name: tag for tag in tags_by_name(names)}
+    return [found.get(name) or Tag(name=name) for name in names]
+
+
+# ----------------------------------------------------------------#
+# Facet counts
+# ----------------------------------------------------------------#
+def facet_cache():
+    return app_cache('tag_facets', max_entries=16)
+
+
+def forget_facets():
+    """Drop the cached facets; call after committing a change to the counts.
+
+    Clearing before the commit would let a request cache the old counts again.
+    """
+    facet_cache().clear()
+
+
+def adjust_counts(tags, delta):
+    """Add ``delta`` to each tag's travel_count in the current transaction.
+
+    The increment happens in SQL, so concurrent writers never lose counts.
+    Call :func:`forget_facets` once the transaction is committed.
+    """
+    from travelbook.models import Tag
+
+    ids = [tag.id for tag in tags if tag.id is not None]
+    if ids:
+        Tag.query.filter(Tag.id.in_(ids))\
+            .update({Tag.travel_count: Tag.travel_count + delta}, synchronize_session=False)
+
+
+def release_tags(travel_ids):
+    """Untag ``travel_ids`` (a list or a SELECT of ids) ahead of a set-based delete.
+
+    Decrements every affected count with one UPDATE and removes the links,
+    which SQLite would not cascade. Call :func:`forget_facets` after the commit.
+    """
+    from travelbook.models import Tag, travel_tag
+
+    links = travel_tag.c.travel_id.in_(travel_ids)
+    removed = select([func.count()]).where(and_(travel_tag.c.tag_id == Tag.id, links))\
+        .as_scalar()
+    Tag.query.filter(Tag.id.in_(select([travel_tag.c.tag_id]).where(links)))\
+        .update({Tag.travel_count: Tag.travel_count - removed}, synchronize_session=False)
+    db.session.execute(travel_tag.delete().where(links))
+
+
+def rebuild_counts():
+    """Recount every tag's travels from travel_tag, e.g. after an import."""
+    from travelbook.models import Tag, travel_tag
+
+    linked = select([func.count()]).where(travel_tag.c.tag_id == Tag.id).as_scalar()
+    Tag.query.update({Tag.travel_count: linked}, synchronize_session=False)
+
+
+def facet_counts(limit=20, timeout=30):
+    """``[(name, travel_count)]`` for the most used tags, read from the counts."""
+    from travelbook.models import Tag
+
+    facets = facet_cache().get(limit)
+    if facets is None:
+        facets = [tuple(row) for row in db.session.query(Tag.name, Tag.travel_count)
+                  .filter(Tag.travel_count > 0)
+                  .order_by(Tag.travel_count.desc(), Tag.name)
+                  .limit(limit)]
+        facet_cache().set(limit, facets, timeout=timeout)
+    return facets
+
+
+# ----------------------------------------------------------------#
+# Filtering
+# ----------------------------------------------------------------#
+def tagged(query, tags, match_all=True):
+    """Restrict a travel query to travels with all (or any) of ``tags``.
+
+    For "all", the join is driven by the tag with the fewest travels and the
+    others are checked per row, so the work is bounded by the rarest tag.
+    """
+    from travelbook.models import Travel, travel_tag
+
+    if not match_all:
+        return query.filter(Travel.id.in_(
+            select([travel_tag.c.travel_id]).where(travel_tag.c.tag_id.in_([t.id for t in tags]))))
+    driver, *others = sorted(tags, key=lambda tag: tag.travel_count)
+    query = query.join(travel_tag, and_(travel_tag.c.travel_id == Travel.id,
+                                        travel_tag.c.tag_id == driver.id))
+    for tag in others:
+        link = travel_tag.alias()
+        query = query.filter(exists().where(and_(link.c.travel_id == Travel.id,
+                                                 link.c.tag_id == tag.id)))
+    return query
@@ -0,0 +1,50 @@
+import math
+
+
+EXCERPT_LENGTH = 280
+WORDS_PER_MINUTE = 200
+
+
+# ----------------------------------------------------------------#
+# Summaries
+# ----------------------------------------------------------------#
+def summarize(content):
+    """Excerpt, word count and reading time (minutes) for a travel's content."""
+    words = content.split()
+    text = ' '.join(words)
+    if len(text) > EXCERPT_LENGTH:
+        cut = text.rfind(' ', 0, EXCERPT_LENGTH)
+        text = text[:cut if cut > 0 else EXCERPT_LENGTH].rstrip(',.;:') + '…'
+    return {
+        'excerpt': text,
+        'word_count': len(words),
+        'reading_time': max(1, math.ceil(len(words) / WORDS_PER_MINUTE)),
+    }
+
+
+def backfill_excerpts(batch=1000, force=False, progress=None):
+    """Fill excerpt/word_count/reading_time, walking travels by id in batches.
+
+    Only rows without an excerpt are touched unless ``force``. ``progress``
+    is called with the running total after each batch; returns the total.
+    """
+    from travelbook import db, page_cache
+    from travelbook.models import Travel
+
+    last_id, done = 0, 0
+    while True:
+        query = db.session.query(Travel.id, Travel.content).filter(Travel.id > last_id)
+        if not force:
+            query = query.filter(Travel.excerpt.is_(None))
+        rows = query.order_by(Travel.id).limit(batch).all()
+        if not rows:
+            break
+        db.session.bulk_update_mappings(
+            Travel, [dict(summarize(content), id=travel_id) for travel_id, content in rows])
+        db.session.commit()
+        last_id = rows[-1].id
+        done += len(rows)
+        if progress is not None:
+            progress(done)
+    page_cache.invalidate('travels', 'guides')
+    return done